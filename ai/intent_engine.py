@@ -0,0 +1,212 @@
+import re
+import threading
+from collections import OrderedDict, deque
+
+
+# Ключевые слова и регулярные выражения классификации запросов.
+# Порядок правил внутри группы - приоритет: побеждает первое совпавшее.
+# keywords - достаточно любого слова; all_of - нужно слово из каждого набора;
+# pattern - регулярное выражение, проверяется, только если найдена его
+# буквальная часть (якорь).
+
+RULES = [
+    # Шаблоны резервного генератора SQL
+    {'group': 'sql', 'name': 'top_products', 'all_of': (('топ', 'лучш'), ('товар', 'продукт', 'продаж'))},
+    {'group': 'sql', 'name': 'employees_by_department', 'all_of': (('сотрудник', 'работник'), ('отдел', 'департамент'))},
+    {'group': 'sql', 'name': 'sales_dynamics', 'all_of': (('динамик', 'трен'), ('продаж', 'выручк'))},
+    {'group': 'sql', 'name': 'revenue_by_project', 'all_of': (('выручк', 'доход', 'продаж'), ('проект',))},
+    {'group': 'sql', 'name': 'total_revenue', 'keywords': ('общая выручка', 'общий доход')},
+    {'group': 'sql', 'name': 'sales_last_year', 'all_of': (('последний год',), ('продаж', 'выручк'))},
+
+    # Специальные запросы SQLGenerator
+    {'group': 'special_sql', 'name': 'sales_dynamics', 'pattern': r'динамик[а-я]* продаж'},
+    {'group': 'special_sql', 'name': 'sales_dynamics', 'pattern': r'тренд[а-я]* продаж'},
+    {'group': 'special_sql', 'name': 'sales_dynamics', 'pattern': r'изменени[е-я]* продаж'},
+    {'group': 'special_sql', 'name': 'sales_dynamics', 'keywords': ('продажи за последний год', 'продажи за год')},
+    {'group': 'special_sql', 'name': 'monthly_sales', 'pattern': r'месячн[а-я]* продаж[а-я]*'},
+    {'group': 'special_sql', 'name': 'weekly_sales', 'pattern': r'еженедельн[а-я]* продаж[а-я]*'},
+    {'group': 'special_sql', 'name': 'daily_sales', 'pattern': r'дневн[а-я]* продаж[а-я]*'},
+    {'group': 'special_sql', 'name': 'monthly_sales', 'keywords': ('продажи по месяцам',)},
+    {'group': 'special_sql', 'name': 'weekly_sales', 'keywords': ('продажи по неделям',)},
+    {'group': 'special_sql', 'name': 'daily_sales', 'keywords': ('продажи по дням',)},
+    {'group': 'special_sql', 'name': 'sales_dynamics', 'keywords': ('график продаж', 'выручка за период')},
+
+    # Таблица для тестового ответа SQLGenerator
+    {'group': 'sample_table', 'name': 'projects', 'keywords': ('проект',)},
+    {'group': 'sample_table', 'name': 'employees', 'keywords': ('сотрудник',)},
+    {'group': 'sample_table', 'name': 'production', 'keywords': ('продаж',)},
+
+    # Тип визуализации
+    {'group': 'chart', 'name': 'bar', 'keywords': ('топ', 'топ-', 'первые', 'последние', 'лучшие', 'худшие', 'больше всего')},
+    {'group': 'chart', 'name': 'line', 'keywords': ('тренд', 'изменен', 'динамика', 'истори', 'времен', 'месяц', 'год', 'недел', 'день')},
+    {'group': 'chart', 'name': 'histogram', 'keywords': ('распределен', 'частота', 'сколько', 'количество', 'сколько всего')},
+    {'group': 'chart', 'name': 'pie', 'keywords': ('сравнен', 'процент', 'доля', 'соотношен', 'часть', 'какой процент')},
+    {'group': 'chart', 'name': 'scatter', 'keywords': ('корреляц', 'зависимос', 'связь', 'зависит')},
+    {'group': 'chart', 'name': 'table', 'keywords': ('таблица', 'список', 'перечень', 'все')},
+    {'group': 'chart', 'name': 'map', 'keywords': ('карта', 'гео', 'локац')},
+    # Для финансовых данных часто подходит столбчатая диаграмма
+    {'group': 'chart', 'name': 'bar', 'keywords': ('выручк', 'доход', 'прибыль', 'бюджет', 'зарплат', 'стоимость')},
+
+    # Тип текстового анализа
+    {'group': 'analysis', 'name': 'comparison', 'keywords': ('сравн', 'compare', 'сопостав', 'против')},
+    {'group': 'analysis', 'name': 'ranking', 'keywords': ('топ', 'лучш', 'первые', 'последние', 'ranking', 'рейтинг')},
+    {'group': 'analysis', 'name': 'aggregation', 'keywords': ('сколько', 'сумм', 'общ', 'всего', 'итог', 'total', 'sum')},
+    {'group': 'analysis', 'name': 'trend', 'keywords': ('тренд', 'динамик', 'изменен', 'рост', 'снижен', 'trend')},
+    {'group': 'analysis', 'name': 'distribution', 'keywords': ('распределен', 'частота', 'сколько всего', 'distribution')},
+]
+
+GROUPS = ('sql', 'special_sql', 'sample_table', 'chart', 'analysis')
+
+_REGEX_META = set('.^$*+?{}[]\\|()')
+
+
+def regex_anchor(pattern):
+    """Самый длинный буквальный фрагмент регулярного выражения без альтернатив"""
+    if '|' in pattern:
+        raise ValueError(f"Альтернативы в регулярном выражении не поддерживаются: {pattern}")
+    # Символ перед * или ? может отсутствовать в тексте - отбрасывается вместе с квантификатором
+    fragments = re.split(r'\[[^\]]*\][*+?]?|\\.|[^\\\[\]][*?]|\{[^}]*\}|[.^$+()]', pattern)
+    anchor = max(fragments, key=len)
+    if not anchor or any(char in _REGEX_META for char in anchor):
+        raise ValueError(f"Не удалось выделить буквальную часть регулярного выражения: {pattern}")
+    return anchor
+
+
+class KeywordAutomaton:
+    """Автомат Ахо-Корасик: все вхождения набора подстрок за один проход по тексту"""
+
+    def __init__(self, keywords):
+        self.keywords = list(keywords)
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [[]]
+        for index, keyword in enumerate(self.keywords):
+            state = 0
+            for char in keyword:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._output[state].append(index)
+
+        # Ссылки неудач обходом в ширину; выходы наследуются по ссылке неудачи
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def scan(self, text):
+        """Номера ключевых слов, входящих в текст"""
+        found = set()
+        goto, fail, output = self._goto, self._fail, self._output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class IntentEngine:
+    """Классификация запроса по всем группам правил за один проход.
+
+    Все ключевые слова и якоря регулярных выражений собраны в один автомат
+    Ахо-Корасик. После прохода проверяются только правила, чьи слова нашлись,
+    поэтому стоимость не зависит от общего числа правил. Результаты
+    последних запросов запоминаются: генератор SQL, визуализация и отчет
+    получают одну и ту же классификацию без повторного разбора.
+    """
+
+    def __init__(self, rules=RULES, cache_size=256):
+        self.rules = []
+        keyword_index = {}
+        # Ключевое слово -> правила, которые оно может включить
+        self._triggers = []
+
+        def keyword_id(keyword):
+            keyword = keyword.lower()
+            if keyword not in keyword_index:
+                keyword_index[keyword] = len(keyword_index)
+                self._triggers.append(set())
+            return keyword_index[keyword]
+
+        for order, rule in enumerate(rules):
+            if rule.get('pattern'):
+                conditions = ((keyword_id(regex_anchor(rule['pattern'])),),)
+                pattern = re.compile(rule['pattern'])
+            else:
+                sets = rule.get('all_of') or (rule.get('keywords', ()),)
+                conditions = tuple(tuple(keyword_id(word) for word in words) for words in sets)
+                pattern = None
+            compiled = {
+                'order': order,
+                'group': rule['group'],
+                'name': rule['name'],
+                'conditions': conditions,
+                'pattern': pattern,
+            }
+            self.rules.append(compiled)
+            for keyword in conditions[0]:
+                self._triggers[keyword].add(order)
+
+        self.groups = tuple(dict.fromkeys((*GROUPS, *(rule['group'] for rule in self.rules))))
+        self._automaton = KeywordAutomaton(keyword_index)
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def classify(self, query):
+        """Словарь группа -> имя намерения (None - ни одно правило не подошло)"""
+        text = (query or '').lower()
+        with self._lock:
+            if text in self._cache:
+                self._cache.move_to_end(text)
+                return dict(self._cache[text])
+
+        found = self._automaton.scan(text)
+        result = dict.fromkeys(self.groups)
+        best = {}
+        candidates = sorted({order for keyword in found for order in self._triggers[keyword]})
+        for order in candidates:
+            rule = self.rules[order]
+            if rule['group'] in best:
+                continue
+            if not all(any(keyword in found for keyword in words) for words in rule['conditions']):
+                continue
+            if rule['pattern'] is not None and not rule['pattern'].search(text):
+                continue
+            best[rule['group']] = order
+            result[rule['group']] = rule['name']
+
+        with self._lock:
+            self._cache[text] = result
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return dict(result)
+
+    def intent(self, query, group):
+        return self.classify(query).get(group)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_intent_engine():
+    """Общий движок намерений процесса (автомат строится один раз)"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = IntentEngine()
+    return _engine
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import httpx
+import openai
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class LLMUnavailable(Exception):
+    """Модель не ответила вовремя: нет свободного слота, истек таймаут или закончились попытки"""
+
+
+# Ошибки, после которых повтор имеет смысл: сеть, таймаут, 429 и 5xx
+_RETRYABLE = (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+
+
+class _Flight:
+    """Выполняющийся вызов модели, результат которого ждут одинаковые запросы"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class LLMClient:
+    """Клиент OpenAI-совместимого API для генерации SQL под нагрузкой.
+
+    - постоянный пул HTTP-соединений httpx (keep-alive) на весь процесс;
+    - жесткие таймауты на соединение и ответ и общий срок вызова с повторами;
+    - семафор одновременных вызовов: если слот не освободился за
+      queue_timeout, вызов сразу завершается LLMUnavailable, и поток
+      gunicorn не простаивает в ожидании модели;
+    - повторы с экспоненциальной задержкой и случайным разбросом;
+    - одинаковые промпты, отправленные одновременно, выполняются один раз;
+    - LRU-кэш ответов с временем жизни.
+    """
+
+    def __init__(self, api_url, api_key, model, timeout=20.0, connect_timeout=5.0, deadline=30.0,
+                 max_concurrency=4, queue_timeout=2.0, max_retries=2, backoff=0.5,
+                 pool_size=10, cache_size=256, cache_ttl=3600.0):
+        self.api_url = api_url
+        self.model = model
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+
+        self._http = httpx.Client(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+        # Повторы выполняет сам клиент - с учетом общего срока вызова
+        self.client = openai.OpenAI(base_url=api_url, api_key=api_key or 'none', http_client=self._http, max_retries=0)
+
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._cache = OrderedDict()
+        self._stats = {
+            'calls': 0, 'cache_hits': 0, 'deduplicated': 0, 'retries': 0,
+            'timeouts': 0, 'rejected': 0, 'failures': 0, 'in_flight': 0, 'last_latency_ms': 0.0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            api_url=os.getenv('OPENROUTER_API_URL', 'https://openrouter.ai/api/v1'),
+            api_key=os.getenv('OPENROUTER_API_KEY'),
+            model=os.getenv('MODEL_NAME', 'qwen/qwen3-vl-235b-a22b-instruct'),
+            timeout=float(os.getenv('LLM_TIMEOUT', '20')),
+            connect_timeout=float(os.getenv('LLM_CONNECT_TIMEOUT', '5')),
+            deadline=float(os.getenv('LLM_DEADLINE', '30')),
+            max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', '4')),
+            queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', '2')),
+            max_retries=int(os.getenv('LLM_MAX_RETRIES', '2')),
+            backoff=float(os.getenv('LLM_BACKOFF', '0.5')),
+            pool_size=int(os.getenv('LLM_POOL_SIZE', '10')),
+            cache_size=int(os.getenv('LLM_CACHE_SIZE', '256')),
+            cache_ttl=float(os.getenv('LLM_CACHE_TTL', '3600'))
+        )
+
+    def _count(self, name, delta=1):
+        with self._lock:
+            self._stats[name] += delta
+
+    def _key(self, messages, options):
+        payload = json.dumps([self.model, messages, options], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[1] > self.cache_ttl:
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            self._stats['cache_hits'] += 1
+            return entry[0]
+
+    def _store(self, key, text):
+        with self._lock:
+            self._cache[key] = (text, time.time())
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def forget(self, messages, temperature=0.0, max_tokens=800):
+        """Удаление ответа из кэша (например, SQL из ответа не выполнился)"""
+        key = self._key(messages, {'temperature': temperature, 'max_tokens': max_tokens})
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def complete(self, messages, temperature=0.0, max_tokens=800, use_cache=True):
+        """Текст ответа модели на список сообщений chat completions"""
+        options = {'temperature': temperature, 'max_tokens': max_tokens}
+        key = self._key(messages, options)
+        if use_cache:
+            text = self._cached(key)
+            if text is not None:
+                return text
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._stats['deduplicated'] += 1
+
+        if not leader:
+            # Тот же промпт уже отправлен - ждем его результат, а не занимаем слот
+            if not flight.done.wait(self.deadline + self.queue_timeout):
+                self._count('timeouts')
+                raise LLMUnavailable("Истекло время ожидания ответа модели")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._call(messages, options)
+            if use_cache:
+                self._store(key, flight.result)
+            return flight.result
+        except Exception as e:
+            flight.error = e if isinstance(e, LLMUnavailable) else LLMUnavailable(f"Ошибка вызова модели: {str(e)}")
+            raise flight.error
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _call(self, messages, options):
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            self._count('rejected')
+            raise LLMUnavailable(f"Заняты все слоты вызова модели ({self.max_concurrency})")
+        self._count('in_flight')
+        try:
+            deadline = time.time() + self.deadline
+            attempt = 0
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self._count('timeouts')
+                    raise LLMUnavailable(f"Модель не ответила за {self.deadline} с")
+                started = time.time()
+                self._count('calls')
+                try:
+                    response = self.client.chat.completions.create(
+                        model=self.model,
+                        messages=messages,
+                        timeout=min(self.timeout, remaining),
+                        **options
+                    )
+                    with self._lock:
+                        self._stats['last_latency_ms'] = round((time.time() - started) * 1000, 2)
+                    return response.choices[0].message.content or ''
+                except _RETRYABLE as e:
+                    if isinstance(e, openai.APITimeoutError):
+                        self._count('timeouts')
+                    if attempt >= self.max_retries:
+                        self._count('failures')
+                        raise LLMUnavailable(f"Модель недоступна после {attempt + 1} попыток: {str(e)}")
+                    # Экспоненциальная задержка с разбросом: повторы разных потоков не совпадают
+                    delay = self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5)
+                    if time.time() + delay >= deadline:
+                        self._count('failures')
+                        raise LLMUnavailable(f"Не осталось времени на повтор вызова модели: {str(e)}")
+                    attempt += 1
+                    self._count('retries')
+                    time.sleep(delay)
+                except openai.APIError as e:
+                    self._count('failures')
+                    raise LLMUnavailable(f"Модель вернула ошибку: {str(e)}")
+        finally:
+            self._count('in_flight', -1)
+            self._slots.release()
+
+    def close(self):
+        self._http.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'model': self.model,
+                'max_concurrency': self.max_concurrency,
+                'cache_entries': len(self._cache),
+                'in_flight_prompts': len(self._flights),
+            }
+
+
+if __name__ == '__main__':
+    # python -m ai.llm_client "вопрос" - проверочный вызов (OPENROUTER_API_URL может указывать на локальный сервер)
+    import sys
+
+    client = LLMClient.from_env()
+    prompt = ' '.join(sys.argv[1:]) or 'SELECT 1'
+    try:
+        print(client.complete([{'role': 'user', 'content': prompt}]))
+    except LLMUnavailable as e:
+        print(f"❌ {e}")
+    print(json.dumps(client.stats(), ensure_ascii=False, indent=2))
+    client.close()
@@ -0,0 +1,227 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from database.sql_shape import inline_params
+
+
+# Нормализация вопросов на русском языке: регистр, пунктуация, стемминг
+# (алгоритм Snowball для русского языка) и удаление служебных слов.
+# Предлоги и отрицания (по, за, без, не, кроме) меняют смысл вопроса - их не удаляем.
+
+STOP_WORDS = {
+    'покажи', 'покажите', 'показать', 'выведи', 'выведите', 'вывести', 'дай', 'дайте',
+    'отобрази', 'отобразите', 'найди', 'найдите', 'посчитай', 'посчитайте', 'скажи', 'скажите',
+    'мне', 'нам', 'пожалуйста', 'плиз', 'please', 'show', 'me',
+    'а', 'и', 'ли', 'же', 'бы', 'вот', 'ну', 'это', 'эти', 'этот', 'эта',
+    'какой', 'какая', 'какое', 'какие', 'каков', 'какова', 'каковы',
+    'данные', 'информацию', 'информация',
+}
+
+_WORD_RE = re.compile(r'[a-zа-я0-9]+')
+
+_VOWELS = set('аеиоуыэюя')
+
+_PERFECTIVE_GERUND = (('в', 'вши', 'вшись'), ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'))
+_ADJECTIVE = (
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем', 'им', 'ым', 'ом',
+    'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею',
+)
+_PARTICIPLE = (('ем', 'нн', 'вш', 'ющ', 'щ'), ('ивш', 'ывш', 'ующ'))
+_REFLEXIVE = ('ся', 'сь')
+_VERB = (
+    ('ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'ешь', 'нно'),
+    ('ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен',
+     'ило', 'ыло', 'ено', 'ят', 'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю'),
+)
+_NOUN = (
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии', 'и', 'ией', 'ей', 'ой', 'ий', 'й',
+    'иям', 'ям', 'ием', 'ем', 'ам', 'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия', 'ья', 'я',
+)
+_SUPERLATIVE = ('ейше', 'ейш')
+_DERIVATIONAL = ('ость', 'ост')
+
+
+def _regions(word):
+    """Начала областей RV и R2 алгоритма Snowball"""
+    rv = r1 = r2 = len(word)
+    for index, char in enumerate(word):
+        if char in _VOWELS:
+            rv = index + 1
+            break
+    for index in range(1, len(word)):
+        if word[index - 1] in _VOWELS and word[index] not in _VOWELS:
+            r1 = index + 1
+            break
+    for index in range(r1 + 1, len(word)):
+        if word[index - 1] in _VOWELS and word[index] not in _VOWELS:
+            r2 = index + 1
+            break
+    return rv, r2
+
+
+def _remove(word, start, endings, after=None):
+    """Отсечение самого длинного окончания в области [start:]; None - окончание не найдено.
+
+    after - буквы, одна из которых должна стоять перед окончанием (а/я для первых групп).
+    """
+    region = word[start:]
+    best = max((ending for ending in endings if region.endswith(ending)), key=len, default=None)
+    if best is None:
+        return None
+    stem = word[:-len(best)]
+    if after is not None and not (len(stem) > start and stem[-1] in after):
+        return None
+    return stem
+
+
+def _remove_grouped(word, start, groups):
+    """Окончания из двух групп: первая - только после а/я, вторая - без условия"""
+    first, second = groups
+    candidates = [ending for ending in first + second if word[start:].endswith(ending)]
+    if not candidates:
+        return None
+    best = max(candidates, key=len)
+    if best in second:
+        return word[:-len(best)]
+    return _remove(word, start, (best,), after='ая')
+
+
+def stem(word):
+    """Основа русского слова по алгоритму Snowball; прочие слова не меняются"""
+    word = word.replace('ё', 'е')
+    if not re.fullmatch(r'[а-я]+', word):
+        return word
+    rv, r2 = _regions(word)
+
+    # Шаг 1: деепричастие, иначе возвратная частица и прилагательное / глагол / существительное
+    result = _remove_grouped(word, rv, _PERFECTIVE_GERUND)
+    if result is None:
+        word = _remove(word, rv, _REFLEXIVE) or word
+        result = _remove(word, rv, _ADJECTIVE)
+        if result is not None:
+            result = _remove_grouped(result, rv, _PARTICIPLE) or result
+        else:
+            result = _remove_grouped(word, rv, _VERB)
+            if result is None:
+                result = _remove(word, rv, _NOUN)
+    if result is not None:
+        word = result
+
+    # Шаг 2: конечное и
+    if word[rv:].endswith('и'):
+        word = word[:-1]
+
+    # Шаг 3: словообразовательные суффиксы в R2
+    word = _remove(word, max(r2, rv), _DERIVATIONAL) or word
+
+    # Шаг 4: превосходная степень, двойное н, мягкий знак
+    word = _remove(word, rv, _SUPERLATIVE) or word
+    if word[rv:].endswith('нн'):
+        word = word[:-1]
+    elif word[rv:].endswith('ь'):
+        word = word[:-1]
+    return word
+
+
+def normalize_question(text):
+    """Нормализованный вопрос: основы значимых слов через пробел в исходном порядке"""
+    words = _WORD_RE.findall((text or '').lower().replace('ё', 'е'))
+    return ' '.join(stem(word) for word in words if word not in STOP_WORDS)
+
+
+class NLQueryCache:
+    """Кэш «вопрос -> SQL» перед генератором SQL.
+
+    Ключ - нормализованный вопрос и версия схемы: разные формулировки одного
+    вопроса («Топ-5 товаров», «покажи топ 5 товаров!») получают один SQL без
+    повторной генерации. Изменение схемы делает записи недействительными.
+    Остальные атрибуты и методы делегируются исходному генератору.
+    """
+
+    def __init__(self, generator, schema_version=None, max_entries=512, enabled=True):
+        self.generator = generator
+        self.schema_version = schema_version
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'forgotten': 0}
+
+    @classmethod
+    def from_env(cls, generator, schema_version=None):
+        return cls(
+            generator,
+            schema_version=schema_version,
+            max_entries=int(os.getenv('NL_CACHE_MAX_ENTRIES', '512')),
+            enabled=os.getenv('NL_CACHE_ENABLED', '1') != '0'
+        )
+
+    def __getattr__(self, name):
+        return getattr(self.generator, name)
+
+    def _version(self):
+        return self.schema_version() if callable(self.schema_version) else self.schema_version
+
+    def generate_sql(self, natural_language_query, schema_info):
+        """SQL из кэша по нормализованному вопросу или от генератора"""
+        if not hasattr(self.generator, 'generate_query'):
+            return self._cached(natural_language_query, schema_info, self.generator.generate_sql)
+        sql_query, params = self.generate_query(natural_language_query, schema_info)
+        return inline_params(sql_query, params)
+
+    def generate_query(self, natural_language_query, schema_info):
+        """SQL и параметры из кэша по нормализованному вопросу или от генератора"""
+        return self._cached(natural_language_query, schema_info, self.generator.generate_query)
+
+    def _cached(self, natural_language_query, schema_info, generate):
+        key = normalize_question(natural_language_query)
+        if not self.enabled or not key:
+            return generate(natural_language_query, schema_info)
+
+        version = self._version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['version'] == version:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+                print(f"⚡ SQL из кэша вопросов: «{key}»")
+                return entry['sql']
+            if entry is not None:
+                del self._entries[key]
+                self._stats['invalidations'] += 1
+            self._stats['misses'] += 1
+
+        sql_query = generate(natural_language_query, schema_info)
+        if sql_query:
+            with self._lock:
+                self._entries[key] = {'sql': sql_query, 'version': version}
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats['evictions'] += 1
+        return sql_query
+
+    def forget(self, natural_language_query):
+        """Удаление SQL вопроса из кэша (например, запрос не выполнился)"""
+        key = normalize_question(natural_language_query)
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._stats['forgotten'] += 1
+        # Генератор может хранить свой ответ (например, кэш ответов модели)
+        if hasattr(self.generator, 'forget'):
+            self.generator.forget(natural_language_query)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'entries': len(self._entries),
+                'hit_rate': round(self._stats['hits'] / lookups, 3) if lookups else 0.0,
+                'enabled': self.enabled,
+            }
@@ -0,0 +1,202 @@
+import re
+import threading
+
+from ai.nl_cache import normalize_question
+
+
+# Служебные таблицы приложения (rollup, версии данных, каталог архивов) в промпт не попадают
+INTERNAL_TABLE_RE = re.compile(r'_rollup_|^table_versions$|^production_partitions$|^sqlite_')
+
+# Русские названия таблиц: слова вопроса, по которым таблица нужна целиком
+TABLE_SYNONYMS = {
+    'employees': 'сотрудник сотрудники работник персонал кадры штат человек',
+    'projects': 'проект проекты',
+    'equipment': 'оборудование техника станок установка агрегат',
+    'production': 'продажа продажи производство продукция товар продукт выручка',
+    'safety_incidents': 'инцидент происшествие авария травма безопасность нарушение',
+    'finance': 'финансы транзакция платеж расход поступление',
+    'suppliers': 'поставщик поставщики поставка',
+    'customers': 'клиент заказчик покупатель',
+    'tasks': 'задача задачи поручение',
+    'locations': 'локация площадка объект филиал',
+    'maintenance_logs': 'обслуживание ремонт техобслуживание',
+    'energy_consumption': 'энергия энергопотребление электроэнергия электричество',
+}
+
+# Переводы частей имен столбцов (имя разбивается по _)
+COLUMN_SYNONYMS = {
+    'name': 'название имя наименование',
+    'first': 'имя',
+    'last': 'фамилия',
+    'department': 'отдел департамент подразделение',
+    'position': 'должность',
+    'salary': 'зарплата оклад',
+    'revenue': 'выручка доход',
+    'profit': 'прибыль',
+    'cost': 'стоимость затраты себестоимость расходы',
+    'date': 'дата период месяц год неделя день динамика тренд',
+    'quantity': 'количество объем',
+    'budget': 'бюджет',
+    'status': 'статус активный завершенный',
+    'severity': 'тяжесть серьезность',
+    'rating': 'рейтинг оценка',
+    'city': 'город',
+    'country': 'страна',
+    'priority': 'приоритет',
+    'performance': 'эффективность результативность',
+    'score': 'оценка балл',
+    'experience': 'опыт стаж',
+    'education': 'образование',
+    'category': 'категория',
+    'type': 'тип вид',
+    'amount': 'сумма',
+    'manufacturer': 'производитель',
+    'hours': 'часы',
+    'consumption': 'потребление',
+    'efficiency': 'эффективность',
+    'risk': 'риск',
+    'completion': 'выполнение готовность',
+    'price': 'цена',
+    'quality': 'качество',
+    'resolved': 'решен устранен',
+    'contract': 'контракт договор',
+    'currency': 'валюта',
+    'skills': 'навыки',
+    'hire': 'прием найм',
+    'line': 'линия',
+}
+
+# Примеры значений в дайджесте: только короткие и только для текста и дат (показывают формат)
+MAX_EXAMPLE_LENGTH = 24
+EXAMPLE_TYPES = ('TEXT', 'DATE', 'TIME', 'VARCHAR', 'DATETIME')
+
+
+class SchemaContext:
+    """Компактное описание схемы для промпта генерации SQL.
+
+    Для каждой версии схемы один раз строятся дайджесты таблиц и индекс
+    «основа слова -> таблица/столбец» по именам столбцов и их русским
+    переводам. Для вопроса выбираются только упомянутые таблицы: если
+    таблица названа явно - со всеми столбцами, если найдены только ее
+    столбцы - с ключами, связями и этими столбцами. Размер промпта
+    зависит от вопроса, а не от числа таблиц в базе.
+    """
+
+    def __init__(self, table_synonyms=TABLE_SYNONYMS, column_synonyms=COLUMN_SYNONYMS):
+        self.table_synonyms = table_synonyms
+        self.column_synonyms = column_synonyms
+        self._lock = threading.Lock()
+        self._schema = None
+        self._tables = {}
+        self._index = {}
+        self._stats = {'compiles': 0, 'prompts': 0, 'fallbacks': 0, 'tables_selected': 0, 'tables_total': 0}
+
+    def _stems(self, words):
+        return set(normalize_question(words).split())
+
+    def _add(self, key, table, column=None):
+        self._index.setdefault(key, set()).add((table, column))
+
+    def compile(self, schema_info):
+        """Дайджесты столбцов и индекс слов для версии схемы (повторно не строятся)"""
+        with self._lock:
+            if schema_info is self._schema:
+                return
+            self._tables = {}
+            self._index = {}
+            for table, info in (schema_info or {}).get('tables', {}).items():
+                if INTERNAL_TABLE_RE.search(table):
+                    continue
+                sample = (info.get('sample_data') or [{}])[0]
+                primary_keys = set(info.get('primary_keys') or [])
+                columns = {}
+                for column in info.get('columns', []):
+                    name = column['name']
+                    text = f"{name} {column.get('type') or ''}".strip()
+                    if name in primary_keys:
+                        text += ' PK'
+                    example = sample.get(name)
+                    if (str(column.get('type') or '').upper().startswith(EXAMPLE_TYPES)
+                            and isinstance(example, str) and 0 < len(example) <= MAX_EXAMPLE_LENGTH):
+                        text += f" ('{example}')"
+                    columns[name] = text
+                    for part in name.lower().split('_'):
+                        self._add(part, table, name)
+                        for key in self._stems(self.column_synonyms.get(part, '')):
+                            self._add(key, table, name)
+                self._tables[table] = {'columns': columns, 'primary_keys': primary_keys}
+                self._add(table.lower(), table)
+                for key in self._stems(self.table_synonyms.get(table, '')):
+                    self._add(key, table)
+            self._schema = schema_info
+            self._stats['compiles'] += 1
+
+    def select(self, question):
+        """Таблица -> набор нужных столбцов (None - все столбцы)
+
+        Названная таблица берется целиком. Таблица, у которой нашлись только
+        столбцы, берется, если ее слова достаточно редки: вес слова - доля
+        таблиц, в которых оно встречается («зарплата» указывает на одну
+        таблицу, «отдел» - на семь).
+        """
+        named = set()
+        scores = {}
+        columns = {}
+        for word in set(normalize_question(question).split()):
+            hits = self._index.get(word, ())
+            tables = {table for table, _ in hits}
+            for table, column in hits:
+                if column is None:
+                    named.add(table)
+                else:
+                    columns.setdefault(table, set()).add(column)
+            for table in tables:
+                scores[table] = scores.get(table, 0.0) + 1.0 / len(tables)
+        chosen = named | {table for table, score in scores.items() if score >= 1.0}
+        if not chosen and scores:
+            best = max(scores.values())
+            chosen = {table for table, score in scores.items() if score == best}
+        return {table: None if table in named else columns.get(table, set()) for table in chosen}
+
+    def prompt(self, question, schema_info):
+        """Текст схемы для промпта по вопросу"""
+        self.compile(schema_info)
+        selected = self.select(question)
+        with self._lock:
+            self._stats['prompts'] += 1
+            if not selected:
+                # Вопрос не упоминает ни одной таблицы - описываем всю схему
+                self._stats['fallbacks'] += 1
+                selected = dict.fromkeys(self._tables)
+            self._stats['tables_selected'] += len(selected)
+            self._stats['tables_total'] += len(self._tables)
+
+        lines = []
+        for table in sorted(selected):
+            info = self._tables[table]
+            columns = selected[table]
+            if columns is None:
+                names = list(info['columns'])
+            else:
+                # Ключи таблицы и ссылки на другие выбранные таблицы нужны для JOIN
+                keys = set(info['primary_keys'])
+                keys.update(
+                    name for name in info['columns']
+                    if name.endswith('_id') and any(other != table and name == self._key_of(other) for other in selected)
+                )
+                names = [name for name in info['columns'] if name in columns or name in keys]
+            lines.append(f"{table}({', '.join(info['columns'][name] for name in names)})")
+        return '\n'.join(lines)
+
+    def _key_of(self, table):
+        primary_keys = self._tables[table]['primary_keys']
+        return next(iter(primary_keys)) if len(primary_keys) == 1 else None
+
+    def stats(self):
+        with self._lock:
+            prompts = self._stats['prompts']
+            return {
+                **self._stats,
+                'tables': len(self._tables),
+                'avg_tables_per_prompt': round(self._stats['tables_selected'] / prompts, 2) if prompts else 0.0,
+            }
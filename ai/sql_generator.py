@@ -1,30 +1,35 @@
-import openai
 import os
 import json
 from dotenv import load_dotenv
 import re
-import sqlite3
+from database.connection import connect as connect_database
+from ai.intent_engine import get_intent_engine
+from ai.llm_client import LLMClient, LLMUnavailable
+from ai.schema_context import SchemaContext
+from database.sql_shape import inline_params
+from database.query_cache import is_read_query
 import pandas as pd
 from datetime import datetime, timedelta
 
 load_dotenv()
 
 class SQLGenerator:
-    def __init__(self):
+    def __init__(self, fallback=None):
         self.api_key = os.getenv('OPENROUTER_API_KEY')
         self.api_url = os.getenv('OPENROUTER_API_URL', 'https://openrouter.ai/api/v1')
         self.model = os.getenv('MODEL_NAME', 'qwen/qwen3-vl-235b-a22b-instruct')
         
-        # ⚠️ ПРОСТОЙ КЛИЕНТ БЕЗ ДОПОЛНИТЕЛЬНЫХ ПАРАМЕТРОВ
-        try:
-            self.client = openai.OpenAI(
-                base_url=self.api_url,
-                api_key=self.api_key
-            )
-            print("✅ OpenAI клиент инициализирован")
-        except Exception as e:
-            print(f"⚠️ Ошибка инициализации OpenAI: {e}")
-            self.client = None
+        # Шаблонный генератор на случай недоступности модели
+        self.fallback = fallback
+        
+        # Клиент модели: пул соединений, таймауты, лимит одновременных вызовов, кэш
+        self.llm = None
+        if self.api_key and os.getenv('LLM_ENABLED', '1') != '0':
+            try:
+                self.llm = LLMClient.from_env()
+                print(f"✅ LLM клиент инициализирован: {self.model}")
+            except Exception as e:
+                print(f"⚠️ Ошибка инициализации LLM клиента: {e}")
         
         # Получаем реальные таблицы из базы данных
         self.available_tables = self._get_available_tables()
@@ -34,27 +39,23 @@ class SQLGenerator:
         self.table_schemas = {}
         self._load_table_schemas()
         
-        # Паттерны для специальных запросов
-        self.special_patterns = {
-            r'динамик[а-я]* продаж': self._handle_sales_dynamics,
-            r'тренд[а-я]* продаж': self._handle_sales_dynamics,
-            r'изменени[е-я]* продаж': self._handle_sales_dynamics,
-            r'продажи за последний год': self._handle_sales_dynamics,
-            r'продажи за год': self._handle_sales_dynamics,
-            r'месячн[а-я]* продаж[а-я]*': self._handle_monthly_sales,
-            r'еженедельн[а-я]* продаж[а-я]*': self._handle_weekly_sales,
-            r'дневн[а-я]* продаж[а-я]*': self._handle_daily_sales,
-            r'продажи по месяцам': self._handle_monthly_sales,
-            r'продажи по неделям': self._handle_weekly_sales,
-            r'продажи по дням': self._handle_daily_sales,
-            r'график продаж': self._handle_sales_dynamics,
-            r'выручка за период': self._handle_sales_dynamics,
+        # Обработчики специальных запросов по намерениям группы special_sql
+        self.special_handlers = {
+            'sales_dynamics': self._handle_sales_dynamics,
+            'monthly_sales': self._handle_monthly_sales,
+            'weekly_sales': self._handle_weekly_sales,
+            'daily_sales': self._handle_daily_sales,
         }
+        self.intent_engine = get_intent_engine()
+        
+        # Схема для промпта: только таблицы и столбцы, относящиеся к вопросу
+        self.schema_context = SchemaContext()
+        self._schema_info = None
 
     def _get_available_tables(self):
         """Получение реальных таблиц из базы данных"""
         try:
-            conn = sqlite3.connect('rosatom_database.db')
+            conn = connect_database()
             cursor = conn.cursor()
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'")
             tables = [row[0] for row in cursor.fetchall()]
@@ -67,7 +68,7 @@ class SQLGenerator:
     def _load_table_schemas(self):
         """Загрузка схем всех таблиц"""
         try:
-            conn = sqlite3.connect('rosatom_database.db')
+            conn = connect_database()
             cursor = conn.cursor()
             
             for table in self.available_tables:
@@ -105,31 +106,80 @@ class SQLGenerator:
     
     def generate_sql(self, natural_language_query, schema_info):
         """Генерация SQL запроса на основе естественного языка"""
+        sql_query, params = self.generate_query(natural_language_query, schema_info)
+        return inline_params(sql_query, params)
+    
+    def generate_query(self, natural_language_query, schema_info):
+        """SQL запроса и его параметры (значения слотов шаблона; у SQL модели - None)"""
         
         print(f"\n{'='*60}")
         print(f"🤔 Анализ запроса: '{natural_language_query}'")
         
         query_lower = natural_language_query.lower()
+        intent = self.intent_engine.classify(natural_language_query)
         
-        # Проверяем специальные паттерны
-        for pattern, handler in self.special_patterns.items():
-            if re.search(pattern, query_lower):
-                print(f"🎯 Распознан специальный паттерн: {pattern}")
-                sql_query = handler(query_lower)
+        # Генерация моделью; при недоступности модели - шаблоны ниже
+        if self.llm is not None:
+            try:
+                sql_query = self._generate_with_llm(natural_language_query, schema_info)
                 if sql_query:
-                    print(f"📝 Сгенерирован специальный SQL")
+                    print(f"🤖 SQL сгенерирован моделью")
                     print(f"{'='*60}")
-                    return sql_query
+                    return sql_query, None
+                print("⚠️ Модель не вернула SELECT, используем шаблоны")
+            except LLMUnavailable as e:
+                print(f"⚠️ Модель недоступна, используем шаблоны: {e}")
+        
+        if self.fallback is not None:
+            return self.fallback.generate_query(natural_language_query, schema_info)
+        
+        # Проверяем специальные паттерны
+        handler = self.special_handlers.get(intent['special_sql'])
+        if handler:
+            print(f"🎯 Распознан специальный запрос: {intent['special_sql']}")
+            sql_query = handler(query_lower)
+            if sql_query:
+                print(f"📝 Сгенерирован специальный SQL")
+                print(f"{'='*60}")
+                return sql_query, None
         
         # Простые тестовые запросы
-        if "проект" in query_lower:
-            return "SELECT * FROM projects LIMIT 5;"
-        elif "сотрудник" in query_lower:
-            return "SELECT * FROM employees LIMIT 5;"
-        elif "продаж" in query_lower:
-            return "SELECT * FROM production LIMIT 5;"
+        if intent['sample_table']:
+            return f"SELECT * FROM {intent['sample_table']} LIMIT 5;", None
         else:
-            return "SELECT 'SQL генератор работает в тестовом режиме' as status;"
+            return "SELECT 'SQL генератор работает в тестовом режиме' as status;", None
+    
+    def _schema(self, schema_info=None):
+        """Схема из DatabaseManager или, если ее не передали, из PRAGMA table_info при старте"""
+        if schema_info and schema_info.get('tables'):
+            self._schema_info = schema_info
+        elif self._schema_info is None:
+            self._schema_info = {'tables': {table: {'columns': columns} for table, columns in self.table_schemas.items()}}
+        return self._schema_info
+    
+    def _messages(self, natural_language_query, schema_info=None):
+        schema_prompt = self.schema_context.prompt(natural_language_query, self._schema(schema_info))
+        return [
+            {'role': 'system', 'content': (
+                "Ты генерируешь SQL для SQLite по вопросу аналитика. Отвечай только одним "
+                "запросом SELECT без пояснений. Даты хранятся текстом в формате ГГГГ-ММ-ДД.\n"
+                f"Таблицы:\n{schema_prompt}"
+            )},
+            {'role': 'user', 'content': natural_language_query},
+        ]
+    
+    def _generate_with_llm(self, natural_language_query, schema_info=None):
+        """SQL от модели или None, если ответ не похож на запрос на чтение"""
+        text = self.llm.complete(self._messages(natural_language_query, schema_info))
+        # Модели часто оборачивают ответ в блок кода ```sql
+        match = re.search(r'```(?:sql)?\s*(.*?)```', text, re.DOTALL | re.IGNORECASE)
+        sql_query = (match.group(1) if match else text).strip().rstrip(';').strip()
+        return sql_query if is_read_query(sql_query) else None
+    
+    def forget(self, natural_language_query):
+        """Удаление ответа модели на вопрос из кэша клиента"""
+        if self.llm is not None:
+            self.llm.forget(self._messages(natural_language_query))
     
     def test_sql_query(self, sql_query):
         """Тестирование SQL запроса"""
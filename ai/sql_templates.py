@@ -0,0 +1,296 @@
+import re
+import threading
+import time
+
+from ai.nl_cache import normalize_question
+
+
+# Шаблоны SQL с параметрами-слотами. Необязательный слот добавляет свой
+# фрагмент условия только если найден в вопросе, значения всегда передаются
+# параметрами: текст запроса зависит лишь от набора найденных слотов, и
+# подготовленное выражение соединения (и кэш результатов) переиспользуется
+# для любых значений.
+#
+# Слоты:
+#   n          - число строк: «топ-5», «10 лучших», «первые 3»
+#   period     - год, месяц года или «последний год/квартал/месяц/N месяцев»
+#   department - отдел из справочника отделов
+#   product    - товар из справочника товаров
+#   project    - проект из справочника проектов
+
+TEMPLATES = {
+    'top_products': {
+        'sql': """
+            SELECT
+                product_name,
+                SUM(revenue) as total_revenue,
+                SUM(quantity) as total_quantity,
+                COUNT(*) as transactions
+            FROM production
+            WHERE revenue IS NOT NULL
+                AND revenue > 0{period}{department}{project}
+            GROUP BY product_name
+            ORDER BY total_revenue DESC
+            LIMIT :n
+        """,
+        'defaults': {'n': 5},
+    },
+    'employees_by_department': {
+        'sql': """
+            SELECT
+                department,
+                COUNT(*) as employee_count
+            FROM employees
+            WHERE department IS NOT NULL{department}
+            GROUP BY department
+            ORDER BY employee_count DESC
+        """,
+        'defaults': {},
+    },
+    'sales_dynamics': {
+        # Без периода - последние n месяцев, за которые есть данные
+        'sql': """
+            SELECT
+                substr(date, 1, 7) as month,
+                SUM(revenue) as total_revenue
+            FROM production
+            WHERE revenue IS NOT NULL
+                AND date IS NOT NULL
+                AND date LIKE '____-__-__'{period}{department}{product}{project}
+            GROUP BY substr(date, 1, 7)
+            ORDER BY month DESC
+            LIMIT :n
+        """,
+        'defaults': {'n': 12},
+    },
+    'revenue_by_project': {
+        'sql': """
+            SELECT
+                p.project_name,
+                COALESCE(SUM(pr.revenue), 0) as total_revenue,
+                p.budget,
+                p.status
+            FROM projects p
+            LEFT JOIN production pr ON p.project_id = pr.project_id{period}{product}
+            WHERE p.project_name IS NOT NULL{department}{project}
+            GROUP BY p.project_id, p.project_name, p.budget, p.status
+            ORDER BY total_revenue DESC
+            LIMIT :n
+        """,
+        'defaults': {'n': 10},
+        'columns': {'date': 'pr.date', 'department': 'p.department', 'product': 'pr.product_name', 'project': 'p.project_name'},
+        # Фильтры production относятся к условию LEFT JOIN, чтобы проекты без продаж остались в списке
+        'join_slots': ('period', 'product'),
+    },
+    'sales_last_year': {
+        # Последние n месяцев по наличию данных
+        'sql': """
+            SELECT
+                substr(date, 1, 7) as month,
+                SUM(revenue) as total_revenue,
+                COUNT(*) as transactions
+            FROM production
+            WHERE revenue IS NOT NULL
+                AND date IS NOT NULL{department}{product}{project}
+            GROUP BY substr(date, 1, 7)
+            ORDER BY month DESC
+            LIMIT :n
+        """,
+        'defaults': {'n': 12},
+    },
+    'total_revenue': {
+        'sql': """
+            SELECT
+                'Общая выручка' as metric,
+                SUM(revenue) as value,
+                'руб.' as unit
+            FROM production
+            WHERE revenue IS NOT NULL{period}{department}{product}{project}
+        """,
+        'defaults': {},
+    },
+}
+
+DEFAULT_COLUMNS = {'date': 'date', 'department': 'department', 'product': 'product_name', 'project': 'project_name'}
+
+# Проект задан в production через project_id
+_PROJECT_FILTER = "project_id IN (SELECT project_id FROM projects WHERE project_name = :project)"
+
+MAX_N = 100
+
+_MONTHS = {
+    'январ': 1, 'феврал': 2, 'март': 3, 'апрел': 4, 'ма': 5, 'июн': 6,
+    'июл': 7, 'август': 8, 'сентябр': 9, 'октябр': 10, 'ноябр': 11, 'декабр': 12,
+}
+_MONTH_RE = re.compile(r'\b(январ|феврал|март|апрел|ма[йяе]|июн|июл|август|сентябр|октябр|ноябр|декабр)[а-я]*\s+(\d{4})\b')
+_YEAR_RE = re.compile(r'\b(?:за|в|на)\s+(\d{4})(?:\s*(?:год|г\b))?')
+_RELATIVE_RE = re.compile(
+    r'\b(?:последн|прошл|минувш)[а-я]*\s+(?:(\d+)\s+)?(год|лет|квартал|месяц|недел|дн|день)[а-я]*'
+)
+_RELATIVE_UNITS = {'год': ('months', 12), 'лет': ('months', 12), 'квартал': ('months', 3), 'месяц': ('months', 1),
+                   'недел': ('days', 7), 'дн': ('days', 1), 'день': ('days', 1)}
+_N_RES = (
+    re.compile(r'\b(?:топ|top)[\s-]*(\d+)'),
+    re.compile(r'\b(\d+)\s+(?:сам[а-я]*\s+)?(?:лучш|крупн|перв|худш|прибыльн|доходн)'),
+    re.compile(r'\b(?:перв|лучш)[а-я]*\s+(\d+)'),
+)
+
+
+class SlotExtractor:
+    """Извлечение значений слотов из вопроса.
+
+    Отделы, товары и проекты сравниваются со справочниками из базы по
+    основам слов, поэтому «в отделе логистики» находит 'Логистика'.
+    Справочники загружает vocabulary_loader и обновляет раз в ttl секунд.
+    """
+
+    def __init__(self, vocabulary_loader=None, ttl=300.0):
+        self.vocabulary_loader = vocabulary_loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._vocabulary = {}
+        self._loaded_at = None
+
+    def _phrases(self):
+        with self._lock:
+            if self.vocabulary_loader is not None and (
+                self._loaded_at is None or time.time() - self._loaded_at > self.ttl
+            ):
+                try:
+                    vocabulary = self.vocabulary_loader()
+                except Exception as e:
+                    print(f"⚠️ Не удалось загрузить справочники слотов: {e}")
+                    vocabulary = None
+                if vocabulary is not None:
+                    # Длинные названия проверяются первыми: «Научные отчеты» раньше «Научные исследования»
+                    self._vocabulary = {
+                        slot: sorted(
+                            ((normalize_question(value), value) for value in values if value),
+                            key=lambda item: -len(item[0])
+                        )
+                        for slot, values in vocabulary.items()
+                    }
+                self._loaded_at = time.time()
+            return self._vocabulary
+
+    def extract(self, question):
+        """Словарь найденных слотов: n, period, department, product, project"""
+        text = (question or '').lower().replace('ё', 'е')
+        slots = {}
+
+        for pattern in _N_RES:
+            match = pattern.search(text)
+            if match:
+                slots['n'] = min(max(int(match.group(1)), 1), MAX_N)
+                break
+
+        period = self._period(text)
+        if period is not None:
+            slots['period'] = period
+
+        normalized = f" {normalize_question(question)} "
+        for slot, phrases in self._phrases().items():
+            for phrase, value in phrases:
+                if phrase and f" {phrase} " in normalized:
+                    slots[slot] = value
+                    break
+        return slots
+
+    def _period(self, text):
+        match = _MONTH_RE.search(text)
+        if match:
+            name = match.group(1)
+            # «май», «мая», «мае» - основа «ма»
+            month = _MONTHS.get(name) or _MONTHS[name[:-1]]
+            year = int(match.group(2))
+            end = (year + 1, 1) if month == 12 else (year, month + 1)
+            return {'kind': 'range', 'start': f"{year:04d}-{month:02d}-01", 'end': f"{end[0]:04d}-{end[1]:02d}-01"}
+        match = _YEAR_RE.search(text)
+        if match and 1900 < int(match.group(1)) < 2200:
+            year = int(match.group(1))
+            return {'kind': 'range', 'start': f"{year:04d}-01-01", 'end': f"{year + 1:04d}-01-01"}
+        match = _RELATIVE_RE.search(text)
+        if match:
+            unit, size = _RELATIVE_UNITS[match.group(2)]
+            count = int(match.group(1) or 1) * size
+            return {'kind': 'recent', 'offset': f"-{count} {unit}"}
+        return None
+
+
+class TemplateLibrary:
+    """Шаблоны SQL со слотами и кэш скомпилированных текстов запросов.
+
+    Текст компилируется один раз на пару (шаблон, набор найденных слотов),
+    значения слотов передаются именованными параметрами.
+    """
+
+    def __init__(self, extractor=None, templates=TEMPLATES):
+        self.extractor = extractor or SlotExtractor()
+        self.templates = templates
+        self._lock = threading.Lock()
+        self._compiled = {}
+        self._stats = {'rendered': 0, 'compiled': 0}
+
+    def _fragment(self, template, slot, value):
+        columns = {**DEFAULT_COLUMNS, **template.get('columns', {})}
+        if slot == 'period':
+            column = columns['date']
+            if value['kind'] == 'range':
+                return f"{column} >= :period_start AND {column} < :period_end"
+            # «Последний год» отсчитывается от последней даты в данных, а не от сегодняшнего дня
+            return f"{column} >= date((SELECT MAX(date) FROM production), :period_offset)"
+        if slot == 'project' and columns['project'] == 'project_name':
+            return _PROJECT_FILTER
+        return f"{columns[slot]} = :{slot}"
+
+    def compile(self, name, slots):
+        """Текст запроса для шаблона и набора слотов (кэшируется)"""
+        template = self.templates[name]
+        key = (name, tuple(sorted((slot, slots[slot]['kind'] if slot == 'period' else None) for slot in slots)))
+        with self._lock:
+            sql = self._compiled.get(key)
+            if sql is not None:
+                return sql
+        join_slots = template.get('join_slots', ())
+        parts = {}
+        for slot in ('period', 'department', 'product', 'project'):
+            if slot not in slots or '{' + slot + '}' not in template['sql']:
+                parts[slot] = ''
+                continue
+            fragment = self._fragment(template, slot, slots[slot])
+            parts[slot] = f" AND {fragment}" if slot in join_slots else f"\n                AND {fragment}"
+        sql = template['sql'].format(**parts)
+        with self._lock:
+            self._compiled[key] = sql
+            self._stats['compiled'] += 1
+        return sql
+
+    def render(self, intent, question):
+        """(SQL, параметры) для намерения или None, если шаблона нет"""
+        if intent not in self.templates:
+            return None
+        template = self.templates[intent]
+        found = self.extractor.extract(question)
+        slots = {slot: value for slot, value in found.items()
+                 if slot == 'n' or '{' + slot + '}' in template['sql']}
+        sql = self.compile(intent, {slot: value for slot, value in slots.items() if slot != 'n'})
+
+        params = {}
+        if ':n' in sql:
+            params['n'] = slots.get('n', template['defaults'].get('n'))
+        for slot, value in slots.items():
+            if slot == 'period':
+                if value['kind'] == 'range':
+                    params['period_start'], params['period_end'] = value['start'], value['end']
+                else:
+                    params['period_offset'] = value['offset']
+            elif slot != 'n':
+                params[slot] = value
+        with self._lock:
+            self._stats['rendered'] += 1
+        return sql, params
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'statements': len(self._compiled)}
+
@@ -1,6 +1,6 @@
 import os
 
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context
 
 from flask_cors import CORS
 
@@ -20,12 +20,41 @@ import traceback
 
 from database.manager import DatabaseManager
 
-#from ai.sql_generator import SQLGenerator
+from database.result_handles import ResultHandleExpired
+
+from database.query_guard import QueryBudgetExceeded, QueryPlanRejected
+
+from database.parallel import DashboardExecutor, WidgetQuery
+
+from database.rollups import RewritingCursor
+
+from database.query_cache import referenced_tables
+
+from database.date_keys import period_condition, period_filter
+
+from database.serialization import (
+    ARROW_FORMAT, ARROW_MIMETYPE, COLUMNS_FORMAT, UnsupportedFormatError, negotiate_format,
+    format_dataframe, format_rows, dataframe_to_columns, dataframe_to_arrow, rows_to_arrow
+)
+
+from ai.sql_generator import SQLGenerator
 
 from features.dashboard_viz import DashboardVisualizer
 
 from features.report_generator import ReportGenerator
 
+from features.http_cache import ConditionalResponses, mentioned_tables
+
+from features.cache_warmer import CacheWarmer
+
+from ai.intent_engine import get_intent_engine
+
+from ai.nl_cache import NLQueryCache
+
+from ai.sql_templates import SlotExtractor, TemplateLibrary
+
+from database.sql_shape import inline_params
+
 
 
 # Загрузка переменных окружения
@@ -42,114 +71,70 @@ CORS(app)
 
 
 
+def load_slot_vocabulary():
+    """Справочники для слотов шаблонов: отделы, товары и проекты из данных"""
+    values = {}
+    for slot, sql in (
+        ('department', "SELECT DISTINCT department FROM employees WHERE department IS NOT NULL"),
+        ('product', "SELECT DISTINCT product_name FROM production WHERE product_name IS NOT NULL"),
+        ('project', "SELECT DISTINCT project_name FROM projects WHERE project_name IS NOT NULL"),
+    ):
+        values[slot] = db_manager.execute_query(sql).iloc[:, 0].astype(str).tolist()
+    return values
+
 def create_fallback_sql_generator():
+
+    """Генератор SQL по шаблонам со слотами (без модели)"""
+
     class SimpleSQLGenerator:
-        def generate_sql(self, natural_language_query, schema_info):
-            query = natural_language_query.lower()
-            
-            # Топ-5 товаров - БЕЗ фильтра по дате!
-            if ('топ' in query or 'лучш' in query) and ('товар' in query or 'продукт' in query or 'продаж' in query):
-                return """
-                    SELECT 
-                        product_name,
-                        SUM(revenue) as total_revenue,
-                        SUM(quantity) as total_quantity,
-                        COUNT(*) as transactions
-                    FROM production 
-                    WHERE revenue IS NOT NULL
-                        AND revenue > 0
-                    GROUP BY product_name
-                    ORDER BY total_revenue DESC
-                    LIMIT 5
-                """
-            
-            # Сотрудники по отделам
-            elif ('сотрудник' in query or 'работник' in query) and ('отдел' in query or 'департамент' in query):
-                return """
-                    SELECT 
-                        department,
-                        COUNT(*) as employee_count
-                    FROM employees 
-                    WHERE department IS NOT NULL
-                    GROUP BY department
-                    ORDER BY employee_count DESC
-                """
-            
-            # Динамика продаж - УПРОЩЕННАЯ версия без date() функций
-            elif ('динамик' in query or 'трен' in query) and ('продаж' in query or 'выручк' in query):
-                return """
-                    -- Упрощенная версия: группировка по месяцам
-                    SELECT 
-                        substr(date, 1, 7) as month,  -- Берем только ГГГГ-ММ
-                        SUM(revenue) as total_revenue
-                    FROM production 
-                    WHERE revenue IS NOT NULL
-                        AND date IS NOT NULL
-                        AND date LIKE '____-__-__'  -- Проверяем формат даты
-                    GROUP BY substr(date, 1, 7)
-                    ORDER BY month DESC
-                    LIMIT 12  -- Последние 12 месяцев
-                """
-            
-            # Общая выручка по проектам
-            elif ('выручк' in query or 'доход' in query or 'продаж' in query) and ('проект' in query):
-                return """
-                    SELECT 
-                        p.project_name,
-                        COALESCE(SUM(pr.revenue), 0) as total_revenue,
-                        p.budget,
-                        p.status
-                    FROM projects p
-                    LEFT JOIN production pr ON p.project_id = pr.project_id
-                    WHERE p.project_name IS NOT NULL
-                    GROUP BY p.project_id, p.project_name, p.budget, p.status
-                    ORDER BY total_revenue DESC
-                    LIMIT 10
-                """
-            
-            # Общая выручка
-            elif 'общая выручка' in query or 'общий доход' in query:
-                return """
-                    SELECT 
-                        'Общая выручка' as metric,
-                        SUM(revenue) as value,
-                        'руб.' as unit
-                    FROM production 
-                    WHERE revenue IS NOT NULL
-                """
-            
-            # Динамика продаж за последний год (альтернатива)
-            elif 'последний год' in query and ('продаж' in query or 'выручк' in query):
-                return """
-                    -- Берем последние 12 месяцев по наличию данных
-                    SELECT 
-                        substr(date, 1, 7) as month,
-                        SUM(revenue) as total_revenue,
-                        COUNT(*) as transactions
-                    FROM production 
-                    WHERE revenue IS NOT NULL
-                        AND date IS NOT NULL
-                    GROUP BY substr(date, 1, 7)
-                    ORDER BY month DESC
-                    LIMIT 12
-                """
-            
+        def __init__(self):
+            self.templates = sql_templates
+
+        def generate_query(self, natural_language_query, schema_info):
+            """SQL шаблона и значения слотов (параметры запроса)"""
+            # Шаблон выбирается по намерению из общего движка классификации
+            intent = get_intent_engine().intent(natural_language_query, 'sql')
+            rendered = self.templates.render(intent, natural_language_query) if intent else None
+            if rendered is not None:
+                return rendered
+
             # Fallback - показываем примеры данных
-            else:
-                return """
-                    SELECT 'Примеры данных:' as info,
-                           (SELECT product_name FROM production WHERE revenue IS NOT NULL LIMIT 1) as sample_product,
-                           (SELECT SUM(revenue) FROM production WHERE revenue IS NOT NULL) as total_revenue_sample,
-                           (SELECT COUNT(*) FROM employees) as total_employees
-                """
-    
+            return """
+                SELECT 'Примеры данных:' as info,
+                       (SELECT product_name FROM production WHERE revenue IS NOT NULL LIMIT 1) as sample_product,
+                       (SELECT SUM(revenue) FROM production WHERE revenue IS NOT NULL) as total_revenue_sample,
+                       (SELECT COUNT(*) FROM employees) as total_employees
+            """, {}
+
+        def generate_sql(self, natural_language_query, schema_info):
+            sql_query, params = self.generate_query(natural_language_query, schema_info)
+            return inline_params(sql_query, params)
+
     return SimpleSQLGenerator()
 
+def create_sql_generator():
+    """Генератор на модели, если задан ключ API, иначе шаблонный"""
+    if os.getenv('OPENROUTER_API_KEY') and os.getenv('LLM_ENABLED', '1') != '0':
+        try:
+            return SQLGenerator(fallback=create_fallback_sql_generator())
+        except Exception as e:
+            print(f"⚠️ Генератор на модели недоступен, используем шаблоны: {e}")
+    return create_fallback_sql_generator()
+
 # Инициализация компонентов
 
 db_manager = DatabaseManager()
 
-sql_generator = create_fallback_sql_generator()
+dashboard_executor = DashboardExecutor.from_env(db_manager)
+
+# ETag / 304 для ответов, зависящих только от данных
+http_cache = ConditionalResponses.from_env(db_manager)
+
+# Шаблоны SQL со слотами: один текст запроса на набор слотов, значения - параметрами
+sql_templates = TemplateLibrary(SlotExtractor(load_slot_vocabulary))
+
+# Кэш «вопрос -> SQL»: переформулировки одного вопроса не генерируются заново
+sql_generator = NLQueryCache.from_env(create_sql_generator(), schema_version=db_manager.get_schema_version)
 
 
 visualizer = DashboardVisualizer()
@@ -266,120 +251,105 @@ def reports():
 
 
 
-@app.route('/api/chat', methods=['POST'])
-
-def chat_with_data():
+def answer_question(user_query):
+    """Ответ на вопрос без привязки к HTTP-запросу: SQL, данные, текстовый анализ и визуализация.
 
-    """Основной API эндпоинт для обработки запросов на естественном языке"""
+    Общий для /api/chat и прогрева кэша ответов. executed - SQL выполнен
+    без ошибок: запоминать можно только такие ответы.
+    """
+    # Один проход классификации: генератор SQL, визуализация и анализ берут результат из кэша движка
+    intents = get_intent_engine().classify(user_query)
+    print(f"🧭 Намерения: {', '.join(f'{group}={name}' for group, name in intents.items() if name) or 'не распознаны'}")
 
-    try:
+    
 
-        data = request.json
+    # Получаем схему базы данных
 
-        user_query = data.get('query', '').strip()
+    schema_info = db_manager.get_database_schema()
 
-        conversation_history = data.get('history', [])
+    print(f"📋 Схема БД: {len(schema_info.get('tables', {}))} таблиц")
 
-        
+    
 
-        if not user_query:
+    # Генерируем SQL запрос
 
-            return jsonify({
+    sql_query, sql_params = sql_generator.generate_query(user_query, schema_info)
 
-                'success': False,
+    print(f"📝 Сгенерирован SQL: {sql_query}")
+    if sql_params:
+        print(f"🧩 Параметры: {sql_params}")
 
-                'error': 'Запрос не может быть пустым'
+    
 
-            }), 400
+    # Выполняем SQL запрос
 
-        
+    auto_limit = None
 
-        print(f"\n{'='*60}")
+    try:
 
-        print(f"📨 Получен запрос: {user_query}")
+        sql_query = db_manager.optimize_query(sql_query).sql
 
-        print(f"{'='*60}")
+        plan = db_manager.check_query_plan(sql_query, sql_params)
 
-        
+        sql_query, auto_limit = plan.sql, plan.auto_limit
 
-        # Получаем схему базы данных
+        result_df = db_manager.execute_query(sql_query, sql_params)
 
-        schema_info = db_manager.get_database_schema()
+        print(f"✅ Получено данных: {len(result_df)} строк, {len(result_df.columns)} колонок")
 
-        print(f"📋 Схема БД: {len(schema_info.get('tables', {}))} таблиц")
+        executed = True
 
-        
+    except Exception as sql_error:
 
-        # Генерируем SQL запрос
+        print(f"❌ Ошибка выполнения SQL: {sql_error}")
 
-        sql_query = sql_generator.generate_sql(user_query, schema_info)
+        executed = False
 
-        print(f"📝 Сгенерирован SQL: {sql_query}")
+        # Неработающий SQL не должен возвращаться из кэша вопросов
+        sql_generator.forget(user_query)
 
         
 
-        # Выполняем SQL запрос
+        # Пробуем простой запрос как fallback
 
         try:
 
-            result_df = db_manager.execute_query(sql_query)
-
-            print(f"✅ Получено данных: {len(result_df)} строк, {len(result_df.columns)} колонок")
-
-        except Exception as sql_error:
+            print("🔄 Пробуем выполнить простой запрос...")
 
-            print(f"❌ Ошибка выполнения SQL: {sql_error}")
+            simple_sql = "SELECT 'Ошибка выполнения запроса' as error, ? as sql_query"
 
-            
-
-            # Пробуем простой запрос как fallback
-
-            try:
-
-                print("🔄 Пробуем выполнить простой запрос...")
+            result_df = db_manager.execute_query(simple_sql, (sql_query,))
 
-                simple_sql = "SELECT 'Ошибка выполнения запроса' as error, ? as sql_query"
+        except:
 
-                result_df = db_manager.execute_query(simple_sql, (sql_query,))
+            result_df = pd.DataFrame({'error': ['Ошибка выполнения запроса'], 'details': [str(sql_error)]})
 
-            except:
-
-                result_df = pd.DataFrame({'error': ['Ошибка выполнения запроса'], 'details': [str(sql_error)]})
-
-        
+    
 
-        # Преобразуем результат в удобный формат
+    # В ответе - SQL с подставленными значениями: его можно скопировать и выполнить отдельно
+    sql_query = inline_params(sql_query, sql_params)
 
-       # Преобразуем результат в удобный формат (с заменой NaN)
-        result_data = {
-            'sql_query': sql_query,
-            'data': json.loads(result_df.fillna('').to_json(orient='records')) if not result_df.empty else [],
-            'columns': list(result_df.columns) if not result_df.empty else [],
-            'row_count': len(result_df)
-        }
-        
+    # Генерируем текстовый анализ
 
-        # Генерируем текстовый анализ
+    print("🧠 Генерация текстового анализа...")
 
-        print("🧠 Генерация текстового анализа...")
-
-        try:
+    try:
 
-            text_analysis = report_generator.generate_text_analysis(result_df, user_query)
+        text_analysis = report_generator.generate_text_analysis(result_df, user_query)
 
-            print("✅ Анализ сгенерирован успешно")
+        print("✅ Анализ сгенерирован успешно")
 
-        except Exception as analysis_error:
+    except Exception as analysis_error:
 
-            print(f"❌ Ошибка генерации анализа: {analysis_error}")
+        print(f"❌ Ошибка генерации анализа: {analysis_error}")
 
-            traceback.print_exc()
+        traceback.print_exc()
 
-            
+        
 
-            # Fallback анализ
+        # Fallback анализ
 
-            text_analysis = f"""
+        text_analysis = f"""
 
 ## 📊 Результат запроса
 
@@ -423,76 +393,183 @@ def chat_with_data():
 
 """
 
-        
+    
 
-        # Определяем тип визуализации
+    # Определяем тип визуализации
 
-        visualization_type = visualizer.determine_visualization_type(user_query)
+    visualization_type = visualizer.determine_visualization_type(user_query)
 
-        print(f"🎨 Тип визуализации: {visualization_type}")
+    print(f"🎨 Тип визуализации: {visualization_type}")
 
-        
+    
 
-        # Генерируем визуализацию
+    # Генерируем визуализацию
 
-        visualization_json = None
+    visualization_json = None
 
-        if not result_df.empty and len(result_df) > 0:
+    if not result_df.empty and len(result_df) > 0:
+
+        try:
+
+            print("🎨 Создание визуализации...")
+
+            visualization_json = visualizer.create_visualization(
+
+                result_df, 
+
+                visualization_type,
+
+                user_query
+
+            )
+
+            
+
+            # Проверяем валидность JSON
+
+            if visualization_json:
+
+                json.loads(visualization_json)
+
+                print("✅ Визуализация создана успешно")
+
+        except Exception as viz_error:
+
+            print(f"❌ Ошибка создания визуализации: {viz_error}")
+
+            traceback.print_exc()
+
+            
+
+            # Пробуем создать простую таблицу
 
             try:
 
-                print("🎨 Создание визуализации...")
+                print("🔄 Пробуем создать таблицу...")
 
                 visualization_json = visualizer.create_visualization(
 
-                    result_df, 
+                    result_df,
 
-                    visualization_type,
+                    'table',
 
                     user_query
 
                 )
 
-                
+            except:
 
-                # Проверяем валидность JSON
+                visualization_json = None
 
-                if visualization_json:
+    
 
-                    json.loads(visualization_json)
+    return {
+        'sql_query': sql_query,
+        'result_df': result_df,
+        'text_analysis': text_analysis,
+        'visualization': visualization_json,
+        'tables': referenced_tables(sql_query),
+        'executed': executed,
+        # LIMIT, добавленный проверкой плана: клиент видит, что результат усечен
+        'auto_limit': auto_limit,
+    }
 
-                    print("✅ Визуализация создана успешно")
 
-            except Exception as viz_error:
+# Прогрев ответов на частые вопросы: после первого запроса к процессу и после изменений данных
+cache_warmer = CacheWarmer.from_env(answer_question, db_manager.get_data_version)
 
-                print(f"❌ Ошибка создания визуализации: {viz_error}")
 
-                traceback.print_exc()
+@app.before_request
+def start_cache_warmer():
+    """Запуск прогрева в процессе, который обслуживает запросы.
 
-                
+    При импорте app прогрев не запускается: ни родительский процесс
+    перезагрузчика Flask, ни скрипты, импортирующие app, не вызывают модель.
+    """
+    cache_warmer.start()
+
+
+@app.route('/api/chat', methods=['POST'])
+
+def chat_with_data():
+
+    """Основной API эндпоинт для обработки запросов на естественном языке"""
+
+    try:
+
+        data = request.json
+
+        user_query = data.get('query', '').strip()
+
+        conversation_history = data.get('history', [])
+
+        
+
+        if not user_query:
 
-                # Пробуем создать простую таблицу
+            return jsonify({
+
+                'success': False,
 
-                try:
+                'error': 'Запрос не может быть пустым'
+
+            }), 400
 
-                    print("🔄 Пробуем создать таблицу...")
+        
 
-                    visualization_json = visualizer.create_visualization(
+        try:
 
-                        result_df,
+            result_format = requested_result_format(data, allow_arrow=False)
 
-                        'table',
+        except UnsupportedFormatError as format_error:
 
-                        user_query
+            return jsonify({
 
-                    )
+                'success': False,
 
-                except:
+                'error': str(format_error)
 
-                    visualization_json = None
+            }), 406
 
         
 
+        print(f"\n{'='*60}")
+
+        print(f"📨 Получен запрос: {user_query}")
+
+        print(f"{'='*60}")
+
+        # Частые вопросы каталога отвечаются из прогретого кэша, остальные считаются сейчас
+        answer = cache_warmer.get(user_query) or answer_question(user_query)
+        sql_query = answer['sql_query']
+        result_df = answer['result_df']
+        text_analysis = answer['text_analysis']
+        visualization_json = answer['visualization']
+
+        # Преобразуем результат в удобный формат
+
+       # Преобразуем результат в удобный формат (с заменой NaN)
+        result_data = {
+            'sql_query': sql_query,
+            'data': [],
+            'columns': list(result_df.columns) if not result_df.empty else [],
+            'format': result_format,
+            'row_count': len(result_df),
+            'result_handle': None,
+            'has_more': False
+        }
+        
+        # Большие ответы отдаем постранично: первая страница и дескриптор
+        page_size = parse_page_size(data.get('page_size', CHAT_PAGE_SIZE))
+        if len(result_df) > page_size:
+            handle, rows, has_more = db_manager.open_frame_result(result_df, page_size)
+            result_data.update(format_rows(handle.columns, rows, result_format))
+            result_data['result_handle'] = handle.id if has_more else None
+            result_data['has_more'] = has_more
+        elif not result_df.empty:
+            result_data.update(format_dataframe(result_df, result_format))
+        
+
         # Формируем ответ
 
         response = {
@@ -507,8 +584,16 @@ def chat_with_data():
 
             'columns': result_data['columns'],
 
+            'format': result_data['format'],
+
             'row_count': result_data['row_count'],
 
+            'result_handle': result_data['result_handle'],
+
+            'has_more': result_data['has_more'],
+
+            'auto_limit': answer['auto_limit'],
+
             'text_analysis': text_analysis,
 
             'visualization': visualization_json,
@@ -648,7 +733,7 @@ def chat_with_data():
 
 
 @app.route('/api/schema', methods=['GET'])
-
+@http_cache.conditional('schema', extra=lambda: db_manager.get_schema_version())
 def get_schema():
 
     """Получение схемы базы данных"""
@@ -685,6 +770,68 @@ def get_schema():
 
 
 
+DANGEROUS_SQL_KEYWORDS = ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 'TRUNCATE']
+
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', '500'))
+
+CHAT_PAGE_SIZE = int(os.getenv('CHAT_PAGE_SIZE', '100'))
+
+MAX_PAGE_SIZE = 1000
+
+BATCH_MAX_QUERIES = int(os.getenv('BATCH_MAX_QUERIES', '20'))
+
+
+def parse_page_size(value, default=100):
+    """Размер страницы из запроса, ограниченный MAX_PAGE_SIZE"""
+    try:
+        return min(max(int(value), 1), MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return default
+
+
+def requested_result_format(data=None, allow_arrow=True):
+    """Формат результата из параметра format (query string или тело) и заголовка Accept"""
+    requested = request.args.get('format') or (data or {}).get('format')
+    return negotiate_format(requested, request.headers.get('Accept'), allow_arrow=allow_arrow)
+
+
+def widget_rows(df, result_format):
+    """Данные виджета дашборда: список записей или колонки с массивами"""
+    if result_format == COLUMNS_FORMAT:
+        return {'columns': [str(col) for col in df.columns], 'data': dataframe_to_columns(df)}
+    return df.to_dict('records')
+
+
+def arrow_response(payload, row_count, result_handle=None):
+    """Ответ в формате Arrow IPC stream"""
+    headers = {'X-Row-Count': str(row_count)}
+    if result_handle:
+        headers['X-Result-Handle'] = result_handle
+    return Response(payload, mimetype=ARROW_MIMETYPE, headers=headers)
+
+
+def find_dangerous_keyword(sql_query):
+    """Поиск запрещенной операции в SQL запросе"""
+    sql_upper = sql_query.upper()
+    for keyword in DANGEROUS_SQL_KEYWORDS:
+        if f' {keyword} ' in sql_upper or sql_upper.startswith(keyword):
+            return keyword
+    return None
+
+
+def query_guard_error(error, sql_query=None):
+    """Ответ на запрос, остановленный бюджетом выполнения или проверкой плана"""
+    print(f"⛔ Запрос остановлен: {error}")
+    return jsonify({
+        'success': False,
+        'error': str(error),
+        'budget': getattr(error, 'budget', 'query_plan'),
+        'sql_query': sql_query,
+        'timestamp': datetime.now().isoformat()
+    }), 422
+
+
+
 @app.route('/api/execute_sql', methods=['POST'])
 
 def execute_sql():
@@ -713,41 +860,84 @@ def execute_sql():
 
         # Проверка на потенциально опасные операции
 
-        dangerous_keywords = ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 'TRUNCATE']
+        keyword = find_dangerous_keyword(sql_query)
 
-        sql_upper = sql_query.upper()
+        if keyword:
 
-        
+            return jsonify({
 
-        for keyword in dangerous_keywords:
+                'success': False,
 
-            if f' {keyword} ' in sql_upper or sql_upper.startswith(keyword):
+                'error': f'Операция {keyword} не разрешена для безопасности данных'
 
-                return jsonify({
+            }), 403
 
-                    'success': False,
+        
+
+        result_format = requested_result_format(data)
+
+        
 
-                    'error': f'Операция {keyword} не разрешена для безопасности данных'
+        # Проверка плана: дорогие запросы отклоняются, полные сканирования получают LIMIT
+        plan = db_manager.check_query_plan(sql_query)
+        if plan.auto_limit:
+            print(f"⚠️ Полное сканирование {', '.join(plan.full_scans)}: добавлен LIMIT {plan.auto_limit}")
+        sql_query = plan.sql
 
-                }), 403
+        
+
+        # Постраничный режим: первая страница и дескриптор для продолжения
+        if data.get('page_size'):
+            handle, rows, has_more = db_manager.open_result(sql_query, page_size=parse_page_size(data['page_size']))
+            if result_format == ARROW_FORMAT:
+                return arrow_response(rows_to_arrow(handle.columns, rows), len(rows), handle.id if has_more else None)
+            return jsonify({
+                'success': True,
+                **format_rows(handle.columns, rows, result_format),
+                'row_count': len(rows),
+                'result_handle': handle.id if has_more else None,
+                'has_more': has_more,
+                'auto_limit': plan.auto_limit,
+                'sql_query': sql_query,
+                'timestamp': datetime.now().isoformat()
+            })
 
         
 
-        result_df = db_manager.execute_query(sql_query)
+        result_df = db_manager.execute_query(sql_query, use_cache=not data.get('no_cache', False))
 
         
 
+        if result_format == ARROW_FORMAT:
+            return arrow_response(dataframe_to_arrow(result_df), len(result_df))
+
         return jsonify({
         'success': True,
-        'data': json.loads(result_df.fillna('').to_json(orient='records')),
-        'columns': list(result_df.columns),
+        **format_dataframe(result_df, result_format),
         'row_count': len(result_df),
+        'auto_limit': plan.auto_limit,
         'sql_query': sql_query,
         'timestamp': datetime.now().isoformat()
         })
 
         
 
+    except UnsupportedFormatError as e:
+
+        return jsonify({
+
+            'success': False,
+
+            'error': str(e),
+
+            'timestamp': datetime.now().isoformat()
+
+        }), 406
+
+    except (QueryBudgetExceeded, QueryPlanRejected) as e:
+
+        return query_guard_error(e, sql_query)
+
     except Exception as e:
 
         print(f"Ошибка выполнения SQL: {e}")
@@ -766,6 +956,223 @@ def execute_sql():
 
 
 
+def batch_tables(data):
+    """Таблицы, от которых зависит пакет запросов"""
+    queries = data.get('queries')
+    if not isinstance(queries, dict):
+        return None
+    return mentioned_tables(
+        str(query.get('sql', '') if isinstance(query, dict) else query) for query in queries.values()
+    )
+
+
+@app.route('/api/execute_batch', methods=['POST'])
+@http_cache.conditional('data', tables=batch_tables)
+def execute_batch():
+    """Выполнение набора именованных SQL запросов одним запросом и в одном снимке данных"""
+    try:
+        data = request.json or {}
+        queries = data.get('queries') or {}
+        
+        if not isinstance(queries, dict) or not queries:
+            return jsonify({
+                'success': False,
+                'error': 'Набор запросов не может быть пустым'
+            }), 400
+        
+        if len(queries) > BATCH_MAX_QUERIES:
+            return jsonify({
+                'success': False,
+                'error': f'Слишком много запросов в пакете (максимум {BATCH_MAX_QUERIES})'
+            }), 400
+        
+        result_format = requested_result_format(data, allow_arrow=False)
+        
+        # Запрос задается строкой SQL или объектом {sql, params}
+        results = {}
+        batch = {}
+        for name, query in queries.items():
+            sql_query = (query.get('sql', '') if isinstance(query, dict) else str(query)).strip()
+            params = query.get('params') if isinstance(query, dict) else None
+            keyword = find_dangerous_keyword(sql_query) if sql_query else None
+            if not sql_query:
+                results[name] = {'success': False, 'error': 'SQL запрос не может быть пустым'}
+            elif keyword:
+                results[name] = {'success': False, 'error': f'Операция {keyword} не разрешена для безопасности данных'}
+            else:
+                batch[name] = (sql_query, params)
+        
+        for name, result in db_manager.execute_batch(batch).items():
+            error = result['error']
+            if error is not None:
+                print(f"❌ Ошибка запроса {name} в пакете: {error}")
+                results[name] = {
+                    'success': False,
+                    'error': str(error),
+                    'budget': getattr(error, 'budget', 'query_plan' if isinstance(error, QueryPlanRejected) else None)
+                }
+                continue
+            df = result['df']
+            results[name] = {
+                'success': True,
+                **format_dataframe(df, result_format),
+                'row_count': len(df),
+                'auto_limit': result['auto_limit']
+            }
+        
+        partial = any(not result['success'] for result in results.values())
+        if partial:
+            # Ошибка бюджета может не повториться - частичный ответ не кэшируется клиентом
+            http_cache.skip()
+        
+        return jsonify({
+            'success': True,
+            'results': results,
+            'partial': partial,
+            'timestamp': datetime.now().isoformat()
+        })
+        
+    except UnsupportedFormatError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 406
+    except Exception as e:
+        print(f"Ошибка пакетного выполнения SQL: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+
+@app.route('/api/results/<handle_id>', methods=['GET'])
+def get_result_page(handle_id):
+    """Следующая страница открытого результата запроса"""
+    try:
+        page_size = parse_page_size(request.args.get('page_size', CHAT_PAGE_SIZE))
+        result_format = requested_result_format()
+        handle, rows, has_more = db_manager.fetch_result(handle_id, page_size)
+        if result_format == ARROW_FORMAT:
+            return arrow_response(rows_to_arrow(handle.columns, rows), len(rows), handle.id if has_more else None)
+        return jsonify({
+            'success': True,
+            **format_rows(handle.columns, rows, result_format),
+            'row_count': len(rows),
+            'offset': handle.offset,
+            'total_rows': handle.total_rows,
+            'result_handle': handle.id if has_more else None,
+            'has_more': has_more,
+            'timestamp': datetime.now().isoformat()
+        })
+    except ResultHandleExpired as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 404
+    except UnsupportedFormatError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 406
+    except Exception as e:
+        print(f"Ошибка получения страницы результата: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.now().isoformat()
+        }), 500
+
+
+@app.route('/api/results/<handle_id>', methods=['DELETE'])
+def close_result(handle_id):
+    """Закрытие открытого результата до истечения TTL"""
+    return jsonify({
+        'success': db_manager.result_handles.close(handle_id),
+        'timestamp': datetime.now().isoformat()
+    })
+
+
+def _ndjson_line(payload):
+    """Одна строка NDJSON"""
+    return json.dumps(payload, ensure_ascii=False, default=_json_default) + '\n'
+
+
+def _json_default(obj):
+    """Сериализация значений SQLite, которые не поддерживает json"""
+    if isinstance(obj, bytes):
+        return obj.decode('utf-8', errors='ignore')
+    return str(obj)
+
+
+
+@app.route('/api/execute_sql/stream', methods=['POST'])
+def execute_sql_stream():
+    """Потоковое выполнение SQL запроса с ответом в формате NDJSON"""
+    try:
+        data = request.json
+        sql_query = data.get('sql', '').strip()
+        chunk_size = min(max(int(data.get('chunk_size', STREAM_CHUNK_SIZE)), 1), 10000)
+        
+        if not sql_query:
+            return jsonify({
+                'success': False,
+                'error': 'SQL запрос не может быть пустым'
+            }), 400
+        
+        keyword = find_dangerous_keyword(sql_query)
+        if keyword:
+            return jsonify({
+                'success': False,
+                'error': f'Операция {keyword} не разрешена для безопасности данных'
+            }), 403
+        
+        # Потоковая выдача рассчитана на большие результаты: LIMIT не добавляем,
+        # но запросы с недопустимым планом отклоняем
+        db_manager.check_query_plan(sql_query)
+        
+        # Первую порцию получаем сразу, чтобы ошибки SQL вернулись обычным ответом
+        chunks = db_manager.iter_query(sql_query, chunk_size=chunk_size)
+        columns, first_rows = next(chunks)
+        
+    except (QueryBudgetExceeded, QueryPlanRejected) as e:
+        return query_guard_error(e, sql_query)
+    except Exception as e:
+        print(f"Ошибка выполнения SQL: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'sql_query': sql_query if 'sql_query' in locals() else None,
+            'timestamp': datetime.now().isoformat()
+        }), 500
+    
+    def generate():
+        # Каждая строка ответа - отдельный JSON объект: колонки, порции строк, итог
+        yield _ndjson_line({'type': 'columns', 'columns': columns, 'sql_query': sql_query})
+        row_count = 0
+        try:
+            if first_rows:
+                row_count += len(first_rows)
+                yield _ndjson_line({'type': 'rows', 'rows': first_rows})
+            for _, rows in chunks:
+                row_count += len(rows)
+                yield _ndjson_line({'type': 'rows', 'rows': rows})
+        except Exception as e:
+            print(f"Ошибка потоковой выдачи SQL: {e}")
+            yield _ndjson_line({'type': 'error', 'error': str(e)})
+        finally:
+            chunks.close()
+        yield _ndjson_line({'type': 'end', 'row_count': row_count, 'timestamp': datetime.now().isoformat()})
+    
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # Соединение возвращается в пул, даже если клиент не дочитал ответ
+    response.call_on_close(chunks.close)
+    return response
+
+
 @app.route('/api/visualize', methods=['POST'])
 
 def visualize_data():
@@ -853,6 +1260,7 @@ def visualize_data():
 
 
 @app.route('/api/generate_report', methods=['POST'])
+@http_cache.conditional('report')
 def generate_report():
     """Генерация отчета с реальными данными"""
     try:
@@ -881,10 +1289,14 @@ def generate_report():
 def generate_real_report(report_type, filters):
     """Генерация отчета с реальными данными из БД с учетом фильтров"""
     
-    # Получаем данные из базы
-    import sqlite3
-    conn = sqlite3.connect('rosatom_database.db')
-    cursor = conn.cursor()
+    # Получаем данные из базы через пул (соединения с профилем только для чтения)
+    with db_manager.pool.connection() as conn:
+        # Агрегаты по production читаются из rollup, остальное - по всем нужным разделам
+        cursor = RewritingCursor(conn.cursor(), db_manager.rollups, db_manager.partitions)
+        return _build_real_report(cursor, report_type, filters)
+
+def _build_real_report(cursor, report_type, filters):
+    """Сбор данных и анализа отчета по открытому курсору"""
     
     # Извлекаем фильтры
     departments = filters.get('departments', [])
@@ -908,13 +1320,8 @@ def generate_real_report(report_type, filters):
         params.extend(departments)
     
     # Создаем SQL для фильтра по периоду
-    date_filter = ""
-    if period == 'month':
-        date_filter = "date >= date('now', '-1 month')"
-    elif period == 'quarter':
-        date_filter = "date >= date('now', '-3 months')"
-    elif period == 'year':
-        date_filter = "date >= date('now', '-1 year')"
+    # Граница периода - целочисленный ключ дня, сравнение идет по индексу выражения day_key
+    date_filter = period_condition(period, use_keys=db_manager.date_keys_ready)
     
     if report_type == 'summary':
         # Общий отчет
@@ -1066,8 +1473,6 @@ def generate_real_report(report_type, filters):
             'revenue': row[1] or 0
         } for row in sales_data]
         
-        conn.close()
-        
         # Формируем анализ с учетом фильтров
         analysis = f"## 📊 Общий отчет\n\n"
         analysis += f"**Период:** {period_text}\n\n"
@@ -1153,8 +1558,6 @@ def generate_real_report(report_type, filters):
             'salary': f"{row[4]:,.0f} ₽"
         } for row in employees]
         
-        conn.close()
-        
         analysis = f"## 👥 Отчет по эффективности сотрудников\n\n"
         analysis += f"**Период:** {period_text}\n\n"
         
@@ -1218,8 +1621,6 @@ def generate_real_report(report_type, filters):
             'status': row[2]
         } for row in budgets]
         
-        conn.close()
-        
         analysis = f"## 💰 Финансовый отчет\n\n"
         analysis += f"**Период:** {period_text}\n\n"
         
@@ -1309,8 +1710,6 @@ def generate_real_report(report_type, filters):
             'resolved': 'Да' if row[4] else 'Нет'
         } for row in incidents]
         
-        conn.close()
-        
         analysis = f"## 🛡️ Отчет по безопасности\n\n"
         analysis += f"**Период:** {period_text}\n\n"
         
@@ -1337,7 +1736,6 @@ def generate_real_report(report_type, filters):
         }
     
     else:
-        conn.close()
         return {
             'title': f'Отчет {report_type} ({period_text})',
             'date': datetime.now().strftime('%d.%m.%Y %H:%M'),
@@ -1559,7 +1957,7 @@ def get_conversation_history():
 
 
 @app.route('/api/dashboard/filtered_data', methods=['POST'])
-
+@http_cache.conditional('data', tables=('employees', 'projects', 'production', 'safety_incidents', 'production_partitions'))
 def get_filtered_dashboard_data():
 
     """Получение отфильтрованных данных для дашборда"""
@@ -1570,6 +1968,8 @@ def get_filtered_dashboard_data():
 
         filters = data.get('filters', {})
 
+        result_format = requested_result_format(data, allow_arrow=False)
+
         
 
         # Получаем параметры фильтров
@@ -1582,65 +1982,49 @@ def get_filtered_dashboard_data():
 
         
 
-        # Базовые SQL запросы с учетом фильтров
-
-        where_clauses = []
-
-        params = []
+        # Базовые SQL запросы с учетом фильтров.
+        # Значения фильтров передаются параметрами: текст запроса зависит только
+        # от набора включенных фильтров, и план выполнения переиспользуется
 
         
 
         # 1. Фильтр по отделу
 
-        if department != 'all':
-
-            where_clauses.append("department = ?")
+        department_filter = "WHERE department = ?" if department != 'all' else ""
 
-            params.append(department)
+        department_params = [department] if department != 'all' else []
 
         
 
         # 2. Фильтр по периоду для данных с датами
 
-        if period != 'all':
+        date_condition, date_params = period_filter(period, use_keys=db_manager.date_keys_ready)
 
-            if period == 'last_month':
+        date_filter = f"AND {date_condition}" if date_condition else ""
 
-                date_filter = "AND date >= date('now', '-1 month')"
-
-            elif period == 'last_quarter':
+        
 
-                date_filter = "AND date >= date('now', '-3 months')"
+        # 3. Фильтр по проекту (в production проект задан через project_id)
 
-            elif period == 'last_year':
+        if project != 'all':
 
-                date_filter = "AND date >= date('now', '-1 year')"
+            project_filter = "AND project_name LIKE ?"
 
-            else:
+            production_project_filter = "AND project_id IN (SELECT project_id FROM projects WHERE project_name LIKE ?)"
 
-                date_filter = ""
+            project_params = [f'%{project}%']
 
         else:
 
-            date_filter = ""
-
-        
-
-        # 3. Фильтр по проекту
-
-        if project != 'all':
-
-            # Для таблицы production
+            project_filter = ""
 
-            where_clauses.append("project_name LIKE ?")
+            production_project_filter = ""
 
-            params.append(f'%{project}%')
+            project_params = []
 
         
 
-        # Формируем WHERE условие
-
-        where_sql = "WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+        production_params = date_params + project_params
 
         
 
@@ -1654,7 +2038,7 @@ def get_filtered_dashboard_data():
 
             FROM employees 
 
-            {where_sql.replace('department = ?', 'department = ?') if department != 'all' else ''}
+            {department_filter}
 
         """
 
@@ -1670,7 +2054,7 @@ def get_filtered_dashboard_data():
 
             WHERE status = 'В работе'
 
-            {f"AND project_name LIKE '%{project}%'" if project != 'all' else ""}
+            {project_filter}
 
         """
 
@@ -1688,7 +2072,7 @@ def get_filtered_dashboard_data():
 
             {date_filter}
 
-            {f"AND project_name LIKE '%{project}%'" if project != 'all' else ""}
+            {production_project_filter}
 
         """
 
@@ -1744,7 +2128,7 @@ def get_filtered_dashboard_data():
 
                 {date_filter}
 
-                {f"AND project_name LIKE '%{project}%'" if project != 'all' else ""}
+                {production_project_filter}
 
             GROUP BY substr(date, 1, 7)
 
@@ -1786,7 +2170,7 @@ def get_filtered_dashboard_data():
 
                 {date_filter}
 
-                {f"AND project_name LIKE '%{project}%'" if project != 'all' else ""}
+                {production_project_filter}
 
             GROUP BY product_name 
 
@@ -1852,41 +2236,57 @@ def get_filtered_dashboard_data():
 
         
 
-        # Выполняем все запросы
+        # Выполняем все запросы параллельно, каждый ровно один раз
 
-        results = {}
+        def first_record(default):
+
+            return lambda df: df.to_dict('records')[0] if not df.empty else default
 
         
 
-        # KPI метрики
+        def rows(df):
 
-        results['employees'] = db_manager.execute_query(employees_query, params if department != 'all' else None).to_dict('records')[0] if not db_manager.execute_query(employees_query, params if department != 'all' else None).empty else {'total_employees': 0}
+            return widget_rows(df, result_format)
 
-        results['projects'] = db_manager.execute_query(projects_query).to_dict('records')[0] if not db_manager.execute_query(projects_query).empty else {'active_projects': 0}
+        
 
-        results['revenue'] = db_manager.execute_query(revenue_query).to_dict('records')[0] if not db_manager.execute_query(revenue_query).empty else {'total_revenue': 0}
+        dashboard = dashboard_executor.run([
 
-        results['safety'] = db_manager.execute_query(safety_query).to_dict('records')[0] if not db_manager.execute_query(safety_query).empty else {'safety_score': 100}
+            # KPI метрики
 
-        
+            WidgetQuery('employees', employees_query, department_params, first_record({'total_employees': 0}), {'total_employees': 0}),
 
-        # Графики
+            WidgetQuery('projects', projects_query, project_params, first_record({'active_projects': 0}), {'active_projects': 0}),
 
-        results['department_chart'] = db_manager.execute_query(department_chart_query).to_dict('records')
+            WidgetQuery('revenue', revenue_query, production_params, first_record({'total_revenue': 0}), {'total_revenue': 0}),
 
-        results['sales_chart'] = db_manager.execute_query(sales_chart_query).to_dict('records')
+            WidgetQuery('safety', safety_query, None, first_record({'safety_score': 100}), {'safety_score': 100}),
 
-        results['project_status'] = db_manager.execute_query(project_status_query).to_dict('records')
+            # Графики
 
-        results['top_products'] = db_manager.execute_query(top_products_query).to_dict('records')
+            WidgetQuery('department_chart', department_chart_query, None, rows, []),
 
-        
+            WidgetQuery('sales_chart', sales_chart_query, production_params, rows, []),
+
+            WidgetQuery('project_status', project_status_query, None, rows, []),
+
+            WidgetQuery('top_products', top_products_query, production_params, rows, []),
+
+            # Таблицы
+
+            WidgetQuery('safety_incidents', safety_incidents_query, None, rows, []),
 
-        # Таблицы
+            WidgetQuery('top_employees', top_employees_query, None, rows, [])
 
-        results['safety_incidents'] = db_manager.execute_query(safety_incidents_query).to_dict('records')
+        ])
 
-        results['top_employees'] = db_manager.execute_query(top_employees_query).to_dict('records')
+        results = dashboard.data
+
+        if dashboard.partial:
+
+            # Упавший виджет может ответить при следующем запросе - частичный ответ не кэшируется клиентом
+
+            http_cache.skip()
 
         
 
@@ -1896,6 +2296,12 @@ def get_filtered_dashboard_data():
 
             'filters': filters,
 
+            'partial': dashboard.partial,
+
+            'errors': dashboard.errors,
+
+            'timings_ms': dashboard.timings,
+
             'data': results,
 
             'timestamp': datetime.now().isoformat()
@@ -1921,7 +2327,7 @@ def get_filtered_dashboard_data():
 
 
 @app.route('/api/health', methods=['GET'])
-
+@http_cache.cache_control('volatile')
 def health_check():
 
     """Проверка здоровья системы"""
@@ -1930,7 +2336,9 @@ def health_check():
 
         # Проверяем соединение с БД
 
-        db_status = db_manager.get_database_schema() is not None
+        schema = db_manager.get_database_schema()
+
+        db_status = schema is not None
 
         
 
@@ -1962,7 +2370,45 @@ def health_check():
 
             'components': components,
 
-            'database_tables': len(db_manager.get_database_schema().get('tables', {})) if db_status else 0,
+            'database_tables': len(schema.get('tables', {})) if db_status else 0,
+
+            'schema_version': db_manager.get_schema_version(),
+
+            'database_pool': db_manager.pool.stats(),
+
+            'sqlite_profile': db_manager.get_sqlite_settings(),
+
+            'query_cache': db_manager.result_cache.stats(),
+
+            'query_guard': {'budget': db_manager.query_budget.to_dict(), 'plan': db_manager.plan_guard.to_dict()},
+
+            'result_handles': db_manager.result_handles.stats(),
+
+            'dashboard_executor': dashboard_executor.stats(),
+
+            'rollups': db_manager.rollups.stats(),
+
+            'sql_optimizer': db_manager.sql_optimizer.stats(),
+
+            'cache_warmer': cache_warmer.stats(),
+
+            'query_log': db_manager.query_log.stats(),
+
+            'column_store': db_manager.column_store.stats(),
+
+            'partitions': db_manager.partitions.stats(),
+
+            'replica': db_manager.replica.stats(),
+
+            'http_cache': http_cache.stats(),
+
+            'nl_cache': sql_generator.stats(),
+
+            'llm': sql_generator.llm.stats() if getattr(sql_generator, 'llm', None) else None,
+
+            'schema_context': sql_generator.schema_context.stats() if getattr(sql_generator, 'schema_context', None) else None,
+
+            'sql_templates': sql_templates.stats(),
 
             'system': 'Rosatom BI System',
 
@@ -0,0 +1,48 @@
+import threading
+
+
+class ChangeTracker:
+    """Отслеживание изменений данных SQLite.
+
+    Глобальное поколение данных растет, когда PRAGMA data_version на любом
+    соединении пула показывает коммит из другого соединения или процесса.
+    Дополнительно ведутся счетчики изменений по таблицам для записей,
+    сделанных самим приложением.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._table_versions = {}
+
+    def observe(self, conn):
+        """Сверка data_version соединения и текущее поколение данных"""
+        data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        # Новое соединение не знает, что менялось до него - считаем это изменением
+        if getattr(conn, 'seen_data_version', None) != data_version:
+            conn.seen_data_version = data_version
+            with self._lock:
+                self._generation += 1
+        return self._generation
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def mark_changed(self, tables=None):
+        """Отметка изменений, сделанных приложением (None - все таблицы)"""
+        with self._lock:
+            if tables is None:
+                self._generation += 1
+                return
+            for table in tables:
+                key = table.lower()
+                self._table_versions[key] = self._table_versions.get(key, 0) + 1
+
+    def version(self, tables=()):
+        """Версия данных для набора таблиц: поколение и счетчики таблиц"""
+        with self._lock:
+            return (self._generation,) + tuple(
+                (table, self._table_versions.get(table, 0))
+                for table in sorted({t.lower() for t in tables})
+            )
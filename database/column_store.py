@@ -0,0 +1,670 @@
+import json
+import operator
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from database.rollups import DIMENSIONS, MEASURES, SOURCE_TABLE, rollup_table
+from database.sql_shape import (
+    Token, canonical, looks_numeric, matching_paren, number_params, parse_select, render, result_name, split_top_level,
+    strip_qualifiers, tokenize
+)
+
+
+_ENCODED_COLUMNS = ('date', *DIMENSIONS)
+_INTEGER_MEASURES = ('quantity',)
+# Объявленные имена столбцов production - имена столбцов результата без псевдонима
+_SOURCE_COLUMNS = ('date', *DIMENSIONS, *MEASURES)
+_AGGREGATES = ('sum', 'total', 'count', 'avg', 'min', 'max')
+
+# Словарь столбца как таблица SQLite: выражения над значениями считаются
+# самим SQLite, поэтому семантика совпадает с запросом к production
+_DOMAIN_SOURCES = {
+    'date': "SELECT key, value AS date FROM json_each(?)",
+    # CAST сохраняет текстовое сродство столбцов: department = 5 сравнивается как строка
+    **{column: f"SELECT key, CAST(value AS TEXT) AS {column} FROM json_each(?)" for column in DIMENSIONS},
+}
+
+_NUMPY_COMPARISONS = {
+    '=': np.equal, '==': np.equal, '!=': np.not_equal, '<>': np.not_equal,
+    '>': np.greater, '>=': np.greater_equal, '<': np.less, '<=': np.less_equal,
+}
+_PYTHON_COMPARISONS = {
+    '=': operator.eq, '==': operator.eq, '!=': operator.ne, '<>': operator.ne,
+    '>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le,
+}
+
+# Плотная группировка через bincount, пока произведение кардинальностей ключей не больше этого
+_DENSE_GROUPS = 1_000_000
+
+
+class _Unsupported(Exception):
+    """Запрос не подходит для колоночного хранилища"""
+
+
+class _Snapshot:
+    """Снимок production в виде столбцов NumPy.
+
+    Строки закодированы словарями: codes[столбец][i] - номер значения в
+    dictionaries[столбец]. Меры хранятся как float64, NULL - как NaN.
+    Снимок не изменяется: дозагрузка строит новый снимок.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.last_rowid = 0
+        self.codes = {column: np.empty(0, dtype=np.int32) for column in _ENCODED_COLUMNS}
+        self.dictionaries = {column: [] for column in _ENCODED_COLUMNS}
+        self.lookup = {column: {} for column in _ENCODED_COLUMNS}
+        self.measures = {measure: np.empty(0, dtype=np.float64) for measure in MEASURES}
+        # Значения выражений и условий по словарям - действительны только для этого снимка
+        self.cache = {}
+
+    def extended(self, rows):
+        """Новый снимок с добавленными строками (rowid, date, измерения..., меры...)"""
+        snapshot = _Snapshot()
+        snapshot.rows = self.rows + len(rows)
+        snapshot.last_rowid = rows[-1][0] if rows else self.last_rowid
+        columns = list(zip(*rows)) if rows else [()] * (1 + len(_ENCODED_COLUMNS) + len(MEASURES))
+
+        for offset, column in enumerate(_ENCODED_COLUMNS, start=1):
+            dictionary = list(self.dictionaries[column])
+            lookup = dict(self.lookup[column])
+            codes = np.empty(len(rows), dtype=np.int32)
+            for i, value in enumerate(columns[offset]):
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(dictionary)
+                    dictionary.append(value)
+                codes[i] = code
+            snapshot.dictionaries[column] = dictionary
+            snapshot.lookup[column] = lookup
+            snapshot.codes[column] = np.concatenate([self.codes[column], codes])
+
+        for offset, measure in enumerate(MEASURES, start=1 + len(_ENCODED_COLUMNS)):
+            values = np.array([np.nan if value is None else value for value in columns[offset]], dtype=np.float64)
+            snapshot.measures[measure] = np.concatenate([self.measures[measure], values])
+        return snapshot
+
+    def totals(self):
+        return (self.rows, *(float(np.nansum(self.measures[measure])) for measure in MEASURES))
+
+    def memory_bytes(self):
+        arrays = list(self.codes.values()) + list(self.measures.values())
+        return int(sum(array.nbytes for array in arrays))
+
+
+class _Column:
+    """Столбец результата: ключ группировки, агрегат или константа"""
+
+    def __init__(self, kind, name, canonical_text, domain=None, sql=None, function=None, measure=None, digits=None):
+        self.kind = kind
+        self.name = name
+        self.canonical = canonical_text
+        self.domain = domain
+        self.sql = sql
+        self.function = function
+        self.measure = measure
+        self.digits = digits
+
+
+class _Plan:
+    """Разобранный запрос: столбцы, условия, HAVING, сортировка и LIMIT"""
+
+    def __init__(self):
+        self.columns = []
+        self.visible = []
+        self.keys = []
+        self.conditions = []
+        self.having = []
+        self.order = []
+        self.limit = None
+        self.offset = 0
+
+
+class ProductionColumnStore:
+    """Колоночное хранилище production в памяти для агрегатных запросов.
+
+    Отвечает на SELECT по production с SUM/TOTAL/COUNT/AVG/MIN/MAX мер,
+    группировкой по измерениям и выражениям от даты, фильтрами по дате,
+    измерениям и сравнениями мер, HAVING, ORDER BY и LIMIT. Выражения от
+    даты и измерений вычисляются SQLite один раз на значение словаря,
+    дальше работают векторные операции NumPy по строкам.
+
+    Снимок дозагружается строками с rowid больше последнего загруженного,
+    когда меняется версия данных production. Если после дозагрузки итоги
+    не совпадают с rollup (были UPDATE или DELETE), снимок строится заново.
+    Архивные разделы production не меняются и загружаются один раз.
+    """
+
+    def __init__(self, change_tracker, rollups=None, partitions=None, enabled=True):
+        self.change_tracker = change_tracker
+        self.rollups = rollups
+        self.partitions = partitions
+        self.enabled = enabled
+        self._snapshot = None
+        self._archived = None
+        self._version = None
+        self._lock = threading.Lock()
+        self._plans = {}
+        self._stats = {'hits': 0, 'skipped': 0, 'refreshes': 0, 'reloads': 0, 'load_ms': 0.0}
+
+    @property
+    def ready(self):
+        return self._snapshot is not None
+
+    def load(self, conn):
+        """Первичная загрузка снимка"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._refresh(conn, full=True)
+
+    def execute(self, conn, sql, params=None):
+        """DataFrame результата или None, если запрос не подходит или снимок не готов"""
+        if not self.enabled or self._snapshot is None:
+            return None
+        plan = self._plan(sql)
+        if plan is None:
+            self._stats['skipped'] += 1
+            return None
+        snapshot = self._sync(conn)
+        try:
+            df = self._run(conn, snapshot, plan, params)
+        except _Unsupported:
+            self._stats['skipped'] += 1
+            return None
+        self._stats['hits'] += 1
+        return df
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            **self._stats,
+            'load_ms': round(self._stats['load_ms'], 2),
+            'enabled': self.enabled,
+            'ready': snapshot is not None,
+            'rows': snapshot.rows if snapshot else 0,
+            'memory_bytes': snapshot.memory_bytes() if snapshot else 0,
+        }
+
+    # --- Снимок ---
+
+    def _sync(self, conn):
+        self.change_tracker.observe(conn)
+        version = self.change_tracker.version((SOURCE_TABLE,))
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._refresh(conn)
+                    self._version = version
+        return self._snapshot
+
+    def _refresh(self, conn, full=False):
+        started = time.perf_counter()
+        base = self._archive_snapshot(conn) if full or self._snapshot is None else self._snapshot
+        snapshot = self._append(conn, base)
+        if base.rows and not self._consistent(conn, snapshot):
+            # Строки изменены или удалены - дозагрузки по rowid недостаточно
+            snapshot = self._append(conn, self._archive_snapshot(conn))
+            self._stats['reloads'] += 1
+        self._snapshot = snapshot
+        self._stats['refreshes'] += 1
+        self._stats['load_ms'] += (time.perf_counter() - started) * 1000
+
+    def _append(self, conn, snapshot):
+        cursor = conn.execute(
+            f"SELECT rowid, {', '.join(_ENCODED_COLUMNS)}, {', '.join(MEASURES)} "
+            f"FROM {SOURCE_TABLE} WHERE rowid > ? ORDER BY rowid",
+            (snapshot.last_rowid,)
+        )
+        while True:
+            rows = cursor.fetchmany(50000)
+            if not rows:
+                return snapshot
+            snapshot = snapshot.extended(rows)
+
+    def _archive_snapshot(self, conn):
+        """Снимок архивных разделов production (пустой без разделов)"""
+        partitions = self.partitions.catalog(conn) if self.partitions is not None else []
+        key = tuple(partition.name for partition in partitions)
+        if self._archived is None or self._archived[0] != key:
+            snapshot = _Snapshot()
+            if partitions:
+                self.partitions.attach(conn, partitions)
+            for partition in partitions:
+                # rowid разделов не продолжают друг друга - дозагрузка по rowid идет только по production
+                cursor = conn.execute(
+                    f"SELECT 0, {', '.join(_ENCODED_COLUMNS)}, {', '.join(MEASURES)} "
+                    f'FROM "{partition.schema}".{SOURCE_TABLE}'
+                )
+                while True:
+                    rows = cursor.fetchmany(50000)
+                    if not rows:
+                        break
+                    snapshot = snapshot.extended(rows)
+            self._archived = (key, snapshot)
+        return self._archived[1]
+
+    def _consistent(self, conn, snapshot):
+        """Сверка числа строк и сумм мер с rollup (без rollup - только числа строк)"""
+        if self.rollups is not None and self.rollups.ready:
+            table = rollup_table('month', 'total')
+            row = conn.execute(
+                f"SELECT COALESCE(SUM(row_count), 0), "
+                f"{', '.join(f'TOTAL({measure}_sum)' for measure in MEASURES)} FROM {table}"
+            ).fetchone()
+            expected = snapshot.totals()
+            return row[0] == expected[0] and all(
+                abs(actual - value) <= 1e-6 * max(1.0, abs(value)) for actual, value in zip(row[1:], expected[1:])
+            )
+        archived = self._archived[1].rows if self._archived else 0
+        return conn.execute(f"SELECT COUNT(*) FROM {SOURCE_TABLE}").fetchone()[0] + archived == snapshot.rows
+
+    # --- Разбор запроса ---
+
+    def _plan(self, sql):
+        if sql not in self._plans:
+            try:
+                plan = self._build_plan(sql)
+            except (_Unsupported, ValueError):
+                plan = None
+            if len(self._plans) >= 1024:
+                self._plans.clear()
+            self._plans[sql] = plan
+        return self._plans[sql]
+
+    def _build_plan(self, sql):
+        if SOURCE_TABLE not in sql.lower():
+            raise _Unsupported()
+        tokens = tokenize(sql)
+        shape = parse_select(tokens)
+        if shape is None or shape.table.lower() != SOURCE_TABLE:
+            raise _Unsupported()
+
+        # Номера позиционных параметров по всему тексту запроса
+        number_params(tokens)
+        qualifiers = [shape.table, shape.table_alias]
+        plan = _Plan()
+
+        for tokens_, alias in shape.items:
+            stripped = strip_qualifiers(tokens_, qualifiers)
+            if len(stripped) == 1 and stripped[0].value == '*':
+                raise _Unsupported()
+            name = alias or result_name(sql, tokens_, _SOURCE_COLUMNS)
+            column = self._column(stripped, name)
+            plan.visible.append(len(plan.columns))
+            plan.columns.append(column)
+
+        aliases = {column.name.lower(): index for index, column in enumerate(plan.columns)}
+        for expression in shape.group_by:
+            stripped = strip_qualifiers(expression, qualifiers)
+            if len(stripped) == 1 and stripped[0].kind == 'number':
+                index = self._position(plan, stripped[0])
+            else:
+                index = self._find_column(plan, stripped, aliases, allow_new=True)
+            if plan.columns[index].kind != 'key':
+                raise _Unsupported()
+            plan.keys.append(index)
+
+        key_texts = {plan.columns[index].canonical for index in plan.keys}
+        for column in plan.columns:
+            if column.kind == 'key' and column.canonical not in key_texts:
+                # Столбец вне GROUP BY и агрегатов
+                raise _Unsupported()
+
+        where = strip_qualifiers(shape.where or [], qualifiers)
+        if where:
+            # AND связывает сильнее OR: с OR на верхнем уровне условие не делится
+            has_or = any(token.is_keyword('or') for token in where)
+            for part in [where] if has_or else split_top_level(where, 'and'):
+                plan.conditions.append(self._condition(part))
+
+        having = strip_qualifiers(shape.having or [], qualifiers)
+        for part in split_top_level(having, 'and') if having else []:
+            if len(part) < 3 or part[-2].value not in _PYTHON_COMPARISONS or not self._is_value(part[-1:]):
+                raise _Unsupported()
+            index = self._find_column(plan, part[:-2], aliases, allow_new=True)
+            plan.having.append((index, part[-2].value, part[-1]))
+
+        for expression, direction in shape.order_by:
+            stripped = strip_qualifiers(expression, qualifiers)
+            if len(stripped) == 1 and stripped[0].kind == 'number':
+                index = self._position(plan, stripped[0])
+            else:
+                index = self._find_column(plan, stripped, aliases, allow_new=True)
+            plan.order.append((index, direction == 'DESC'))
+
+        if shape.limit:
+            plan.limit, plan.offset = self._limit(shape.limit)
+        return plan
+
+    def _position(self, plan, token):
+        """Столбец по номеру в списке SELECT (GROUP BY 1, ORDER BY 2)"""
+        position = int(token.value) - 1 if token.value.isdigit() else -1
+        if not 0 <= position < len(plan.visible):
+            raise _Unsupported()
+        return plan.visible[position]
+
+    def _column(self, tokens, name=None):
+        text = canonical(tokens)
+        aggregate = self._aggregate(tokens)
+        if aggregate is not None:
+            function, measure, digits = aggregate
+            return _Column('agg', name, text, function=function, measure=measure, digits=digits)
+        domain = self._domain(tokens)
+        if domain is None:
+            return _Column('literal', name, text, sql=tokens)
+        return _Column('key', name, text, domain=domain, sql=tokens)
+
+    def _find_column(self, plan, tokens, aliases, allow_new=False):
+        """Индекс столбца плана для выражения или псевдонима; при allow_new - скрытый столбец"""
+        if len(tokens) == 1 and tokens[0].kind in ('ident', 'string') and tokens[0].value.strip("'").lower() in aliases:
+            return aliases[tokens[0].value.strip("'").lower()]
+        text = canonical(tokens)
+        for index, column in enumerate(plan.columns):
+            if column.canonical == text:
+                return index
+        if not allow_new:
+            raise _Unsupported()
+        plan.columns.append(self._column(tokens))
+        return len(plan.columns) - 1
+
+    def _aggregate(self, tokens):
+        """(функция, мера или None для COUNT(*), знаки округления) или None"""
+        digits = None
+        if (len(tokens) >= 4 and tokens[0].lower == 'round' and tokens[1].value == '('
+                and matching_paren(tokens, 1) == len(tokens) - 1):
+            inner = split_top_level(tokens[2:-1])
+            if len(inner) == 2 and len(inner[1]) == 1 and inner[1][0].kind == 'number':
+                digits = int(inner[1][0].value)
+            elif len(inner) != 1:
+                raise _Unsupported()
+            if self._aggregate(inner[0]) is None:
+                return None
+            tokens = inner[0]
+        if not (len(tokens) >= 3 and tokens[0].kind == 'ident' and tokens[0].lower in _AGGREGATES
+                and tokens[1].value == '(' and matching_paren(tokens, 1) == len(tokens) - 1):
+            if any(token.kind == 'ident' and token.lower in _AGGREGATES for token in tokens):
+                raise _Unsupported()
+            return None
+        function = tokens[0].lower
+        argument = tokens[2:-1]
+        if function == 'count' and len(argument) == 1 and argument[0].value == '*':
+            return function, None, digits
+        if len(argument) != 1 or argument[0].kind != 'ident' or argument[0].lower not in MEASURES:
+            raise _Unsupported()
+        return function, argument[0].lower, digits
+
+    def _domain(self, tokens):
+        """Домен выражения: 'date', измерение или None для констант"""
+        domains = set()
+        for i, token in enumerate(tokens):
+            if token.kind != 'ident' or (i + 1 < len(tokens) and tokens[i + 1].value == '('):
+                continue
+            # Имя типа в CAST(... AS INTEGER) - не столбец
+            if i > 0 and tokens[i - 1].is_keyword('as'):
+                continue
+            if token.lower == 'date':
+                domains.add('date')
+            elif token.lower in DIMENSIONS:
+                domains.add(token.lower)
+            else:
+                raise _Unsupported()
+        if len(domains) > 1:
+            raise _Unsupported()
+        return domains.pop() if domains else None
+
+    def _condition(self, part):
+        """Условие WHERE: по словарю домена или сравнение меры"""
+        if any(token.kind == 'ident' and token.lower in MEASURES for token in part):
+            measure = part[0].lower if part[0].kind == 'ident' else None
+            if measure not in MEASURES:
+                raise _Unsupported()
+            rest = part[1:]
+            if [token.lower for token in rest] == ['is', 'not', 'null']:
+                return ('not_null', measure)
+            if [token.lower for token in rest] == ['is', 'null']:
+                return ('null', measure)
+            if len(rest) >= 2 and rest[0].value in _NUMPY_COMPARISONS and self._is_value(rest[1:]):
+                return ('compare', measure, rest[0].value, rest[1:])
+            raise _Unsupported()
+        domain = self._domain(part)
+        if domain is None:
+            raise _Unsupported()
+        return ('domain', domain, part)
+
+    def _is_value(self, tokens):
+        if len(tokens) == 2 and tokens[0].value == '-' and tokens[1].kind == 'number':
+            return True
+        return len(tokens) == 1 and tokens[0].kind in ('number', 'param')
+
+    def _limit(self, tokens):
+        parts = split_top_level(tokens)
+        if len(parts) == 2:
+            offset, limit = parts
+        else:
+            limit, offset = tokens, None
+            for i, token in enumerate(tokens):
+                if token.is_keyword('offset'):
+                    limit, offset = tokens[:i], tokens[i + 1:]
+        if len(limit) != 1 or limit[0].kind != 'number' or (offset and (len(offset) != 1 or offset[0].kind != 'number')):
+            raise _Unsupported()
+        return int(limit[0].value), int(offset[0].value) if offset else 0
+
+    # --- Выполнение ---
+
+    def _bind(self, tokens, params):
+        """Текст выражения с ? и значения его параметров"""
+        values = []
+        result = []
+        for token in tokens:
+            if token.kind == 'param':
+                values.append(self._param(token, params))
+                result.append(Token('param', '?'))
+            else:
+                result.append(token)
+        return render(result), values
+
+    def _param(self, token, params):
+        try:
+            return params[token.slot]
+        except (KeyError, IndexError, TypeError):
+            raise _Unsupported()
+
+    def _value(self, tokens, params):
+        if tokens[0].kind == 'param':
+            return self._param(tokens[0], params)
+        number = float(tokens[-1].value)
+        return -number if len(tokens) == 2 else number
+
+    def _check_affinity(self, domain, tokens, params):
+        """Столбец date объявлен как DATE (числовое сродство): при прямом сравнении с
+        числом или строкой-числом SQLite сравнивает числа, а значение словаря сродства
+        не имеет. Такие выражения остаются SQLite."""
+        if domain != 'date':
+            return
+        direct = any(
+            token.kind == 'ident' and token.lower == 'date'
+            and not (i + 1 < len(tokens) and tokens[i + 1].value == '(')
+            and not (i and tokens[i - 1].value in ('(', ','))
+            for i, token in enumerate(tokens)
+        )
+        if not direct:
+            return
+        for token in tokens:
+            if (token.kind == 'number'
+                    or token.kind == 'string' and looks_numeric(token.value[1:-1])
+                    or token.kind == 'param' and looks_numeric(self._param(token, params))):
+                raise _Unsupported()
+
+    def _domain_values(self, conn, snapshot, domain, tokens, params):
+        """Значение выражения для каждого значения словаря домена (кэшируется)"""
+        self._check_affinity(domain, tokens, params)
+        sql, values = self._bind(tokens, params)
+        dictionary = snapshot.dictionaries[domain]
+        key = ('value', domain, sql, tuple(values))
+        cached = snapshot.cache.get(key)
+        if cached is None:
+            rows = conn.execute(
+                f"WITH d AS ({_DOMAIN_SOURCES[domain]}) SELECT {sql} FROM d ORDER BY key",
+                [json.dumps(dictionary, ensure_ascii=False)] + values
+            ).fetchall()
+            # Перекодируем результат: номер значения словаря -> номер значения выражения
+            result_values = []
+            lookup = {}
+            mapping = np.empty(len(rows), dtype=np.int32)
+            for i, (value,) in enumerate(rows):
+                code = lookup.get(value)
+                if code is None:
+                    code = lookup[value] = len(result_values)
+                    result_values.append(value)
+                mapping[i] = code
+            cached = (mapping, result_values)
+            self._remember(snapshot, key, cached)
+        return cached
+
+    def _domain_mask(self, conn, snapshot, domain, tokens, params):
+        self._check_affinity(domain, tokens, params)
+        sql, values = self._bind(tokens, params)
+        dictionary = snapshot.dictionaries[domain]
+        key = ('mask', domain, sql, tuple(values))
+        cached = snapshot.cache.get(key)
+        if cached is None:
+            rows = conn.execute(
+                f"WITH d AS ({_DOMAIN_SOURCES[domain]}) SELECT key FROM d WHERE {sql}",
+                [json.dumps(dictionary, ensure_ascii=False)] + values
+            ).fetchall()
+            cached = np.zeros(len(dictionary), dtype=bool)
+            cached[[row[0] for row in rows]] = True
+            self._remember(snapshot, key, cached)
+        return cached
+
+    def _remember(self, snapshot, key, value):
+        if len(snapshot.cache) >= 4096:
+            snapshot.cache.clear()
+        snapshot.cache[key] = value
+
+    def _run(self, conn, snapshot, plan, params):
+        mask = np.ones(snapshot.rows, dtype=bool)
+        for condition in plan.conditions:
+            kind = condition[0]
+            if kind == 'domain':
+                _, domain, tokens = condition
+                mask &= self._domain_mask(conn, snapshot, domain, tokens, params)[snapshot.codes[domain]]
+            elif kind == 'not_null':
+                mask &= ~np.isnan(snapshot.measures[condition[1]])
+            elif kind == 'null':
+                mask &= np.isnan(snapshot.measures[condition[1]])
+            else:
+                _, measure, comparison, value = condition
+                bound = self._value(value, params)
+                if not isinstance(bound, (int, float)):
+                    raise _Unsupported()
+                mask &= _NUMPY_COMPARISONS[comparison](snapshot.measures[measure], bound)
+        rows = np.flatnonzero(mask)
+
+        # Номер группы каждой выбранной строки
+        key_values = []
+        if plan.keys:
+            combined = np.zeros(len(rows), dtype=np.int64)
+            cardinality = 1
+            for index in plan.keys:
+                column = plan.columns[index]
+                mapping, values = self._domain_values(conn, snapshot, column.domain, column.sql, params)
+                combined = combined * len(values) + mapping[snapshot.codes[column.domain][rows]]
+                cardinality *= max(len(values), 1)
+                key_values.append(values)
+            if cardinality <= _DENSE_GROUPS:
+                groups = np.flatnonzero(np.bincount(combined, minlength=cardinality))
+                remap = np.empty(cardinality, dtype=np.int64)
+                remap[groups] = np.arange(len(groups))
+                inverse = remap[combined]
+            else:
+                groups, inverse = np.unique(combined, return_inverse=True)
+            group_count = len(groups)
+        else:
+            groups = np.zeros(1, dtype=np.int64)
+            inverse = np.zeros(len(rows), dtype=np.int64)
+            group_count = 1
+
+        results = []
+        for index, column in enumerate(plan.columns):
+            if column.kind == 'key':
+                position = plan.keys.index(index)
+                divisor = 1
+                for values in key_values[position + 1:]:
+                    divisor *= len(values)
+                codes = (groups // divisor) % len(key_values[position])
+                results.append([key_values[position][code] for code in codes])
+            elif column.kind == 'agg':
+                results.append(self._aggregate_values(snapshot, column, rows, inverse, group_count))
+            else:
+                sql, values = self._bind(column.sql, params)
+                results.append([conn.execute(f"SELECT {sql}", values).fetchone()[0]] * group_count)
+
+        records = list(zip(*results)) if results else []
+        for index, comparison, value in plan.having:
+            bound = self._value([value], params)
+            compare = _PYTHON_COMPARISONS[comparison]
+            records = [record for record in records if record[index] is not None and compare(record[index], bound)]
+
+        order = plan.order or [(index, False) for index in plan.keys]
+        for index, descending in reversed(order):
+            records.sort(key=lambda record: _sort_key(record[index]), reverse=descending)
+        if plan.limit is not None:
+            records = records[plan.offset:plan.offset + plan.limit] if plan.limit >= 0 else records[plan.offset:]
+
+        return pd.DataFrame(
+            [[record[index] for index in plan.visible] for record in records],
+            columns=[plan.columns[index].name for index in plan.visible]
+        )
+
+    def _aggregate_values(self, snapshot, column, rows, inverse, group_count):
+        function = column.function
+        if column.measure is None:
+            return [int(count) for count in np.bincount(inverse, minlength=group_count)]
+
+        values = snapshot.measures[column.measure][rows]
+        valid = ~np.isnan(values)
+        counts = np.bincount(inverse[valid], minlength=group_count)
+        if function == 'count':
+            return [int(count) for count in counts]
+        if function in ('min', 'max'):
+            # Сортировка по группе и reduceat по границам групп быстрее ufunc.at
+            group_of = inverse[valid]
+            order = np.argsort(group_of, kind='stable')
+            group_of = group_of[order]
+            result = np.zeros(group_count)
+            if len(group_of):
+                starts = np.flatnonzero(np.concatenate(([True], group_of[1:] != group_of[:-1])))
+                reduce = np.minimum if function == 'min' else np.maximum
+                result[group_of[starts]] = reduce.reduceat(values[valid][order], starts)
+        else:
+            result = np.bincount(inverse[valid], weights=values[valid], minlength=group_count)
+            if function == 'avg':
+                result = result / np.maximum(counts, 1)
+
+        integer = column.measure in _INTEGER_MEASURES and function != 'avg'
+        output = []
+        for value, count in zip(result.tolist(), counts.tolist()):
+            if function == 'total':
+                output.append(value)
+            elif not count:
+                output.append(None)
+            else:
+                output.append(int(value) if integer else value)
+        if column.digits is not None:
+            output = [None if value is None else round(float(value), column.digits) for value in output]
+        return output
+
+
+def _sort_key(value):
+    # Порядок SQLite: NULL, числа, строки
+    if value is None:
+        return (0, 0, 0)
+    if isinstance(value, str):
+        return (2, 0, value)
+    return (1, value, '')
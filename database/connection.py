@@ -0,0 +1,131 @@
+import os
+import sqlite3
+from urllib.parse import quote
+
+
+def _env_flag(name, default):
+    return os.getenv(name, default).strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+class SQLiteProfile:
+    """Профиль производительности SQLite, применяемый к каждому соединению"""
+
+    def __init__(self, journal_mode='WAL', read_only=True, query_only=True,
+                 mmap_size=256 * 1024 * 1024, cache_size=-32000, temp_store='MEMORY',
+                 busy_timeout=5000, synchronous='NORMAL', statement_cache_size=256):
+        self.journal_mode = journal_mode
+        self.read_only = read_only
+        self.query_only = query_only
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.temp_store = temp_store
+        self.busy_timeout = busy_timeout
+        self.synchronous = synchronous
+        # Размер кэша подготовленных выражений sqlite3 на каждое соединение
+        self.statement_cache_size = statement_cache_size
+
+    @classmethod
+    def from_env(cls):
+        """Профиль из переменных окружения SQLITE_*"""
+        return cls(
+            journal_mode=os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+            read_only=_env_flag('SQLITE_READ_ONLY', '1'),
+            query_only=_env_flag('SQLITE_QUERY_ONLY', '1'),
+            mmap_size=int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+            cache_size=int(os.getenv('SQLITE_CACHE_SIZE', '-32000')),
+            temp_store=os.getenv('SQLITE_TEMP_STORE', 'MEMORY'),
+            busy_timeout=int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000')),
+            synchronous=os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+            statement_cache_size=int(os.getenv('SQLITE_STATEMENT_CACHE', '256'))
+        )
+
+    def for_writes(self):
+        """Тот же профиль для соединений, которым нужна запись"""
+        profile = SQLiteProfile(**self.to_dict())
+        profile.read_only = False
+        profile.query_only = False
+        return profile
+
+    def pragmas(self):
+        """PRAGMA, выполняемые при открытии соединения.
+
+        journal_mode здесь нет: режим журнала хранится в самом файле
+        и устанавливается один раз через prepare_database.
+        """
+        pragmas = {
+            'busy_timeout': self.busy_timeout,
+            'mmap_size': self.mmap_size,
+            'cache_size': self.cache_size,
+            'temp_store': self.temp_store,
+        }
+        if not self.read_only:
+            pragmas['synchronous'] = self.synchronous
+        if self.query_only:
+            pragmas['query_only'] = 1
+        return pragmas
+
+    def to_dict(self):
+        return {
+            'journal_mode': self.journal_mode,
+            'read_only': self.read_only,
+            'query_only': self.query_only,
+            'mmap_size': self.mmap_size,
+            'cache_size': self.cache_size,
+            'temp_store': self.temp_store,
+            'busy_timeout': self.busy_timeout,
+            'synchronous': self.synchronous,
+            'statement_cache_size': self.statement_cache_size,
+        }
+
+
+def database_path(db_url=None):
+    """Путь к файлу SQLite из строки подключения (DATABASE_URL)"""
+    db_url = db_url or os.getenv('DATABASE_URL', 'sqlite:///rosatom_database.db')
+    if db_url.startswith('sqlite:///'):
+        return db_url[len('sqlite:///'):]
+    if db_url.startswith('sqlite://'):
+        return db_url[len('sqlite://'):] or ':memory:'
+    return db_url
+
+
+def connect(database=None, profile=None, immutable=False, **kwargs):
+    """Единая фабрика соединений SQLite с профилем производительности.
+
+    immutable=True - файл никогда не меняется (снимок реплики): SQLite читает
+    его без блокировок и без проверки изменений другими процессами.
+    """
+    database = database or database_path()
+    profile = profile or SQLiteProfile.from_env()
+    # Одинаковый текст SQL с разными параметрами не разбирается и не планируется заново
+    kwargs.setdefault('cached_statements', profile.statement_cache_size)
+
+    if (profile.read_only or immutable) and database != ':memory:':
+        # Режим только для чтения на уровне файла: такой читатель не берет блокировок записи
+        uri = f"file:{quote(os.path.abspath(database))}?mode=ro"
+        if immutable:
+            uri += "&immutable=1"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, **kwargs)
+    else:
+        conn = sqlite3.connect(database, check_same_thread=False, **kwargs)
+
+    for name, value in profile.pragmas().items():
+        conn.execute(f"PRAGMA {name}={value}")
+    return conn
+
+
+def prepare_database(database=None, profile=None):
+    """Однократная настройка файла БД: режим журнала (WAL сохраняется в файле)"""
+    database = database or database_path()
+    profile = profile or SQLiteProfile.from_env()
+    if not profile.journal_mode or database == ':memory:' or not os.path.exists(database):
+        return None
+    try:
+        conn = sqlite3.connect(database, timeout=profile.busy_timeout / 1000)
+        try:
+            mode = conn.execute(f"PRAGMA journal_mode={profile.journal_mode}").fetchone()[0]
+        finally:
+            conn.close()
+        return mode
+    except sqlite3.Error as e:
+        print(f"⚠️ Не удалось установить journal_mode={profile.journal_mode}: {e}")
+        return None
@@ -0,0 +1,153 @@
+import calendar
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+
+
+# Таблицы с датой событий: таблица -> столбец даты
+DATE_KEY_TABLES = {
+    'production': 'date',
+    'finance': 'date',
+    'safety_incidents': 'date',
+}
+
+# Целочисленные ключи ГГГГММДД и ГГГГММ. strftime нормализует все форматы,
+# которые понимает SQLite ('ГГГГ-ММ-ДД', с временем, с 'T'), и дает NULL
+# для нераспознанных строк вместо неверного строкового сравнения.
+KEY_EXPRESSIONS = {
+    'day_key': "CAST(strftime('%Y%m%d', {column}) AS INTEGER)",
+    'month_key': "CAST(strftime('%Y%m', {column}) AS INTEGER)",
+}
+
+# Периоды фильтров дашборда и отчетов: число месяцев назад от текущей даты
+PERIOD_MONTHS = {
+    'month': 1,
+    'last_month': 1,
+    'quarter': 3,
+    'last_quarter': 3,
+    'year': 12,
+    'last_year': 12,
+}
+
+
+def _table_columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()}
+
+
+def _table_indexes(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA index_list({table})").fetchall()}
+
+
+def key_expression(key, column='date'):
+    """Выражение ключа (day_key, month_key) над столбцом даты - как в индексе"""
+    return KEY_EXPRESSIONS[key].format(column=column)
+
+
+def ensure_date_keys(conn):
+    """Создание индексов по выражениям day_key/month_key.
+
+    Ключи хранятся только в индексах, набор столбцов таблиц не меняется;
+    условия period_filter записаны тем же выражением и идут по индексу.
+    Возвращает список созданных индексов.
+    """
+    created = []
+    for table, date_column in DATE_KEY_TABLES.items():
+        if not conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone():
+            continue
+        columns = _table_columns(conn, table)
+        if date_column not in columns:
+            continue
+        indexes = _table_indexes(conn, table)
+        for key in KEY_EXPRESSIONS:
+            index = f"idx_{table}_{key}"
+            if index not in indexes:
+                conn.execute(f"CREATE INDEX {index} ON {table}({key_expression(key, date_column)})")
+                created.append(index)
+    conn.commit()
+    return created
+
+
+def has_date_keys(conn, table):
+    """Есть ли у таблицы индексы ключей дня и месяца"""
+    try:
+        indexes = _table_indexes(conn, table)
+    except sqlite3.Error:
+        return False
+    return all(f"idx_{table}_{key}" in indexes for key in KEY_EXPRESSIONS)
+
+
+def _as_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def day_key(value):
+    """Ключ дня ГГГГММДД для даты, datetime или строки 'ГГГГ-ММ-ДД...'"""
+    value = _as_date(value)
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+def today():
+    """Текущая дата по UTC - так же, как date('now') в SQLite"""
+    return datetime.now(timezone.utc).date()
+
+
+def shift_months(value, months):
+    """Сдвиг даты на months месяцев с переносом лишних дней, как date(..., '-N months') в SQLite"""
+    value = _as_date(value)
+    index = value.year * 12 + value.month - 1 + months
+    year, month = divmod(index, 12)
+    month += 1
+    last_day = calendar.monthrange(year, month)[1]
+    if value.day <= last_day:
+        return date(year, month, value.day)
+    return date(year, month, last_day) + timedelta(days=value.day - last_day)
+
+
+def period_start(period, current=None):
+    """Первый день периода ('month', 'last_quarter', 'year', ...) или None"""
+    months = PERIOD_MONTHS.get(period)
+    if months is None:
+        return None
+    return shift_months(current or today(), -months)
+
+
+def period_filter(period, use_keys=True, current=None):
+    """Условие по периоду с параметрами: (SQL, параметры) или ('', []).
+
+    С ключами - сравнение целого ключа дня по индексу выражения, без них
+    (старый файл БД, где индексы не удалось создать) - сравнение строки
+    даты с 'ГГГГ-ММ-ДД'.
+    """
+    start = period_start(period, current)
+    if start is None:
+        return '', []
+    if use_keys:
+        return f"{key_expression('day_key')} >= ?", [day_key(start)]
+    return "date >= ?", [start.isoformat()]
+
+
+def period_condition(period, use_keys=True, current=None):
+    """То же условие с подставленной границей - для SQL, собираемого из строк"""
+    start = period_start(period, current)
+    if start is None:
+        return ''
+    if use_keys:
+        return f"{key_expression('day_key')} >= {day_key(start)}"
+    return f"date >= '{start.isoformat()}'"
+
+
+if __name__ == '__main__':
+    # python -m database.date_keys [путь к БД]
+    import sys
+    from database.connection import SQLiteProfile, connect, database_path
+
+    path = sys.argv[1] if len(sys.argv) > 1 else database_path()
+    conn = connect(path, SQLiteProfile.from_env().for_writes())
+    created = ensure_date_keys(conn)
+    print(f"✅ Индексы ключей дат: {', '.join(created) if created else 'уже созданы'}")
+    conn.close()
@@ -0,0 +1,484 @@
+import atexit
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from database.query_cache import normalize_sql
+from database.query_guard import QueryBudget, QueryBudgetExceeded
+from database.sql_shape import parse_select, split_top_level, strip_qualifiers
+
+
+_USING_INDEX_RE = re.compile(r'USING (?:COVERING )?INDEX ([A-Za-z_][A-Za-z0-9_]*)')
+_RANGE_OPERATORS = ('>', '>=', '<', '<=')
+
+# Таблицы, индексы которых ведет само приложение (rollup)
+_MANAGED_PREFIXES = ('production_rollup_', 'sqlite_')
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
+
+
+def _json_params(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: _json_value(value) for key, value in params.items()}
+    return [_json_value(value) for value in params]
+
+
+class QueryLog:
+    """Журнал выполненных запросов: число вызовов и время по нормализованному SQL.
+
+    Журнал хранится в памяти. Если задан файл (QUERY_LOG_FILE), фоновый
+    поток периодически сохраняет его в JSON, чтобы советник индексов мог
+    работать отдельно от приложения (CLI). Без файла журнал только в памяти.
+    """
+
+    def __init__(self, path=None, max_entries=500, flush_every=50):
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self._entries = {}
+        self._dirty = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._flush = threading.Event()
+        self._thread = None
+        if path:
+            self.load()
+            atexit.register(self.save)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv('QUERY_LOG_FILE') or None,
+            max_entries=int(os.getenv('QUERY_LOG_MAX_ENTRIES', '500')),
+            flush_every=int(os.getenv('QUERY_LOG_FLUSH_EVERY', '50'))
+        )
+
+    def record(self, sql, params, elapsed_ms):
+        """Учет одного выполнения запроса"""
+        sql = normalize_sql(sql)
+        with self._lock:
+            entry = self._entries.get(sql)
+            if entry is None:
+                entry = self._entries[sql] = {'sql': sql, 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            entry['calls'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            # Параметры последнего вызова нужны для EXPLAIN QUERY PLAN
+            entry['params'] = _json_params(params)
+            if len(self._entries) > self.max_entries:
+                self._evict()
+            self._dirty += 1
+            flush = self.path and self._dirty >= self.flush_every
+        if flush:
+            # Запись файла - в фоновом потоке, запрос ее не ждет
+            self._start()
+            self._flush.set()
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='query-log', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            self._flush.wait()
+            self._flush.clear()
+            self.save()
+
+    def _evict(self):
+        # Вытесняем запросы с наименьшим суммарным временем
+        for sql, _ in sorted(self._entries.items(), key=lambda item: item[1]['total_ms'])[:len(self._entries) - self.max_entries]:
+            del self._entries[sql]
+
+    def entries(self, top=None):
+        """Записи журнала по убыванию суммарного времени"""
+        with self._lock:
+            entries = sorted((dict(entry) for entry in self._entries.values()), key=lambda entry: -entry['total_ms'])
+        return entries[:top] if top else entries
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Не удалось прочитать журнал запросов {self.path}: {e}")
+            return
+        with self._lock:
+            for entry in entries:
+                self._entries[entry['sql']] = entry
+
+    def save(self):
+        """Атомарная запись журнала в файл"""
+        if not self.path:
+            return
+        # Фоновый поток и atexit не должны подменить новый файл более старым содержимым
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                content = json.dumps(list(self._entries.values()), ensure_ascii=False, indent=1)
+                self._dirty = 0
+            directory = os.path.dirname(os.path.abspath(self.path))
+            try:
+                fd, tmp_path = tempfile.mkstemp(prefix='.query-log-', suffix='.json', dir=directory)
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"⚠️ Не удалось сохранить журнал запросов: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'statements': len(self._entries),
+                'calls': sum(entry['calls'] for entry in self._entries.values()),
+                'path': self.path,
+            }
+
+
+class IndexRecommendation:
+    """Предлагаемый индекс и его оценка на запросах журнала"""
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = tuple(columns)
+        self.queries = []
+        self.calls = 0
+        self.before_ms = 0.0
+        self.after_ms = 0.0
+        self.used_by = 0
+
+    @property
+    def name(self):
+        return f"idx_advisor_{self.table}_{'_'.join(self.columns)}"
+
+    @property
+    def sql(self):
+        return f"CREATE INDEX IF NOT EXISTS {self.name} ON {self.table}({', '.join(self.columns)})"
+
+    @property
+    def benefit_ms(self):
+        """Ожидаемая экономия времени на всех вызовах запросов из журнала"""
+        return round(self.before_ms - self.after_ms, 2)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'table': self.table,
+            'columns': list(self.columns),
+            'sql': self.sql,
+            'queries': len(self.queries),
+            'calls': self.calls,
+            'used_by': self.used_by,
+            'before_ms': round(self.before_ms, 2),
+            'after_ms': round(self.after_ms, 2),
+            'benefit_ms': self.benefit_ms,
+        }
+
+
+class IndexAdvisor:
+    """Советник индексов по журналу запросов.
+
+    Для самых тяжелых запросов строит кандидатов: сначала столбцы с
+    равенством, затем один столбец диапазона или группировки и, если
+    хватает места, остальные столбцы запроса для покрывающего индекса.
+    Каждый кандидат создается в транзакции, которая затем откатывается:
+    по EXPLAIN QUERY PLAN и повторному замеру времени видно, использует
+    ли его SQLite и сколько он экономит.
+    """
+
+    def __init__(self, conn, max_columns=4, min_table_rows=1000, timing_runs=3):
+        self.conn = conn
+        self.max_columns = max_columns
+        self.min_table_rows = min_table_rows
+        self.timing_runs = timing_runs
+        self.budget = QueryBudget(max_seconds=5.0)
+        self._columns = {}
+
+    def recommend(self, entries):
+        """Кандидаты с положительной оценкой по убыванию выигрыша"""
+        candidates = {}
+        for entry in entries:
+            for table, columns in self._candidates(entry['sql']):
+                if self._covered_by_existing(table, columns):
+                    continue
+                key = (table, columns)
+                if key not in candidates:
+                    candidates[key] = IndexRecommendation(table, columns)
+                candidates[key].queries.append(entry)
+
+        recommendations = []
+        for recommendation in candidates.values():
+            try:
+                self._evaluate(recommendation)
+            except (sqlite3.Error, QueryBudgetExceeded) as e:
+                print(f"⚠️ Не удалось оценить индекс {recommendation.name}: {e}")
+                continue
+            if recommendation.used_by and recommendation.benefit_ms > 0:
+                recommendations.append(recommendation)
+        # Индекс, столбцы которого - начало другого рекомендованного, не нужен:
+        # более длинный индекс обслуживает те же условия
+        recommendations = [
+            recommendation for recommendation in recommendations
+            if not any(
+                other.table == recommendation.table and len(other.columns) > len(recommendation.columns)
+                and other.columns[:len(recommendation.columns)] == recommendation.columns
+                for other in recommendations
+            )
+        ]
+        return sorted(recommendations, key=lambda recommendation: -recommendation.benefit_ms)
+
+    def index_usage(self, entries):
+        """Пользовательские индексы и число запросов журнала, в планах которых они встречаются"""
+        usage = {}
+        for table in self._tables():
+            for row in self.conn.execute(f"PRAGMA index_list({table})").fetchall():
+                name, origin = row[1], row[3]
+                if origin == 'c':
+                    usage[name] = {'name': name, 'table': table, 'queries': 0, 'calls': 0}
+        for entry in entries:
+            for name in set(self._plan_indexes(entry)):
+                if name in usage:
+                    usage[name]['queries'] += 1
+                    usage[name]['calls'] += entry['calls']
+        return sorted(usage.values(), key=lambda item: (item['calls'], item['name']))
+
+    def unused_indexes(self, entries):
+        return [item for item in self.index_usage(entries) if not item['queries']]
+
+    def _tables(self):
+        return [
+            row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()
+            if not row[0].startswith(_MANAGED_PREFIXES)
+        ]
+
+    def _table_columns(self, table):
+        if table not in self._columns:
+            self._columns[table] = {
+                row[1].lower() for row in self.conn.execute(f"PRAGMA table_xinfo({table})").fetchall()
+            }
+        return self._columns[table]
+
+    def _candidates(self, sql):
+        """Кандидаты (таблица, столбцы) для простого SELECT по одной таблице"""
+        shape = parse_select(sql)
+        if shape is None or shape.table.lower().startswith(_MANAGED_PREFIXES):
+            return []
+        table = shape.table.lower()
+        columns = self._table_columns(table)
+        if not columns or self._row_count(table) < self.min_table_rows:
+            return []
+        qualifiers = [shape.table, shape.table_alias]
+
+        equality, ranges, filters = [], [], []
+        where = strip_qualifiers(shape.where or [], qualifiers)
+        if not any(token.is_keyword('or') for token in where):
+            for part in split_top_level(where, 'and'):
+                kind, column = self._classify(part, columns)
+                if kind == 'eq':
+                    equality.append(column)
+                elif kind == 'range':
+                    ranges.append(column)
+                filters.extend(self._referenced(part, columns))
+
+        grouping = []
+        for expression in shape.group_by:
+            stripped = strip_qualifiers(expression, qualifiers)
+            if len(stripped) == 1 and stripped[0].lower in columns:
+                grouping.append(stripped[0].lower)
+        ordering = []
+        for expression, _ in shape.order_by:
+            stripped = strip_qualifiers(expression, qualifiers)
+            if len(stripped) == 1 and stripped[0].lower in columns:
+                ordering.append(stripped[0].lower)
+
+        used = []
+        for tokens, _ in shape.items:
+            used.extend(self._referenced(strip_qualifiers(tokens, qualifiers), columns))
+        if any(tokens[0].value == '*' for tokens, _ in shape.items if len(tokens) == 1):
+            used = None
+
+        key = _unique(equality)
+        if ranges:
+            key = _unique(key + ranges[:1])
+        elif grouping:
+            key = _unique(key + grouping)
+        elif ordering and shape.limit:
+            key = _unique(key + ordering[:1])
+        if not key:
+            return []
+
+        candidates = [tuple(key[:self.max_columns])]
+        if used is not None:
+            covering = _unique(key + grouping + filters + used)
+            if len(covering) > len(key) and len(covering) <= self.max_columns:
+                candidates.append(tuple(covering))
+        return [(table, columns_) for columns_ in candidates]
+
+    def _classify(self, part, columns):
+        """Вид условия: ('eq', столбец), ('range', столбец) или (None, None)"""
+        if len(part) >= 3 and part[0].kind == 'ident' and part[0].lower in columns:
+            column, operator = part[0].lower, part[1]
+            rest = part[2:]
+            constant = all(token.kind in ('string', 'number', 'param', 'punct', 'op') or token.is_keyword('null')
+                           or (token.kind == 'ident' and token.lower == 'date') for token in rest)
+            if operator.value in ('=', '==') and constant:
+                return 'eq', column
+            if operator.is_keyword('in') and constant:
+                return 'eq', column
+            if operator.is_keyword('is') and len(rest) == 1 and rest[0].is_keyword('null'):
+                return 'eq', column
+            if (operator.value in _RANGE_OPERATORS or operator.is_keyword('between')) and constant:
+                return 'range', column
+        return None, None
+
+    def _referenced(self, tokens, columns):
+        return [token.lower for token in tokens if token.kind == 'ident' and token.lower in columns]
+
+    def _row_count(self, table):
+        return self.conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()[0] or 0
+
+    def _covered_by_existing(self, table, columns):
+        for row in self.conn.execute(f"PRAGMA index_list({table})").fetchall():
+            existing = tuple(
+                info[2].lower() for info in self.conn.execute(f"PRAGMA index_info({row[1]})").fetchall()
+                if info[2]
+            )
+            if existing[:len(columns)] == tuple(columns):
+                return True
+        return False
+
+    def _plan(self, entry):
+        return [row[3] for row in self.conn.execute(f"EXPLAIN QUERY PLAN {entry['sql']}", entry.get('params') or ()).fetchall()]
+
+    def _plan_indexes(self, entry):
+        try:
+            plan = self._plan(entry)
+        except sqlite3.Error:
+            return []
+        return [match.group(1) for detail in plan for match in [_USING_INDEX_RE.search(detail)] if match]
+
+    def _time(self, entry):
+        """Лучшее время выполнения запроса из timing_runs попыток, мс"""
+        best = None
+        for _ in range(self.timing_runs):
+            started = time.perf_counter()
+            with self.budget.guard(self.conn):
+                self.conn.execute(entry['sql'], entry.get('params') or ()).fetchall()
+            elapsed = (time.perf_counter() - started) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def _evaluate(self, recommendation):
+        """Гипотетический индекс: создать, сравнить планы и время, откатить"""
+        before = {}
+        for entry in recommendation.queries:
+            before[entry['sql']] = self._time(entry)
+
+        self.conn.execute("BEGIN")
+        try:
+            self.conn.execute(recommendation.sql)
+            for entry in recommendation.queries:
+                if recommendation.name not in self._plan_indexes(entry):
+                    continue
+                after = self._time(entry)
+                recommendation.used_by += 1
+                recommendation.calls += entry['calls']
+                recommendation.before_ms += before[entry['sql']] * entry['calls']
+                recommendation.after_ms += after * entry['calls']
+        finally:
+            self.conn.rollback()
+
+    def apply(self, recommendations):
+        """Создание рекомендованных индексов и обновление статистики планировщика"""
+        for recommendation in recommendations:
+            self.conn.execute(recommendation.sql)
+            print(f"✅ Создан индекс {recommendation.name}")
+        self.conn.commit()
+        self.conn.execute("PRAGMA optimize")
+
+    def drop(self, name):
+        self.conn.execute(f"DROP INDEX IF EXISTS {name}")
+        self.conn.commit()
+        print(f"🗑️ Индекс {name} удален")
+
+
+def _unique(columns):
+    result = []
+    for column in columns:
+        if column not in result:
+            result.append(column)
+    return result
+
+
+def _print_report(advisor, entries):
+    recommendations = advisor.recommend(entries)
+    print(f"📒 Запросов в журнале: {len(entries)}")
+    print("\n💡 Рекомендуемые индексы:")
+    if not recommendations:
+        print("  нет")
+    for recommendation in recommendations:
+        info = recommendation.to_dict()
+        print(f"  {info['sql']}")
+        print(f"     запросов: {info['used_by']}, вызовов: {info['calls']}, "
+              f"{info['before_ms']} мс -> {info['after_ms']} мс (выигрыш {info['benefit_ms']} мс)")
+    print("\n💤 Неиспользуемые индексы:")
+    unused = advisor.unused_indexes(entries)
+    if not unused:
+        print("  нет")
+    for item in unused:
+        print(f"  {item['name']} ON {item['table']}")
+    return recommendations
+
+
+if __name__ == '__main__':
+    # python -m database.index_advisor [report|apply [N]|drop ИМЯ|unused] [путь к БД]
+    from database.connection import SQLiteProfile, connect, database_path
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'report'
+    rest = sys.argv[2:]
+    argument = None
+    if rest and (command == 'drop' or (command == 'apply' and rest[0].isdigit())):
+        argument = rest.pop(0)
+    path = rest[0] if rest else database_path()
+
+    log_path = os.getenv('QUERY_LOG_FILE')
+    if not log_path and command != 'drop':
+        print("❌ Журнал запросов не задан: запустите приложение и советник с QUERY_LOG_FILE=путь.json")
+        sys.exit(1)
+    log = QueryLog(log_path)
+    entries = log.entries(top=int(os.getenv('INDEX_ADVISOR_TOP', '20')))
+    conn = connect(path, SQLiteProfile.from_env().for_writes(), isolation_level=None)
+    advisor = IndexAdvisor(conn, max_columns=int(os.getenv('INDEX_ADVISOR_MAX_COLUMNS', '4')))
+    try:
+        if command == 'apply':
+            recommendations = advisor.recommend(entries)
+            advisor.apply(recommendations[:int(argument)] if argument else recommendations)
+        elif command == 'drop':
+            if not argument:
+                print("❌ Укажите имя индекса: python -m database.index_advisor drop ИМЯ")
+            else:
+                advisor.drop(argument)
+        elif command == 'unused':
+            for item in advisor.index_usage(entries):
+                print(f"  {item['name']:45} {item['table']:20} запросов: {item['queries']}, вызовов: {item['calls']}")
+        else:
+            _print_report(advisor, entries)
+    finally:
+        conn.close()
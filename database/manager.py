@@ -3,19 +3,262 @@ import pandas as pd
 from sqlalchemy import create_engine, inspect, text
 import json
 import os
+import tempfile
+import threading
+import time
 import numpy as np
 from dotenv import load_dotenv
 
+from database.connection import SQLiteProfile, connect, database_path, prepare_database
+from database.pool import ConnectionPool
+from database.change_tracker import ChangeTracker
+from database.column_store import ProductionColumnStore
+from database.index_advisor import QueryLog
+from database.partitions import ProductionPartitions
+from database.date_keys import DATE_KEY_TABLES, ensure_date_keys, has_date_keys
+from database.query_guard import QueryBudget, QueryBudgetExceeded, QueryPlanGuard, QueryPlanRejected
+from database.replica import SnapshotReplica
+from database.query_cache import QueryResultCache, normalize_sql, referenced_tables, is_read_query
+from database.rollups import ProductionRollups
+from database.sql_optimizer import SQLOptimizer
+from database.table_versions import TableVersions
+from database.result_handles import ResultHandle, ResultHandleRegistry
+from database.serialization import dataframe_to_rows
+
 load_dotenv()
 
 class DatabaseManager:
     def __init__(self, db_path=None):
         self.db_path = db_path or os.getenv('DATABASE_URL', 'sqlite:///rosatom_database.db')
-        self.engine = create_engine(self.db_path)
-        self.connection = self.engine.connect()
+        self.db_file = database_path(self.db_path)
+        
+        # Профиль SQLite для аналитического чтения: WAL, mmap, кэш страниц, только чтение
+        self.profile = SQLiteProfile.from_env()
+        self.journal_mode = prepare_database(self.db_file, self.profile)
+        self.engine = create_engine(self.db_path, creator=lambda: connect(self.db_file, self.profile))
+        
+        # Пул соединений: по соединению на поток вместо одного общего
+        self.pool = ConnectionPool(
+            self.db_file,
+            max_size=int(os.getenv('DB_POOL_SIZE', '8')),
+            timeout=float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            profile=self.profile
+        )
+        
+        # Бюджет выполнения и проверка плана для произвольных запросов
+        self.query_budget = QueryBudget.from_env()
+        self.plan_guard = QueryPlanGuard.from_env()
+        
+        # Переписывание сгенерированных запросов в более дешевые формы
+        self.sql_optimizer = SQLOptimizer.from_env()
+        
+        # Кэш результатов запросов, инвалидируется по версии данных
+        self.change_tracker = ChangeTracker()
+        self.result_cache = QueryResultCache(
+            max_entries=int(os.getenv('QUERY_CACHE_MAX_ENTRIES', '256')),
+            max_bytes=int(float(os.getenv('QUERY_CACHE_MAX_MB', '64')) * 1024 * 1024),
+            enabled=os.getenv('QUERY_CACHE_ENABLED', '1') != '0'
+        )
+        
+        # Журнал выполненных запросов для советника индексов
+        self.query_log = QueryLog.from_env()
+        
+        # Открытые результаты для постраничной выдачи
+        self.result_handles = ResultHandleRegistry(
+            ttl=int(os.getenv('RESULT_HANDLE_TTL', '300')),
+            max_handles=int(os.getenv('RESULT_HANDLE_MAX', '32'))
+        )
+        
+        # Целочисленные ключи дня и месяца для индексных фильтров по периоду
+        self.date_keys_ready = False
+        self._setup_date_keys()
+        
+        # Архивные разделы production по годам; запросы читают только нужные разделы
+        self.partitions = ProductionPartitions.from_env(base_directory=os.path.dirname(os.path.abspath(self.db_file)))
+        
+        # Агрегаты production по дням, неделям и месяцам с переписыванием запросов
+        self.rollups = ProductionRollups(enabled=os.getenv('ROLLUPS_ENABLED', '1') != '0')
+        self._setup_rollups()
+        
+        # Постоянные версии данных таблиц: по ним строятся ETag ответов API
+        self.table_versions = TableVersions(enabled=os.getenv('HTTP_CACHE_ENABLED', '1') != '0')
+        self._setup_table_versions()
+        
+        # Реплика: чтение API идет из снимка основной базы, запись - в основную базу
+        self.replica = SnapshotReplica.from_env(self.db_file, on_swap=self._swap_snapshot)
+        if self.replica.enabled:
+            try:
+                self.replica.start()
+            except Exception as e:
+                print(f"⚠️ Реплика не запущена, чтение идет из основной базы: {e}")
+        
+        # Колоночный снимок production в памяти для агрегатов; загружается в фоне
+        self.column_store = ProductionColumnStore(
+            self.change_tracker,
+            self.rollups,
+            self.partitions,
+            enabled=os.getenv('COLUMN_STORE_ENABLED', '1') != '0'
+        )
+        if self.column_store.enabled and os.path.exists(self.db_file):
+            threading.Thread(target=self._load_column_store, name='column-store', daemon=True).start()
+        
+        # Кэш схемы: перестраивается только при изменении PRAGMA schema_version
+        self.schema_file = os.getenv('SCHEMA_FILE', 'rosatom_schema.json')
+        self._schema_lock = threading.Lock()
+        self._schema_cache = None
+        self._schema_version = None
+        self._schema_file_content = None
+    
+    def _setup_date_keys(self):
+        """Создание индексов ключей дат day_key/month_key через соединение с правом записи"""
+        if not os.path.exists(self.db_file):
+            return
+        try:
+            conn = self.write_connection()
+            try:
+                created = ensure_date_keys(conn)
+            finally:
+                conn.close()
+            if created:
+                print(f"📅 Созданы индексы ключей дат: {', '.join(created)}")
+        except sqlite3.Error as e:
+            print(f"⚠️ Не удалось создать индексы ключей дат: {e}")
+        with self.pool.connection() as conn:
+            tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            self.date_keys_ready = all(has_date_keys(conn, table) for table in DATE_KEY_TABLES if table in tables)
+    
+    def _setup_rollups(self):
+        """Создание rollup через соединение с правом записи"""
+        if not self.rollups.enabled or not os.path.exists(self.db_file):
+            return
+        try:
+            conn = self.write_connection()
+            try:
+                # Пустые rollup заполняются по всей истории, включая архивные разделы
+                self.rollups.ensure(conn, source=self.partitions.source(conn))
+            finally:
+                conn.close()
+        except Exception as e:
+            # Например, файл БД доступен только для чтения - используем rollup, если они уже есть
+            print(f"⚠️ Не удалось подготовить rollup: {e}")
+            with self.pool.connection() as conn:
+                self.rollups.ready = self.rollups.is_installed(conn)
+    
+    def _setup_table_versions(self):
+        """Создание таблицы версий и триггеров через соединение с правом записи"""
+        if not self.table_versions.enabled or not os.path.exists(self.db_file):
+            return
+        try:
+            conn = self.write_connection()
+            try:
+                added = self.table_versions.ensure(conn)
+            finally:
+                conn.close()
+            if added:
+                print(f"🏷️ Версии данных ведутся для таблиц: {', '.join(added)}")
+        except Exception as e:
+            # База только для чтения - ETag строятся, только если версии уже ведутся
+            print(f"⚠️ Не удалось подготовить версии таблиц: {e}")
+            with self.pool.connection() as conn:
+                self.table_versions.ready = self.table_versions.is_installed(conn)
+    
+    def _swap_snapshot(self, path):
+        """Переключение пула на новый снимок реплики"""
+        first = self.pool.database != path
+        self.pool.retarget(path, immutable=True)
+        if first:
+            print(f"📸 Чтение переключено на снимок {path}")
+    
+    def _load_column_store(self):
+        try:
+            with self.pool.connection() as conn:
+                self.column_store.load(conn)
+            stats = self.column_store.stats()
+            print(f"🧊 Колоночный снимок production: {stats['rows']} строк за {stats['load_ms']} мс")
+        except Exception as e:
+            print(f"⚠️ Не удалось загрузить колоночный снимок: {e}")
+    
+    def _read_sql(self, conn, sql_query, params=None):
+        """Чтение результата в DataFrame: агрегаты production - из колоночного снимка или rollup"""
+        try:
+            df = self.column_store.execute(conn, sql_query, params)
+        except Exception as e:
+            print(f"⚠️ Колоночный снимок не ответил на запрос: {e}")
+            df = None
+        if df is not None:
+            return df
+        rewritten = self.rollups.rewrite(sql_query)
+        if rewritten is not None:
+            try:
+                return self._timed_read(conn, rewritten, params)
+            except QueryBudgetExceeded:
+                raise
+            except Exception as e:
+                print(f"⚠️ Запрос к rollup не выполнен, используем production: {e}")
+                self.rollups.record_fallback()
+        return self._timed_read(conn, sql_query, params)
+    
+    def _timed_read(self, conn, sql_query, params=None):
+        """pd.read_sql_query по нужным разделам production с записью SQL в журнал запросов"""
+        started = time.perf_counter()
+        df = pd.read_sql_query(self.partitions.route(conn, sql_query, params), conn, params=params)
+        self.query_log.record(sql_query, params, (time.perf_counter() - started) * 1000)
+        return df
+    
+    def write_connection(self):
+        """Отдельное соединение с правом записи (вне пула только для чтения)"""
+        return connect(self.db_file, self.profile.for_writes())
+    
+    def get_sqlite_settings(self):
+        """Профиль SQLite и фактические значения PRAGMA на соединении пула"""
+        with self.pool.connection() as conn:
+            effective = {
+                name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+                for name in ('journal_mode', 'mmap_size', 'cache_size', 'temp_store', 'query_only', 'busy_timeout')
+            }
+        return {'profile': self.profile.to_dict(), 'effective': effective}
+    
+    def get_schema_version(self):
+        """Текущая версия схемы SQLite (меняется при любом DDL)"""
+        with self.pool.connection() as conn:
+            return conn.execute("PRAGMA schema_version").fetchone()[0]
+    
+    def get_table_versions(self, tables=None):
+        """Эпоха и версии данных таблиц (None - все) с того же источника, что и чтение API"""
+        with self.pool.connection() as conn:
+            return self.table_versions.read(conn, tables)
+    
+    def get_data_version(self, tables=None):
+        """Версия схемы и данных таблиц (None - все) для кэшей уровня приложения.
+        
+        Если постоянные версии таблиц не ведутся, используется поколение
+        данных процесса - оно меняется при любом коммите.
+        """
+        with self.pool.connection() as conn:
+            schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+            versions = self.table_versions.read(conn, tables)
+            if versions is None:
+                self.change_tracker.observe(conn)
+                versions = self.change_tracker.version(tables or ())
+            return schema_version, versions
     
     def get_database_schema(self):
-        """Получение схемы базы данных с обработкой NaN значений"""
+        """Получение схемы базы данных из кэша с проверкой версии схемы"""
+        version = self.get_schema_version()
+        if self._schema_cache is not None and self._schema_version == version:
+            return self._schema_cache
+        
+        with self._schema_lock:
+            if self._schema_cache is None or self._schema_version != version:
+                print(f"📋 Обновление кэша схемы (schema_version={version})")
+                schema = self._build_database_schema()
+                self._save_schema_file(schema)
+                self._schema_cache = schema
+                self._schema_version = version
+            return self._schema_cache
+    
+    def _build_database_schema(self):
+        """Построение схемы базы данных с обработкой NaN значений"""
         inspector = inspect(self.engine)
         
         schema = {
@@ -81,20 +324,45 @@ class DatabaseManager:
                 print(f"Ошибка при получении примеров данных для таблицы {table}: {e}")
                 schema['tables'][table]['sample_data'] = []
         
-        # Сохраняем схему в JSON файл с кастомным сериализатором
+        return schema
+    
+    def _save_schema_file(self, schema):
+        """Атомарная запись схемы в JSON файл, только если содержимое изменилось"""
         try:
-            with open('rosatom_schema.json', 'w', encoding='utf-8') as f:
-                # Используем кастомный сериализатор для обработки NaN
-                json.dump(schema, f, indent=2, ensure_ascii=False, default=self._json_serializer)
+            content = json.dumps(schema, indent=2, ensure_ascii=False, default=self._json_serializer)
         except Exception as e:
-            print(f"Ошибка сохранения схемы в JSON: {e}")
+            print(f"Ошибка сериализации схемы в JSON: {e}")
             # Пробуем сохранить без sample_data
-            for table in schema['tables']:
-                schema['tables'][table]['sample_data'] = []
-            with open('rosatom_schema.json', 'w', encoding='utf-8') as f:
-                json.dump(schema, f, indent=2, ensure_ascii=False, default=self._json_serializer)
+            stripped = {**schema, 'tables': {
+                name: {**info, 'sample_data': []} for name, info in schema['tables'].items()
+            }}
+            content = json.dumps(stripped, indent=2, ensure_ascii=False, default=self._json_serializer)
         
-        return schema
+        if self._schema_file_content is None and os.path.exists(self.schema_file):
+            try:
+                with open(self.schema_file, 'r', encoding='utf-8') as f:
+                    self._schema_file_content = f.read()
+            except OSError:
+                self._schema_file_content = None
+        
+        if content == self._schema_file_content:
+            return
+        
+        # Пишем во временный файл рядом и подменяем одним rename
+        directory = os.path.dirname(os.path.abspath(self.schema_file))
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix='.schema-', suffix='.json', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(content)
+                os.chmod(tmp_path, 0o644)
+                os.replace(tmp_path, self.schema_file)
+            except Exception:
+                os.unlink(tmp_path)
+                raise
+            self._schema_file_content = content
+        except Exception as e:
+            print(f"Ошибка сохранения схемы в JSON: {e}")
     
     def _json_serializer(self, obj):
         """Кастомный сериализатор для JSON, обрабатывающий специальные типы"""
@@ -118,27 +386,210 @@ class DatabaseManager:
         else:
             raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
     
-    def execute_query(self, sql_query):
-        """Выполнение SQL запроса"""
+    def execute_query(self, sql_query, params=None, use_cache=True, budget=None):
+        """Выполнение SQL запроса с параметрами (use_cache=False - в обход кэша результатов).
+        
+        Значения фильтров передаются через params (? или :name), а не
+        подставляются в текст, поэтому текст запроса не меняется и
+        подготовленное выражение берется из кэша соединения.
+        budget заменяет общий бюджет выполнения (например, таймаут виджета).
+        """
         try:
             # Убираем потенциально опасные символы
-            sql_query = sql_query.replace(';', '').strip()
+            sql_query = normalize_sql(sql_query.replace(';', ''))
+            
+            cache_key = None
+            if self.result_cache.enabled and is_read_query(sql_query):
+                if use_cache:
+                    cache_key = self.result_cache.make_key(sql_query, params)
+                else:
+                    self.result_cache.record_bypass()
             
-            # Выполняем запрос через pandas для удобства
-            df = pd.read_sql(sql_query, self.engine)
+            # Выполняем запрос через pandas на соединении из пула
+            with self.pool.connection() as conn:
+                if cache_key is not None:
+                    self.change_tracker.observe(conn)
+                    version = self.change_tracker.version(referenced_tables(sql_query))
+                    cached = self.result_cache.get(cache_key, version)
+                    if cached is not None:
+                        return cached.copy()
+                
+                with (budget or self.query_budget).guard(conn):
+                    df = self._read_sql(conn, sql_query, params)
             
             # Обрабатываем NaN значения в результате
             df = df.where(pd.notnull(df), None)
             
+            if cache_key is not None:
+                size = int(df.memory_usage(index=True, deep=True).sum())
+                self.result_cache.put(cache_key, df.copy(), version, size)
+            
             return df
             
+        except QueryBudgetExceeded:
+            raise
+        except Exception as e:
+            raise Exception(f"Ошибка выполнения запроса: {str(e)}")
+    
+    def execute_batch(self, queries, check_plan=True):
+        """Выполнение набора именованных запросов в одной транзакции чтения.
+        
+        queries - словарь {имя: (sql, params)}. Все запросы выполняются на
+        одном соединении внутри BEGIN ... ROLLBACK и видят один снимок данных.
+        Ошибка одного запроса не прерывает остальные. Возвращает словарь
+        {имя: {'df', 'sql', 'auto_limit', 'error'}}.
+        """
+        results = {}
+        with self.pool.connection() as conn:
+            conn.execute("BEGIN")
+            try:
+                # Первое чтение фиксирует снимок WAL для всех запросов пакета
+                conn.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+                for name, (sql_query, params) in queries.items():
+                    result = {'df': None, 'sql': sql_query, 'auto_limit': None, 'error': None}
+                    try:
+                        # Вложенные вызовы берут из пула то же соединение текущего потока
+                        if check_plan:
+                            plan = self.check_query_plan(sql_query, params)
+                            result['sql'], result['auto_limit'] = plan.sql, plan.auto_limit
+                        result['df'] = self.execute_query(result['sql'], params)
+                    except Exception as e:
+                        result['error'] = e
+                    results[name] = result
+            finally:
+                conn.rollback()
+        return results
+    
+    def optimize_query(self, sql_query):
+        """Оптимизация сгенерированного SQL перед проверкой плана и выполнением.
+        
+        Возвращает Optimization с SQL для выполнения и списком примененных правил.
+        """
+        return self.sql_optimizer.optimize(normalize_sql(sql_query.replace(';', '')))
+    
+    def check_query_plan(self, sql_query, params=None):
+        """Предварительная проверка плана запроса (EXPLAIN QUERY PLAN).
+        
+        Возвращает PlanCheck с SQL для выполнения - исходным или с
+        добавленным LIMIT. Слишком дорогой план вызывает QueryPlanRejected.
+        """
+        sql_query = normalize_sql(sql_query.replace(';', ''))
+        with self.pool.connection() as conn:
+            try:
+                routed = self.partitions.route(conn, sql_query, params)
+                return self.plan_guard.check(conn, sql_query, params, explain_sql=routed)
+            except QueryPlanRejected:
+                raise
+            except Exception as e:
+                raise Exception(f"Ошибка выполнения запроса: {str(e)}")
+    
+    def iter_query(self, sql_query, params=None, chunk_size=500):
+        """Потоковое выполнение SELECT через курсор.
+        
+        Генератор возвращает пары (колонки, строки) порциями по chunk_size
+        строк, поэтому в памяти никогда не находится весь результат.
+        Первая порция выдается всегда, даже для пустого результата.
+        """
+        sql_query = normalize_sql(sql_query.replace(';', ''))
+        
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                try:
+                    started = time.perf_counter()
+                    with self.query_budget.guard(conn):
+                        cursor.execute(self.partitions.route(conn, sql_query, params), params or ())
+                    self.query_log.record(sql_query, params, (time.perf_counter() - started) * 1000)
+                except QueryBudgetExceeded:
+                    raise
+                except Exception as e:
+                    raise Exception(f"Ошибка выполнения запроса: {str(e)}")
+                
+                columns = [col[0] for col in cursor.description or []]
+                with self.query_budget.guard(conn):
+                    rows = cursor.fetchmany(chunk_size)
+                yield columns, rows
+                
+                # Бюджет действует на каждую порцию: медленный клиент не прерывает выдачу
+                while len(rows) == chunk_size:
+                    with self.query_budget.guard(conn):
+                        rows = cursor.fetchmany(chunk_size)
+                    if rows:
+                        yield columns, rows
+            finally:
+                cursor.close()
+    
+    def open_result(self, sql_query, params=None, page_size=100):
+        """Выполнение SELECT с постраничной выдачей.
+        
+        Возвращает первую страницу и дескриптор результата. Курсор остается
+        открытым на отдельном соединении до конца чтения или истечения TTL,
+        следующие страницы продолжают чтение с того же места.
+        """
+        sql_query = normalize_sql(sql_query.replace(';', ''))
+        
+        conn = self.pool.connect()
+        try:
+            started = time.perf_counter()
+            with self.query_budget.guard(conn):
+                cursor = conn.execute(self.partitions.route(conn, sql_query, params), params or ())
+            self.query_log.record(sql_query, params, (time.perf_counter() - started) * 1000)
+        except QueryBudgetExceeded:
+            conn.close()
+            raise
         except Exception as e:
+            conn.close()
             raise Exception(f"Ошибка выполнения запроса: {str(e)}")
+        
+        def rows(count):
+            with self.query_budget.guard(conn):
+                return cursor.fetchmany(count)
+        
+        def close():
+            cursor.close()
+            conn.close()
+        
+        columns = [col[0] for col in cursor.description or []]
+        handle = ResultHandle(columns, rows, on_close=close)
+        return self._first_page(handle, page_size)
+    
+    def open_frame_result(self, df, page_size=100):
+        """Постраничная выдача уже полученного DataFrame"""
+        position = {'offset': 0}
+        
+        def rows(count):
+            page = df.iloc[position['offset']:position['offset'] + count]
+            position['offset'] += len(page)
+            return dataframe_to_rows(page)
+        
+        handle = ResultHandle(list(df.columns), rows, total_rows=len(df))
+        return self._first_page(handle, page_size)
+    
+    def _first_page(self, handle, page_size):
+        try:
+            rows, has_more = handle.fetch(page_size)
+        except Exception:
+            handle.close()
+            raise
+        if has_more:
+            self.result_handles.register(handle)
+        else:
+            handle.close()
+        return handle, rows, has_more
+    
+    def fetch_result(self, handle_id, page_size=100):
+        """Следующая страница открытого результата"""
+        return self.result_handles.fetch(handle_id, page_size)
+    
+    def invalidate(self, tables=None):
+        """Отметка изменения данных приложением (None - вся база)"""
+        self.change_tracker.mark_changed(tables)
     
     def get_table_data(self, table_name, limit=100):
         """Получение данных из таблицы"""
         try:
-            df = pd.read_sql(f"SELECT * FROM {table_name} LIMIT {limit}", self.engine)
+            with self.pool.connection() as conn:
+                df = pd.read_sql_query(f"SELECT * FROM {table_name} LIMIT {limit}", conn)
             # Обрабатываем NaN значения
             df = df.where(pd.notnull(df), None)
             return df
@@ -146,8 +597,10 @@ class DatabaseManager:
             raise Exception(f"Ошибка получения данных из таблицы {table_name}: {str(e)}")
     
     def close(self):
-        """Закрытие соединения с БД"""
-        if self.connection:
-            self.connection.close()
+        """Закрытие соединений с БД"""
+        if self.replica:
+            self.replica.stop()
+        if self.pool:
+            self.pool.close_all()
         if self.engine:
             self.engine.dispose()
\ No newline at end of file
@@ -0,0 +1,101 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from database.query_guard import QueryBudget
+
+
+class WidgetQuery:
+    """Запрос одного виджета дашборда.
+
+    transform получает DataFrame результата и возвращает данные виджета,
+    default отдается вместо данных, если запрос завершился ошибкой.
+    """
+
+    def __init__(self, name, sql, params=None, transform=None, default=None, timeout=None):
+        self.name = name
+        self.sql = sql
+        self.params = params
+        self.transform = transform
+        self.default = default
+        self.timeout = timeout
+
+
+class DashboardResult:
+    """Данные виджетов, ошибки и время выполнения каждого запроса"""
+
+    def __init__(self):
+        self.data = {}
+        self.errors = {}
+        self.timings = {}
+
+    @property
+    def partial(self):
+        return bool(self.errors)
+
+
+class DashboardExecutor:
+    """Параллельное выполнение запросов виджетов на ограниченном пуле потоков.
+
+    Каждый запрос выполняется один раз на соединении из пула чтения.
+    Таймаут виджета передается в бюджет запроса SQLite, поэтому медленный
+    запрос прерывается и освобождает поток и соединение. Ошибка одного
+    виджета не мешает остальным: вместо его данных отдается default.
+    """
+
+    def __init__(self, db_manager, max_workers=4, timeout=5.0):
+        self.db_manager = db_manager
+        self.max_workers = max(1, int(max_workers))
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='dashboard')
+
+    @classmethod
+    def from_env(cls, db_manager):
+        return cls(
+            db_manager,
+            max_workers=int(os.getenv('DASHBOARD_WORKERS', '4')),
+            timeout=float(os.getenv('DASHBOARD_WIDGET_TIMEOUT', '5'))
+        )
+
+    def run(self, widgets):
+        """Выполнение всех виджетов; время ответа - время самого медленного запроса"""
+        result = DashboardResult()
+        futures = {self._executor.submit(self._run_widget, widget): widget for widget in widgets}
+
+        # Запас сверх бюджета SQLite на ожидание свободного соединения и преобразование результата
+        longest = max((self._timeout(widget) for widget in widgets), default=self.timeout)
+        done, not_done = wait(futures, timeout=longest + 1.0)
+
+        for future, widget in futures.items():
+            if future in not_done:
+                future.cancel()
+                result.data[widget.name] = widget.default
+                result.errors[widget.name] = f"Превышено время ожидания виджета ({self._timeout(widget):g} с)"
+                continue
+            try:
+                result.data[widget.name], result.timings[widget.name] = future.result()
+            except Exception as e:
+                print(f"❌ Ошибка виджета {widget.name}: {e}")
+                result.data[widget.name] = widget.default
+                result.errors[widget.name] = str(e)
+        return result
+
+    def _run_widget(self, widget):
+        started = time.monotonic()
+        budget = QueryBudget(
+            max_vm_steps=self.db_manager.query_budget.max_vm_steps,
+            max_seconds=self._timeout(widget),
+            check_interval=self.db_manager.query_budget.check_interval
+        )
+        df = self.db_manager.execute_query(widget.sql, widget.params, budget=budget)
+        data = widget.transform(df) if widget.transform else df
+        return data, round((time.monotonic() - started) * 1000, 2)
+
+    def _timeout(self, widget):
+        return widget.timeout if widget.timeout is not None else self.timeout
+
+    def stats(self):
+        return {'max_workers': self.max_workers, 'widget_timeout': self.timeout}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,528 @@
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+from database.date_keys import key_expression, today
+from database.rollups import SOURCE_TABLE, ProductionRollups
+from database.sql_shape import Token, canonical, looks_numeric, number_params, parse_select, render, split_top_level, strip_qualifiers, tokenize
+
+
+# Каталог архивных разделов в основной базе и представление полной истории
+CATALOG_TABLE = f'{SOURCE_TABLE}_partitions'
+UNION_VIEW = f'{SOURCE_TABLE}_all'
+
+# Выражения, которые не убывают вместе с датой: на строках раздела их значения
+# лежат между значениями на первой и последней дате раздела
+_MONOTONIC = {
+    'date', canonical(tokenize(key_expression('day_key'))), canonical(tokenize(key_expression('month_key'))),
+    'substr(date,1,4)', 'substr(date,1,7)', 'substr(date,1,10)',
+    "strftime('%Y',date)", "strftime('%Y-%m',date)", "strftime('%Y-%m-%d',date)",
+}
+_COMPARISONS = {'=': '=', '==': '=', '>': '>', '>=': '>=', '<': '<', '<=': '<='}
+_FLIPPED = {'=': '=', '>': '<', '>=': '<=', '<': '>', '<=': '>='}
+
+# Столбец даты для одной даты - для вычисления границ раздела
+_DATE_ROW = "SELECT ? AS date"
+
+# Строки года: корректная дата 'ГГГГ-ММ-ДД...' в диапазоне года (поиск по индексу date)
+_YEAR_CONDITION = "date >= ? AND date < ? AND strftime('%Y', date) = ?"
+
+
+def _year_bounds(year):
+    return f'{year:04d}-01-01', f'{year + 1:04d}-01-01', f'{year:04d}'
+
+
+class Partition:
+    """Архивный раздел production: строки одного года в отдельном файле"""
+
+    def __init__(self, name, year, path, rows, min_date, max_date, created_at=None):
+        self.name = name
+        self.year = year
+        self.path = path
+        self.rows = rows
+        self.min_date = min_date
+        self.max_date = max_date
+        self.created_at = created_at
+
+    @property
+    def schema(self):
+        """Имя схемы, под которым файл подключается через ATTACH"""
+        return self.name
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'year': self.year,
+            'path': self.path,
+            'rows': self.rows,
+            'min_date': self.min_date,
+            'max_date': self.max_date,
+            'created_at': self.created_at,
+        }
+
+
+class ProductionPartitions:
+    """Секционирование production по годам.
+
+    Текущие данные остаются в таблице production основной базы, строки
+    прошедших лет переносятся в отдельные файлы (раздел на год), которые
+    подключаются через ATTACH в режиме immutable и только для чтения.
+    Каталог разделов хранится в таблице production_partitions.
+
+    route() заменяет production в запросе объединением UNION ALL только
+    тех разделов, которые могут попасть в границы дат из WHERE; запрос
+    за последний месяц читает одну основную таблицу. Для остальных
+    запросов (соединения, подзапросы) подключаются все разделы.
+    """
+
+    def __init__(self, directory='partitions', enabled=True, base_directory=None):
+        self.directory = directory
+        self.enabled = enabled
+        # Каталог основной базы: относительные пути разделов считаются от него (None - от файла соединения)
+        self.base_directory = base_directory
+        self._memo = {}
+        self._bounds = {}
+        self._union = {}
+        self._stats = {'routed': 0, 'hot_only': 0, 'scanned': 0, 'pruned': 0}
+        self._archived = 0
+
+    @classmethod
+    def from_env(cls, base_directory=None):
+        return cls(
+            directory=os.getenv('PARTITIONS_DIR', 'partitions'),
+            enabled=os.getenv('PARTITIONS_ENABLED', '1') != '0',
+            base_directory=base_directory
+        )
+
+    # --- Каталог и подключение ---
+
+    def catalog(self, conn):
+        """Архивные разделы по возрастанию года (пустой список без каталога)"""
+        try:
+            rows = conn.execute(
+                f"SELECT name, year, path, row_count, min_date, max_date, created_at "
+                f"FROM main.{CATALOG_TABLE} ORDER BY year"
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return []
+        partitions = [Partition(*row) for row in rows]
+        self._archived = len(partitions)
+        return partitions
+
+    def _ensure_catalog(self, conn):
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS main.{CATALOG_TABLE} (
+                name TEXT PRIMARY KEY,
+                year INTEGER NOT NULL UNIQUE,
+                path TEXT NOT NULL,
+                row_count INTEGER NOT NULL,
+                min_date TEXT,
+                max_date TEXT,
+                created_at TEXT
+            )
+        """)
+
+    def _resolve(self, conn, path):
+        """Путь к файлу раздела: относительные пути - от каталога основной базы"""
+        if os.path.isabs(path):
+            return path
+        if self.base_directory:
+            return os.path.join(self.base_directory, path)
+        main = next(row[2] for row in conn.execute("PRAGMA database_list") if row[1] == 'main')
+        return os.path.join(os.path.dirname(os.path.abspath(main or '.')), path)
+
+    def attach(self, conn, partitions=None):
+        """Подключение разделов к соединению (уже подключенные пропускаются)"""
+        partitions = self.catalog(conn) if partitions is None else partitions
+        attached = {row[1] for row in conn.execute("PRAGMA database_list")}
+        for partition in partitions:
+            if partition.schema in attached:
+                continue
+            path = self._resolve(conn, partition.path)
+            if not os.path.exists(path):
+                raise Exception(f"Ошибка подключения раздела {partition.year}: файл {path} не найден")
+            # immutable: файл не меняется, SQLite читает его без блокировок и проверок изменений
+            conn.execute(f'ATTACH DATABASE ? AS "{partition.schema}"', (f"file:{quote(path)}?mode=ro&immutable=1",))
+        return partitions
+
+    def source(self, conn):
+        """Источник полной истории для соединения с правом записи.
+
+        Без архивных разделов - сама таблица production, иначе TEMP VIEW
+        production_all с объединением всех разделов (например, для пересчета rollup).
+        """
+        partitions = self.catalog(conn)
+        if not partitions:
+            return SOURCE_TABLE
+        self.attach(conn, partitions)
+        conn.execute(f"DROP VIEW IF EXISTS temp.{UNION_VIEW}")
+        conn.execute(f"CREATE TEMP VIEW {UNION_VIEW} AS {self._union_sql(conn, partitions)}")
+        return UNION_VIEW
+
+    def _columns(self, conn, schema):
+        # table_xinfo показывает и генерируемые столбцы, скрытые отбрасываются
+        return [
+            row[1] for row in conn.execute(f'PRAGMA "{schema}".table_xinfo({SOURCE_TABLE})')
+            if row[6] in (0, 2, 3)
+        ]
+
+    def _union_sql(self, conn, partitions):
+        """UNION ALL разделов и основной таблицы с одинаковым набором столбцов"""
+        version = conn.execute("PRAGMA main.schema_version").fetchone()[0]
+        key = (version, tuple(partition.schema for partition in partitions))
+        if key not in self._union:
+            columns = self._columns(conn, 'main')
+            selects = []
+            for partition in partitions:
+                # Раздел, созданный до добавления столбца, получает NULL
+                available = set(self._columns(conn, partition.schema))
+                items = [column if column in available else f"NULL AS {column}" for column in columns]
+                selects.append(f'SELECT {", ".join(items)} FROM "{partition.schema}".{SOURCE_TABLE}')
+            selects.append(f"SELECT {', '.join(columns)} FROM main.{SOURCE_TABLE}")
+            if len(self._union) >= 64:
+                self._union.clear()
+            self._union[key] = ' UNION ALL '.join(selects)
+        return self._union[key]
+
+    # --- Маршрутизация запросов ---
+
+    def route(self, conn, sql, params=None):
+        """SQL, в котором production заменена объединением нужных разделов, или исходный SQL"""
+        if not self.enabled or SOURCE_TABLE not in sql.lower():
+            return sql
+        partitions = self.catalog(conn)
+        if not partitions:
+            return sql
+        analysis = self._analyze(sql)
+        if analysis is None:
+            return sql
+        tokens, references, conditions = analysis
+
+        selected = [
+            partition for partition in partitions
+            if self._may_match(conn, partition, conditions, params)
+        ]
+        self._stats['pruned'] += len(partitions) - len(selected)
+        if not selected:
+            # Все границы запроса в пределах основной таблицы
+            self._stats['hot_only'] += 1
+            return sql
+        self._stats['routed'] += 1
+        self._stats['scanned'] += len(selected)
+
+        self.attach(conn, selected)
+        union = f"({self._union_sql(conn, selected)})"
+        result = list(tokens)
+        for index, has_alias in reversed(references):
+            replacement = [Token('raw', union)]
+            if not has_alias:
+                replacement += [Token('keyword', 'AS'), Token('ident', SOURCE_TABLE)]
+            result[index:index + 1] = replacement
+        return render(result)
+
+    def _analyze(self, sql):
+        """(токены, ссылки на production, условия на дату) или None; кэшируется по тексту"""
+        if sql not in self._memo:
+            try:
+                result = self._build_analysis(sql)
+            except ValueError:
+                result = None
+            if len(self._memo) >= 1024:
+                self._memo.clear()
+            self._memo[sql] = result
+        return self._memo[sql]
+
+    def _build_analysis(self, sql):
+        tokens = number_params(tokenize(sql))
+        references = []
+        for i, token in enumerate(tokens):
+            if token.kind != 'ident' or token.lower != SOURCE_TABLE:
+                continue
+            previous = tokens[i - 1] if i else None
+            following = tokens[i + 1] if i + 1 < len(tokens) else None
+            if (previous is not None and previous.is_keyword('with')) or (
+                    following is not None and following.is_keyword('as')
+                    and i + 2 < len(tokens) and tokens[i + 2].value == '('):
+                # CTE с именем production - это не таблица
+                return None
+            # Ссылка на таблицу: после FROM, JOIN или запятой списка FROM, без схемы и не столбец
+            if previous is None or not (previous.is_keyword('from', 'join') or previous.value == ','):
+                continue
+            if following is not None and following.value in ('.', '('):
+                continue
+            has_alias = following is not None and (following.is_keyword('as') or following.kind == 'ident')
+            references.append((i, has_alias))
+        if not references:
+            return None
+
+        conditions = []
+        shape = parse_select(tokens)
+        if shape is not None and shape.table.lower() == SOURCE_TABLE and shape.where:
+            where = strip_qualifiers(shape.where, [shape.table, shape.table_alias])
+            # AND связывает сильнее OR: с OR на верхнем уровне условие не делится
+            has_or = any(token.is_keyword('or') for token in where)
+            for part in [where] if has_or else split_top_level(where, 'and'):
+                condition = self._condition(part)
+                if condition is not None:
+                    conditions.append(condition)
+        return tokens, references, conditions
+
+    def _condition(self, part):
+        """(выражение от даты, операция, значения) для условий вида date >= X или None"""
+        depth = 0
+        for i, token in enumerate(part):
+            if token.value == '(':
+                depth += 1
+            elif token.value == ')':
+                depth -= 1
+            if depth:
+                continue
+            if token.is_keyword('between'):
+                if i == 0 or part[i - 1].is_keyword('not') or canonical(part[:i]) not in _MONOTONIC:
+                    return None
+                values = split_top_level(part[i + 1:], 'and')
+                return (part[:i], 'between', values) if len(values) == 2 else None
+            if token.kind == 'op' and token.value in _COMPARISONS:
+                left, right = part[:i], part[i + 1:]
+                if canonical(left) in _MONOTONIC:
+                    return left, _COMPARISONS[token.value], [right]
+                if canonical(right) in _MONOTONIC:
+                    return right, _FLIPPED[_COMPARISONS[token.value]], [left]
+                return None
+        return None
+
+    def _may_match(self, conn, partition, conditions, params):
+        """Могут ли строки раздела удовлетворять всем условиям на дату"""
+        for expression, op, value_tokens in conditions:
+            low = self._bound(conn, expression, partition.min_date)
+            high = self._bound(conn, expression, partition.max_date)
+            values = [self._value(conn, tokens, params) for tokens in value_tokens]
+            # Сравниваем только значения одного рода - иначе решает сродство типов SQLite
+            kinds = {_kind(value) for value in [low, high, *values]}
+            if len(kinds) != 1 or None in kinds:
+                continue
+            # Столбец date объявлен как DATE: строку-число SQLite сравнит как число
+            if canonical(expression) == 'date' and any(looks_numeric(value) for value in values):
+                continue
+            if op == 'between':
+                if high < values[0] or low > values[1]:
+                    return False
+                continue
+            value = values[0]
+            if (op == '=' and (value < low or value > high)
+                    or op == '>=' and high < value
+                    or op == '>' and high <= value
+                    or op == '<' and low >= value
+                    or op == '<=' and low > value):
+                return False
+        return True
+
+    def _bound(self, conn, expression, date_value):
+        """Значение выражения от даты на граничной дате раздела (вычисляет SQLite)"""
+        text = render(expression)
+        key = (text, date_value)
+        if key not in self._bounds:
+            try:
+                value = conn.execute(
+                    f"SELECT {text} FROM ({_DATE_ROW})", (date_value,)
+                ).fetchone()[0]
+            except sqlite3.Error:
+                value = None
+            if len(self._bounds) >= 4096:
+                self._bounds.clear()
+            self._bounds[key] = value
+        return self._bounds[key]
+
+    def _value(self, conn, tokens, params):
+        """Значение границы: литерал, параметр или выражение без столбцов (date('now', ...))"""
+        values = []
+        result = []
+        for i, token in enumerate(tokens):
+            if token.kind == 'ident' and not (i + 1 < len(tokens) and tokens[i + 1].value == '('):
+                return None
+            if token.is_keyword('select'):
+                return None
+            if token.kind == 'param':
+                try:
+                    values.append(params[token.slot])
+                except (KeyError, IndexError, TypeError):
+                    return None
+                result.append(Token('param', '?'))
+            else:
+                result.append(token)
+        try:
+            return conn.execute(f"SELECT {render(result)}", values).fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+    # --- Перенос разделов ---
+
+    def archive(self, conn, year):
+        """Перенос строк года из production в файл раздела только для чтения.
+
+        conn - соединение с правом записи. Строки сначала копируются в новый
+        файл, затем удаляются из production вместе с записью в каталог в
+        одной транзакции; триггеры rollup на это время снимаются, поэтому
+        rollup продолжают описывать полную историю.
+        """
+        year = int(year)
+        if year >= today().year:
+            raise Exception(f"Ошибка архивации: текущий год {year} остается в {SOURCE_TABLE}")
+        if any(partition.year == year for partition in self.catalog(conn)):
+            raise Exception(f"Ошибка архивации: {year} год уже в архиве")
+        bounds = _year_bounds(year)
+        rows = conn.execute(f"SELECT COUNT(*) FROM main.{SOURCE_TABLE} WHERE {_YEAR_CONDITION}", bounds).fetchone()[0]
+        if not rows:
+            raise Exception(f"Ошибка архивации: в {SOURCE_TABLE} нет строк за {year} год")
+
+        name = f"{SOURCE_TABLE}_{year}_{datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S')}"
+        relative = os.path.join(self.directory, f'{name}.db')
+        path = self._resolve(conn, relative)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        try:
+            # Схема раздела - та же таблица и те же индексы, что в основной базе
+            statements = [row[0] for row in conn.execute(
+                "SELECT sql FROM main.sqlite_master WHERE tbl_name = ? AND type IN ('table', 'index') "
+                "AND sql IS NOT NULL ORDER BY type = 'index'",
+                (SOURCE_TABLE,)
+            )]
+            archive_conn = sqlite3.connect(tmp_path)
+            try:
+                for statement in statements:
+                    archive_conn.execute(statement)
+                archive_conn.commit()
+            finally:
+                archive_conn.close()
+
+            columns = ', '.join(row[1] for row in conn.execute(f"PRAGMA main.table_xinfo({SOURCE_TABLE})") if row[6] == 0)
+            conn.execute("ATTACH DATABASE ? AS archive_new", (tmp_path,))
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute(
+                    f"INSERT INTO archive_new.{SOURCE_TABLE} ({columns}) "
+                    f"SELECT {columns} FROM main.{SOURCE_TABLE} WHERE {_YEAR_CONDITION} ORDER BY date",
+                    bounds
+                )
+                conn.commit()
+                copied, min_date, max_date = conn.execute(
+                    f"SELECT COUNT(*), MIN(date), MAX(date) FROM archive_new.{SOURCE_TABLE}"
+                ).fetchone()
+                conn.execute("ANALYZE archive_new")
+                conn.commit()
+            finally:
+                conn.execute("DETACH DATABASE archive_new")
+            if copied != rows:
+                raise Exception(f"скопировано {copied} строк из {rows}")
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise Exception(f"Ошибка архивации {year} года: {str(e)}")
+
+        rollups = ProductionRollups()
+        rollups_installed = rollups.is_installed(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._ensure_catalog(conn)
+            if rollups_installed:
+                rollups.drop_triggers(conn)
+            deleted = conn.execute(f"DELETE FROM main.{SOURCE_TABLE} WHERE {_YEAR_CONDITION}", bounds).rowcount
+            if deleted != rows:
+                raise Exception(f"удалено {deleted} строк из {rows}")
+            if rollups_installed:
+                rollups.create_triggers(conn)
+            conn.execute(
+                f"INSERT INTO main.{CATALOG_TABLE} (name, year, path, row_count, min_date, max_date, created_at) "
+                f"VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (name, year, relative, rows, min_date, max_date, datetime.now(timezone.utc).isoformat(timespec='seconds'))
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            os.chmod(path, 0o644)
+            os.remove(path)
+            raise Exception(f"Ошибка архивации {year} года: {str(e)}")
+        return Partition(name, year, relative, rows, min_date, max_date)
+
+    def restore(self, conn, year):
+        """Возврат строк раздела в production и удаление файла раздела"""
+        year = int(year)
+        partition = next((p for p in self.catalog(conn) if p.year == year), None)
+        if partition is None:
+            raise Exception(f"Ошибка восстановления: {year} года нет в архиве")
+        self.attach(conn, [partition])
+
+        main_columns = {row[1] for row in conn.execute(f"PRAGMA main.table_xinfo({SOURCE_TABLE})") if row[6] == 0}
+        columns = ', '.join(
+            row[1] for row in conn.execute(f'PRAGMA "{partition.schema}".table_xinfo({SOURCE_TABLE})')
+            if row[6] == 0 and row[1] in main_columns
+        )
+        rollups = ProductionRollups()
+        rollups_installed = rollups.is_installed(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if rollups_installed:
+                rollups.drop_triggers(conn)
+            conn.execute(
+                f'INSERT INTO main.{SOURCE_TABLE} ({columns}) SELECT {columns} FROM "{partition.schema}".{SOURCE_TABLE}'
+            )
+            if rollups_installed:
+                rollups.create_triggers(conn)
+            conn.execute(f"DELETE FROM main.{CATALOG_TABLE} WHERE name = ?", (partition.name,))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise Exception(f"Ошибка восстановления {year} года: {str(e)}")
+        finally:
+            conn.execute(f'DETACH DATABASE "{partition.schema}"')
+
+        path = self._resolve(conn, partition.path)
+        os.chmod(path, 0o644)
+        os.remove(path)
+        return partition
+
+    def stats(self):
+        return {**self._stats, 'enabled': self.enabled, 'archived_partitions': self._archived}
+
+
+def _kind(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return 'text'
+    if isinstance(value, (int, float)):
+        return 'number'
+    return type(value).__name__
+
+
+if __name__ == '__main__':
+    # python -m database.partitions [status|archive ГОД|restore ГОД] [путь к БД]
+    from database.connection import SQLiteProfile, connect, database_path
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    args = sys.argv[2:]
+    year = args.pop(0) if command in ('archive', 'restore') and args else None
+    path = args[0] if args else database_path()
+    conn = connect(path, SQLiteProfile.from_env().for_writes(), isolation_level=None)
+    partitions = ProductionPartitions.from_env()
+
+    if command == 'archive':
+        partition = partitions.archive(conn, year)
+        print(f"📦 {partition.year} год перенесен в {partition.path}: {partition.rows} строк")
+        print("ℹ️ VACUUM освободит место, занятое перенесенными строками")
+    elif command == 'restore':
+        partition = partitions.restore(conn, year)
+        print(f"📤 {partition.year} год возвращен в {SOURCE_TABLE}: {partition.rows} строк")
+
+    hot = conn.execute(f"SELECT COUNT(*), MIN(date), MAX(date) FROM main.{SOURCE_TABLE}").fetchone()
+    print(f"{SOURCE_TABLE}: {hot[0]} строк, {hot[1]} - {hot[2]}")
+    for partition in partitions.catalog(conn):
+        print(f"{partition.name}: {partition.rows} строк, {partition.min_date} - {partition.max_date}, {partition.path}")
+    conn.close()
@@ -0,0 +1,207 @@
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from database.connection import SQLiteProfile, connect
+
+
+class PoolTimeoutError(Exception):
+    """Не удалось получить соединение из пула за отведенное время"""
+
+
+class PooledConnection(sqlite3.Connection):
+    """Соединение из пула: позволяет хранить служебные отметки (например, data_version)"""
+
+
+class ConnectionPool:
+    """Пул соединений SQLite.
+
+    Каждый поток работает со своим соединением, общее число соединений
+    ограничено max_size. Освобожденное соединение возвращается в пул и
+    в первую очередь выдается тому же потоку, который его использовал.
+    retarget() переключает пул на другой файл (новый снимок реплики):
+    соединения со старым файлом закрываются при возврате в пул.
+    """
+
+    def __init__(self, database, max_size=8, timeout=10.0, profile=None, immutable=False):
+        self.database = database
+        self.max_size = max(1, int(max_size))
+        self.timeout = timeout
+        self.profile = profile or SQLiteProfile.from_env()
+        self.immutable = immutable
+        self._generation = 0
+
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._local = threading.local()
+
+        self._stats = {
+            'created': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'peak_in_use': 0,
+            'wait_time_total': 0.0,
+        }
+        self._in_use = 0
+
+    def connect(self):
+        """Новое соединение с настройками пула (вне лимита пула)"""
+        conn = connect(self.database, self.profile, immutable=self.immutable, factory=PooledConnection)
+        conn.pool_generation = self._generation
+        return conn
+
+    def retarget(self, database, immutable=None):
+        """Переключение на другой файл БД: новые выдачи получают соединения с ним.
+
+        Уже выданные соединения дорабатывают со старым файлом (и видят
+        прежний снимок данных) и закрываются при возврате в пул.
+        """
+        with self._cond:
+            self.database = database
+            if immutable is not None:
+                self.immutable = immutable
+            self._generation += 1
+            for conn in self._idle:
+                self._close(conn)
+            self._idle = []
+            self._cond.notify_all()
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        self._size -= 1
+
+    def acquire(self, timeout=None):
+        """Получение соединения для текущего потока"""
+        holder = getattr(self._local, 'holder', None)
+        if holder is not None:
+            # Повторный вход в том же потоке - отдаем то же соединение
+            holder['depth'] += 1
+            return holder['conn']
+
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        started = time.monotonic()
+        waited = False
+
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolTimeoutError("Пул соединений закрыт")
+
+                conn = self._take_idle()
+                if conn is not None:
+                    break
+
+                if self._size < self.max_size:
+                    self._size += 1
+                    try:
+                        conn = self.connect()
+                    except Exception:
+                        self._size -= 1
+                        self._cond.notify()
+                        raise
+                    self._stats['created'] += 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats['timeouts'] += 1
+                    raise PoolTimeoutError(
+                        f"Нет свободных соединений в пуле (размер {self.max_size}, ожидание {timeout:.1f} с)"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            self._in_use += 1
+            self._stats['checkouts'] += 1
+            self._stats['peak_in_use'] = max(self._stats['peak_in_use'], self._in_use)
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time_total'] += time.monotonic() - started
+
+        self._local.holder = {'conn': conn, 'depth': 1}
+        self._local.last_conn = conn
+        return conn
+
+    def _take_idle(self):
+        """Выбор свободного соединения, предпочтительно последнего для этого потока"""
+        if not self._idle:
+            return None
+        last_conn = getattr(self._local, 'last_conn', None)
+        if last_conn is not None and last_conn in self._idle:
+            self._idle.remove(last_conn)
+            return last_conn
+        return self._idle.pop()
+
+    def release(self, conn):
+        """Возврат соединения в пул"""
+        holder = getattr(self._local, 'holder', None)
+        if holder is None or holder['conn'] is not conn:
+            raise ValueError("Соединение не принадлежит текущему потоку")
+
+        holder['depth'] -= 1
+        if holder['depth'] > 0:
+            return
+        self._local.holder = None
+
+        # Не оставляем незавершенных транзакций у следующего владельца
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            pass
+
+        with self._cond:
+            self._in_use -= 1
+            if self._closed or conn.pool_generation != self._generation:
+                self._close(conn)
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Контекстный менеджер для работы с соединением из пула"""
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        """Статистика использования пула"""
+        with self._cond:
+            checkouts = self._stats['checkouts']
+            return {
+                'max_size': self.max_size,
+                'size': self._size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'created': self._stats['created'],
+                'checkouts': checkouts,
+                'waits': self._stats['waits'],
+                'timeouts': self._stats['timeouts'],
+                'peak_in_use': self._stats['peak_in_use'],
+                'avg_wait_ms': round(self._stats['wait_time_total'] * 1000 / self._stats['waits'], 2)
+                if self._stats['waits'] else 0.0,
+                'read_only': self.profile.read_only,
+                'database': self.database,
+                'immutable': self.immutable,
+                'generation': self._generation,
+            }
+
+    def close_all(self):
+        """Закрытие всех соединений пула"""
+        with self._cond:
+            self._closed = True
+            for conn in self._idle:
+                self._close(conn)
+            self._idle = []
+            self._cond.notify_all()
@@ -0,0 +1,167 @@
+import re
+import threading
+from collections import OrderedDict
+from datetime import date
+
+
+_TABLE_RE = re.compile(r'\b(?:FROM|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)', re.IGNORECASE)
+_UNCACHEABLE_RE = re.compile(
+    r"\brandom\s*\(|\b(?:datetime|time|julianday|unixepoch|strftime)\s*\([^)]*'now'",
+    re.IGNORECASE
+)
+
+
+def normalize_sql(sql):
+    """Нормализация SQL: без комментариев, лишних пробелов и точек с запятой.
+
+    Строковые литералы и идентификаторы в кавычках не изменяются.
+    """
+    result = []
+    i = 0
+    length = len(sql)
+    pending_space = False
+
+    while i < length:
+        ch = sql[i]
+
+        if ch in ("'", '"', '`', '['):
+            closing = ']' if ch == '[' else ch
+            j = i + 1
+            while j < length:
+                if sql[j] == closing:
+                    # Удвоенная кавычка внутри литерала
+                    if closing != ']' and j + 1 < length and sql[j + 1] == closing:
+                        j += 2
+                        continue
+                    break
+                j += 1
+            if pending_space and result:
+                result.append(' ')
+            pending_space = False
+            result.append(sql[i:j + 1])
+            i = j + 1
+            continue
+
+        if ch == '-' and sql.startswith('--', i):
+            newline = sql.find('\n', i)
+            i = length if newline == -1 else newline
+            pending_space = True
+            continue
+
+        if ch == '/' and sql.startswith('/*', i):
+            end = sql.find('*/', i + 2)
+            i = length if end == -1 else end + 2
+            pending_space = True
+            continue
+
+        if ch.isspace() or ch == ';':
+            pending_space = True
+            i += 1
+            continue
+
+        if pending_space and result:
+            result.append(' ')
+        pending_space = False
+        result.append(ch)
+        i += 1
+
+    return ''.join(result)
+
+
+def referenced_tables(sql):
+    """Таблицы, упомянутые в FROM и JOIN"""
+    return sorted({name.lower() for name in _TABLE_RE.findall(sql)})
+
+
+def is_read_query(sql):
+    """Запрос только на чтение (SELECT или WITH ... SELECT)"""
+    head = sql.lstrip().split(None, 1)
+    return bool(head) and head[0].upper() in ('SELECT', 'WITH')
+
+
+class QueryResultCache:
+    """LRU-кэш результатов запросов с ограничением по числу записей и объему.
+
+    Ключ - нормализованный SQL и параметры. Каждая запись хранит версию
+    данных, при которой была получена, и считается устаревшей, как только
+    версия изменилась.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 * 1024, enabled=True):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0, 'bypass': 0}
+
+    def make_key(self, normalized_sql, params=None):
+        """Ключ кэша или None, если запрос нельзя кэшировать"""
+        if _UNCACHEABLE_RE.search(normalized_sql):
+            return None
+        # date('now') меняется раз в сутки - добавляем текущую дату в ключ
+        today = date.today().isoformat() if "'now'" in normalized_sql.lower() else None
+        if isinstance(params, dict):
+            params = tuple(sorted(params.items()))
+        elif params is not None:
+            params = tuple(params)
+        return (normalized_sql, params, today)
+
+    def get(self, key, version):
+        """Результат из кэша или None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            if entry['version'] != version:
+                self._drop(key)
+                self._stats['invalidations'] += 1
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry['value']
+
+    def put(self, key, value, version, size):
+        """Сохранение результата с вытеснением самых старых записей"""
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {'value': value, 'version': version, 'size': size}
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self._stats['evictions'] += 1
+
+    def record_bypass(self):
+        with self._lock:
+            self._stats['bypass'] += 1
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size']
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Счетчики попаданий, промахов и вытеснений"""
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                **self._stats,
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hit_rate': round(self._stats['hits'] / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,238 @@
+import os
+import re
+import time
+from contextlib import contextmanager
+
+from database.sql_shape import tokenize
+
+
+_ALIAS_RE = re.compile(
+    r'(?:\bFROM|\bJOIN|,)\s*([A-Za-z_][A-Za-z0-9_]*)(?:\s+(?:AS\s+)?([A-Za-z_][A-Za-z0-9_]*))?',
+    re.IGNORECASE
+)
+_NOT_ALIAS = {
+    'where', 'join', 'inner', 'left', 'right', 'full', 'outer', 'cross', 'natural', 'on',
+    'using', 'group', 'order', 'limit', 'having', 'union', 'except', 'intersect', 'window',
+}
+_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?((?:[A-Za-z_][A-Za-z0-9_]*\.)?[A-Za-z_][A-Za-z0-9_]*)(?: AS ([A-Za-z_][A-Za-z0-9_]*))?')
+_SUBQUERY_RE = re.compile(r'^(?:CO-ROUTINE|MATERIALIZE) (?:SUBQUERY \d+|([A-Za-z_][A-Za-z0-9_]*))')
+_AGGREGATE_RE = re.compile(
+    r'\b(?:count|sum|avg|min|max|total|group_concat)\s*\(|\bGROUP\s+BY\b|\bDISTINCT\b',
+    re.IGNORECASE
+)
+
+
+def _has_limit(sql):
+    """Есть ли LIMIT верхнего уровня (с любым выражением); None, если SQL не разобран"""
+    try:
+        tokens = tokenize(sql)
+    except ValueError:
+        return None
+    depth = 0
+    for token in tokens:
+        if token.value == '(':
+            depth += 1
+        elif token.value == ')':
+            depth -= 1
+        elif depth == 0 and token.is_keyword('limit'):
+            return True
+    return False
+
+
+class QueryBudgetExceeded(Exception):
+    """Запрос превысил бюджет выполнения (шаги VM или время)"""
+
+    def __init__(self, budget, limit, message):
+        super().__init__(message)
+        self.budget = budget
+        self.limit = limit
+
+
+class QueryPlanRejected(Exception):
+    """План запроса признан слишком дорогим еще до выполнения"""
+
+
+class QueryBudget:
+    """Бюджет выполнения запроса через progress handler SQLite.
+
+    Обработчик вызывается каждые check_interval инструкций виртуальной
+    машины SQLite и прерывает запрос, когда исчерпан лимит шагов или
+    наступил дедлайн по времени.
+    """
+
+    def __init__(self, max_vm_steps=100_000_000, max_seconds=10.0, check_interval=10000):
+        self.max_vm_steps = max_vm_steps
+        self.max_seconds = max_seconds
+        self.check_interval = max(1, int(check_interval))
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_vm_steps=int(os.getenv('QUERY_MAX_VM_STEPS', '100000000')),
+            max_seconds=float(os.getenv('QUERY_MAX_SECONDS', '10')),
+            check_interval=int(os.getenv('QUERY_PROGRESS_INTERVAL', '10000'))
+        )
+
+    @contextmanager
+    def guard(self, conn):
+        """Выполнение блока с ограничением по шагам VM и времени"""
+        state = {'steps': 0, 'exceeded': None}
+        deadline = time.monotonic() + self.max_seconds if self.max_seconds else None
+
+        def handler():
+            state['steps'] += self.check_interval
+            if self.max_vm_steps and state['steps'] > self.max_vm_steps:
+                state['exceeded'] = 'vm_steps'
+                return 1
+            if deadline is not None and time.monotonic() > deadline:
+                state['exceeded'] = 'wall_clock'
+                return 1
+            return 0
+
+        conn.set_progress_handler(handler, self.check_interval)
+        try:
+            yield
+        except Exception as e:
+            # Прерванный запрос приходит как sqlite3.OperationalError или обертка pandas
+            if state['exceeded']:
+                raise self._exceeded(state['exceeded']) from e
+            raise
+        finally:
+            conn.set_progress_handler(None, self.check_interval)
+
+    def _exceeded(self, budget):
+        if budget == 'vm_steps':
+            return QueryBudgetExceeded(
+                budget, self.max_vm_steps,
+                f"Превышен бюджет шагов выполнения запроса ({self.max_vm_steps:,} инструкций SQLite)"
+            )
+        return QueryBudgetExceeded(
+            budget, self.max_seconds,
+            f"Превышен бюджет времени выполнения запроса ({self.max_seconds:g} с)"
+        )
+
+    def to_dict(self):
+        return {
+            'max_vm_steps': self.max_vm_steps,
+            'max_seconds': self.max_seconds,
+            'check_interval': self.check_interval,
+        }
+
+
+class PlanCheck:
+    """Результат предварительной проверки плана"""
+
+    def __init__(self, sql, full_scans, auto_limit=None):
+        self.sql = sql
+        self.full_scans = full_scans
+        self.auto_limit = auto_limit
+
+
+class QueryPlanGuard:
+    """Проверка EXPLAIN QUERY PLAN перед выполнением запроса.
+
+    Полные сканирования больших таблиц внутри одного цикла соединения
+    перемножаются; если оценка превышает max_scan_rows, запрос отклоняется.
+    Одиночное полное сканирование большой таблицы без агрегации и LIMIT
+    получает LIMIT (full_scan='limit') или отклоняется (full_scan='reject').
+    """
+
+    def __init__(self, big_table_rows=10000, max_scan_rows=5_000_000, full_scan='limit', auto_limit=10000):
+        self.big_table_rows = big_table_rows
+        self.max_scan_rows = max_scan_rows
+        self.full_scan = full_scan
+        self.auto_limit = auto_limit
+        self._row_estimates = {}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            big_table_rows=int(os.getenv('QUERY_GUARD_BIG_TABLE_ROWS', '10000')),
+            max_scan_rows=int(os.getenv('QUERY_GUARD_MAX_SCAN_ROWS', '5000000')),
+            full_scan=os.getenv('QUERY_GUARD_FULL_SCAN', 'limit').lower(),
+            auto_limit=int(os.getenv('QUERY_GUARD_AUTO_LIMIT', '10000'))
+        )
+
+    def check(self, conn, sql, params=None, explain_sql=None):
+        """Проверка плана: PlanCheck с исходным или ограниченным SQL.
+
+        explain_sql - текст, который фактически будет выполнен (например,
+        с подставленными разделами production), если он отличается от sql.
+        """
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {explain_sql or sql}", params or ()).fetchall()
+        aliases = self._aliases(sql)
+        # Подзапросы во FROM - не таблицы: их строки уже учтены в их собственных шагах плана
+        subqueries = {
+            match.group(1).lower() for match in (_SUBQUERY_RE.match(row[3]) for row in plan)
+            if match and match.group(1)
+        }
+
+        loops = {}
+        full_scans = []
+        for _, parent, _, detail in plan:
+            match = _SCAN_RE.match(detail)
+            if not match or match.group(1).lower() in subqueries:
+                continue
+            # Сканирование по индексу тоже читает всю таблицу
+            name = match.group(1)
+            table = aliases.get(name.lower(), name.lower())
+            rows = self._estimate_rows(conn, table)
+            loops.setdefault(parent, []).append((table, rows))
+            if rows >= self.big_table_rows:
+                full_scans.append(table)
+
+        for scans in loops.values():
+            if len(scans) < 2:
+                continue
+            cost = 1
+            for _, rows in scans:
+                cost *= max(rows, 1)
+            if cost > self.max_scan_rows:
+                tables = ' x '.join(table for table, _ in scans)
+                raise QueryPlanRejected(
+                    f"Запрос отклонен: вложенное полное сканирование {tables} "
+                    f"(~{cost:,} строк, лимит {self.max_scan_rows:,})"
+                )
+
+        if not full_scans or self.full_scan == 'allow':
+            return PlanCheck(sql, full_scans)
+        has_limit = _has_limit(sql)
+        if _AGGREGATE_RE.search(sql) or has_limit:
+            return PlanCheck(sql, full_scans)
+
+        if self.full_scan == 'reject':
+            raise QueryPlanRejected(
+                f"Запрос отклонен: полное сканирование большой таблицы {', '.join(full_scans)} без LIMIT"
+            )
+        if has_limit is None:
+            # Запрос не разобран - ограничиваем снаружи, не дописывая текст
+            limited = f"SELECT * FROM ({sql}) LIMIT {self.auto_limit}"
+        else:
+            limited = f"{sql} LIMIT {self.auto_limit}"
+        return PlanCheck(limited, full_scans, auto_limit=self.auto_limit)
+
+    def _aliases(self, sql):
+        aliases = {}
+        for table, alias in _ALIAS_RE.findall(sql):
+            if alias and alias.lower() not in _NOT_ALIAS:
+                aliases[alias.lower()] = table.lower()
+        return aliases
+
+    def _estimate_rows(self, conn, table):
+        """Оценка числа строк по MAX(rowid) - поиск по B-дереву без сканирования"""
+        try:
+            name = '.'.join(f'"{part}"' for part in table.split('.'))
+            rows = conn.execute(f'SELECT MAX(rowid) FROM {name}').fetchone()[0] or 0
+        except Exception:
+            # Представления, CTE и таблицы без rowid оцениваем по последнему известному значению
+            rows = self._row_estimates.get(table, 0)
+        self._row_estimates[table] = rows
+        return rows
+
+    def to_dict(self):
+        return {
+            'big_table_rows': self.big_table_rows,
+            'max_scan_rows': self.max_scan_rows,
+            'full_scan': self.full_scan,
+            'auto_limit': self.auto_limit,
+        }
@@ -0,0 +1,170 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from database.connection import SQLiteProfile, connect
+
+
+class SnapshotReplica:
+    """Реплика для аналитического чтения: снимок основной базы через backup API.
+
+    Фоновый поток раз в interval секунд проверяет PRAGMA data_version
+    основной базы и, если были коммиты, копирует ее онлайн-бэкапом во
+    временный файл. Файл переводится в журнал DELETE, становится только
+    для чтения и атомарно подменяет прежний снимок через os.replace;
+    после этого вызывается on_swap (пул переключается на новый снимок).
+    Читатели открывают снимок с immutable=1 и не берут блокировок
+    основной базы, поэтому скрипты обслуживания пишут в нее без
+    конфликтов с отчетами.
+    """
+
+    def __init__(self, primary, path=None, interval=30.0, enabled=False, on_swap=None):
+        self.primary = primary
+        base, ext = os.path.splitext(primary)
+        self.path = path or f"{base}.snapshot{ext or '.db'}"
+        self.interval = interval
+        self.enabled = enabled
+        self.on_swap = on_swap
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._monitor = None
+        self._data_version = None
+        self._schema_version = None
+        # Время, по состоянию на которое снимок совпадает с основной базой
+        self._snapshot_at = None
+        self._stats = {'refreshes': 0, 'skipped': 0, 'failures': 0, 'last_duration_ms': 0.0, 'last_error': None}
+
+    @classmethod
+    def from_env(cls, primary, on_swap=None):
+        return cls(
+            primary,
+            path=os.getenv('REPLICA_PATH') or None,
+            interval=float(os.getenv('REPLICA_INTERVAL', '30')),
+            enabled=os.getenv('REPLICA_ENABLED', '0') != '0',
+            on_swap=on_swap
+        )
+
+    @property
+    def ready(self):
+        return self._snapshot_at is not None and os.path.exists(self.path)
+
+    def start(self):
+        """Первый снимок синхронно, дальше - обновление в фоновом потоке"""
+        if not self.enabled or not os.path.exists(self.primary):
+            return False
+        self.refresh(force=True)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='snapshot-replica', daemon=True)
+            self._thread.start()
+        return self.ready
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+            self._thread = None
+        if self._monitor is not None:
+            self._monitor.close()
+            self._monitor = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Не удалось обновить снимок реплики: {e}")
+
+    def _versions(self):
+        if self._monitor is None:
+            # Постоянное соединение: data_version меняется при коммитах других соединений
+            self._monitor = connect(self.primary, SQLiteProfile.from_env())
+        return (
+            self._monitor.execute("PRAGMA data_version").fetchone()[0],
+            self._monitor.execute("PRAGMA schema_version").fetchone()[0],
+        )
+
+    def refresh(self, force=False):
+        """Новый снимок, если основная база изменилась; True - снимок подменен"""
+        with self._lock:
+            data_version, schema_version = self._versions()
+            changed = (data_version, schema_version) != (self._data_version, self._schema_version)
+            if not force and not changed and self.ready:
+                self._stats['skipped'] += 1
+                return False
+
+            started = time.time()
+            # Уникальный временный файл рядом со снимком: процессы не мешают друг другу, rename атомарен
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=f".{os.path.basename(self.path)}-", suffix='.tmp', dir=os.path.dirname(os.path.abspath(self.path))
+            )
+            os.close(fd)
+            try:
+                target = sqlite3.connect(tmp_path)
+                try:
+                    # Один шаг бэкапа - одна транзакция чтения: снимок согласован на момент начала
+                    self._monitor.backup(target)
+                    # Снимок открывается с immutable=1 - WAL ему не нужен
+                    target.execute("PRAGMA journal_mode=DELETE")
+                finally:
+                    target.close()
+                os.chmod(tmp_path, 0o444)
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                self._stats['failures'] += 1
+                self._stats['last_error'] = str(e)
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise Exception(f"Ошибка создания снимка реплики: {str(e)}")
+
+            # Версии прочитаны до бэкапа: коммит во время копирования даст еще одно обновление
+            self._data_version, self._schema_version = data_version, schema_version
+            self._snapshot_at = started
+            self._stats['refreshes'] += 1
+            self._stats['last_duration_ms'] = round((time.time() - started) * 1000, 2)
+            self._stats['last_error'] = None
+
+        if self.on_swap is not None:
+            self.on_swap(self.path)
+        return True
+
+    def lag_seconds(self):
+        """Отставание снимка: 0, если основная база не менялась, иначе возраст снимка"""
+        if self._snapshot_at is None:
+            return None
+        with self._lock:
+            try:
+                changed = self._versions() != (self._data_version, self._schema_version)
+            except sqlite3.Error:
+                return None
+        return round(time.time() - self._snapshot_at, 3) if changed else 0.0
+
+    def stats(self):
+        snapshot_at = self._snapshot_at
+        return {
+            **self._stats,
+            'enabled': self.enabled,
+            'ready': self.ready,
+            'path': self.path,
+            'interval': self.interval,
+            'snapshot_at': datetime.fromtimestamp(snapshot_at, timezone.utc).isoformat(timespec='seconds')
+            if snapshot_at else None,
+            'snapshot_age_seconds': round(time.time() - snapshot_at, 3) if snapshot_at else None,
+            'lag_seconds': self.lag_seconds() if self.enabled else None,
+            'size_bytes': os.path.getsize(self.path) if snapshot_at and os.path.exists(self.path) else 0,
+        }
+
+
+if __name__ == '__main__':
+    # python -m database.replica [путь к основной БД] - разовый снимок
+    import sys
+    from database.connection import database_path
+
+    replica = SnapshotReplica.from_env(sys.argv[1] if len(sys.argv) > 1 else database_path())
+    replica.refresh(force=True)
+    stats = replica.stats()
+    print(f"📸 Снимок {stats['path']}: {stats['size_bytes']} байт за {stats['last_duration_ms']} мс")
+    replica.stop()
@@ -0,0 +1,117 @@
+import threading
+import time
+import uuid
+
+
+class ResultHandleExpired(Exception):
+    """Дескриптор результата не найден или истек"""
+
+
+class ResultHandle:
+    """Открытый результат запроса, который выдается страницами.
+
+    Строки берутся из итератора (курсор SQLite или уже готовый DataFrame),
+    поэтому следующая страница продолжает чтение с того же места, без
+    повторного выполнения запроса и OFFSET.
+    """
+
+    def __init__(self, columns, rows, on_close=None, total_rows=None):
+        self.id = uuid.uuid4().hex
+        self.columns = columns
+        self.total_rows = total_rows
+        self.offset = 0
+        self._rows = rows
+        self._on_close = on_close
+        self._buffer = []
+        self._exhausted = False
+        self._lock = threading.Lock()
+        self.touched_at = time.monotonic()
+
+    def fetch(self, size):
+        """Следующая страница строк и признак наличия продолжения"""
+        with self._lock:
+            self.touched_at = time.monotonic()
+            page = self._buffer
+            self._buffer = []
+            # Читаем на одну строку больше, чтобы знать, есть ли продолжение
+            while len(page) < size + 1 and not self._exhausted:
+                chunk = self._rows(size + 1 - len(page))
+                if not chunk:
+                    self._exhausted = True
+                    break
+                page.extend(chunk)
+            if len(page) > size:
+                self._buffer = page[size:]
+                page = page[:size]
+            self.offset += len(page)
+            has_more = bool(self._buffer)
+            if not has_more:
+                self._exhausted = True
+            return page, has_more
+
+    @property
+    def finished(self):
+        return self._exhausted and not self._buffer
+
+    def close(self):
+        if self._on_close is not None:
+            try:
+                self._on_close()
+            except Exception as e:
+                print(f"Ошибка закрытия результата {self.id}: {e}")
+            self._on_close = None
+
+
+class ResultHandleRegistry:
+    """Реестр открытых результатов с временем жизни и ограничением числа"""
+
+    def __init__(self, ttl=300, max_handles=32):
+        self.ttl = ttl
+        self.max_handles = max_handles
+        self._handles = {}
+        self._lock = threading.Lock()
+        self._stats = {'opened': 0, 'expired': 0, 'evicted': 0, 'pages': 0}
+
+    def register(self, handle):
+        """Регистрация результата, при переполнении закрывается самый старый"""
+        with self._lock:
+            self._sweep_locked()
+            while len(self._handles) >= self.max_handles:
+                oldest = min(self._handles.values(), key=lambda h: h.touched_at)
+                self._handles.pop(oldest.id).close()
+                self._stats['evicted'] += 1
+            self._handles[handle.id] = handle
+            self._stats['opened'] += 1
+        return handle
+
+    def fetch(self, handle_id, size):
+        """Следующая страница результата по дескриптору"""
+        with self._lock:
+            self._sweep_locked()
+            handle = self._handles.get(handle_id)
+            if handle is None:
+                raise ResultHandleExpired(f"Результат {handle_id} не найден или истек")
+            self._stats['pages'] += 1
+
+        rows, has_more = handle.fetch(size)
+        if not has_more:
+            self.close(handle_id)
+        return handle, rows, has_more
+
+    def close(self, handle_id):
+        with self._lock:
+            handle = self._handles.pop(handle_id, None)
+        if handle is not None:
+            handle.close()
+        return handle is not None
+
+    def _sweep_locked(self):
+        now = time.monotonic()
+        for handle_id, handle in list(self._handles.items()):
+            if now - handle.touched_at > self.ttl:
+                self._handles.pop(handle_id).close()
+                self._stats['expired'] += 1
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'open': len(self._handles), 'ttl': self.ttl, 'max_handles': self.max_handles}
@@ -0,0 +1,617 @@
+import os
+import re
+import sqlite3
+import sys
+
+from database.date_keys import KEY_EXPRESSIONS, key_expression
+from database.sql_shape import (
+    Token, canonical, matching_paren, parse_select, render, result_name, split_top_level,
+    strip_qualifiers, tokenize
+)
+
+
+SOURCE_TABLE = 'production'
+
+# Временные корзины: выражение корзины совпадает с тем, что пишут в запросах
+GRAINS = {
+    'day': "substr({date}, 1, 10)",
+    'week': "strftime('%Y-%W', {date})",
+    'month': "substr({date}, 1, 7)",
+}
+
+DIMENSIONS = ('department', 'product_name', 'product_category')
+
+# Служебные измерения: позволяют переписывать типичные фильтры запросов
+FLAG_DIMENSIONS = {
+    'iso_date': "({date} LIKE '____-__-__')",
+    'revenue_positive': "({revenue} > 0)",
+}
+
+MEASURES = ('revenue', 'quantity', 'cost', 'profit')
+
+# Уровни детализации: полный (с отделом, товаром и категорией) и только по времени
+LEVELS = {
+    'full': DIMENSIONS,
+    'total': (),
+}
+
+ROLLUPS = [(grain, level) for level in LEVELS for grain in GRAINS]
+
+# Выражения корзин в запросах (канонический вид) -> зерно
+_BUCKET_EXPRESSIONS = {
+    'substr(date,1,10)': 'day',
+    "strftime('%Y-%W',date)": 'week',
+    'substr(date,1,7)': 'month',
+    'substr(date,1,4)': 'year',
+    # Целочисленные ключи дат из date_keys - тоже корзины
+    **{canonical(tokenize(key_expression(key))): key for key in KEY_EXPRESSIONS},
+}
+
+# Объявленные имена столбцов production - имена столбцов результата без псевдонима
+_SOURCE_COLUMNS = ('date', *DIMENSIONS, *MEASURES)
+
+# Как получить зерно запроса из корзины конкретного rollup
+_BUCKET_FROM_ROLLUP = {
+    'day': {
+        'day': 'bucket',
+        'week': "strftime('%Y-%W', bucket)",
+        'month': 'substr(bucket, 1, 7)',
+        'year': 'substr(bucket, 1, 4)',
+        'day_key': "CAST(strftime('%Y%m%d', bucket) AS INTEGER)",
+        'month_key': "CAST(strftime('%Y%m', bucket) AS INTEGER)",
+    },
+    'week': {
+        'week': 'bucket',
+    },
+    'month': {
+        'month': 'bucket',
+        'year': 'substr(bucket, 1, 4)',
+        'month_key': "CAST(strftime('%Y%m', bucket || '-01') AS INTEGER)",
+    },
+}
+
+# Фильтры исходных запросов, которые выражаются через измерения rollup
+_CONDITION_REWRITES = {
+    'revenue is not null': 'revenue_positive IS NOT NULL',
+    'revenue>0': 'revenue_positive = 1',
+    "date like '____-__-__'": 'iso_date = 1',
+}
+
+_ISO_DAY_RE = re.compile(r"^'\d{4}-\d{2}-\d{2}'$")
+_AGGREGATES = ('sum', 'total', 'count', 'avg')
+_SQL_FUNCTIONS = {'round', 'coalesce', 'ifnull', 'abs', 'cast', 'nullif', 'substr', 'strftime', 'upper', 'lower', 'printf'}
+
+
+def rollup_table(grain, level='full'):
+    suffix = '' if level == 'full' else f'_{level}'
+    return f"{SOURCE_TABLE}_rollup_{grain}{suffix}"
+
+
+class _NotRewritable(Exception):
+    pass
+
+
+def _statements(script):
+    """Разбиение скрипта на отдельные выражения (с учетом BEGIN ... END триггеров)"""
+    statements = []
+    current = ''
+    for line in script.splitlines(keepends=True):
+        current += line
+        if sqlite3.complete_statement(current):
+            statements.append(current.strip())
+            current = ''
+    return [statement for statement in statements if statement.strip(' ;\n')]
+
+
+class ProductionRollups:
+    """Материализованные агрегаты production по дням, неделям и месяцам.
+
+    Таблицы production_rollup_{day,week,month} хранят суммы и количества
+    по корзине времени, отделу, товару и категории, таблицы с суффиксом
+    _total - только по корзине времени. Триггеры на production
+    обновляют их в той же транзакции, что и исходные данные, поэтому
+    rollup никогда не отстает. rewrite() переводит подходящие агрегатные
+    запросы на самый маленький подходящий rollup.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.ready = False
+        self._stats = {'rewrites': 0, 'skipped': 0, 'fallbacks': 0}
+        self._by_table = {rollup_table(grain, level): 0 for grain, level in ROLLUPS}
+        self._memo = {}
+
+    # --- Обслуживание таблиц ---
+
+    def ensure(self, conn, source=SOURCE_TABLE):
+        """Создание таблиц, индексов и триггеров; заполнение новых и устаревших rollup из source"""
+        if not self.enabled:
+            return False
+        if not self._table_exists(conn, SOURCE_TABLE):
+            return False
+
+        # Несколько процессов могут стартовать одновременно - создаем и заполняем под блокировкой записи
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            totals = None
+            for grain, level in ROLLUPS:
+                table = rollup_table(grain, level)
+                created = not self._table_exists(conn, table)
+                for statement in _statements(self._ddl(grain, level)):
+                    conn.execute(statement)
+                if created:
+                    self._backfill(conn, grain, level, source)
+                    print(f"🧮 Создан {table}: {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]} строк")
+                    continue
+                # Production могли пересоздать без триггеров (rosatom_creator) - сверяем итоги с источником
+                if totals is None:
+                    totals = self._source_totals(conn, source)
+                if not self._totals_match(self._rollup_totals(conn, table), totals):
+                    conn.execute(f"DELETE FROM {table}")
+                    self._backfill(conn, grain, level, source)
+                    print(f"🧮 {table} расходился с {SOURCE_TABLE} - пересчитан")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self.ready = True
+        return True
+
+    def is_installed(self, conn):
+        """Таблицы и триггеры rollup уже есть в базе"""
+        names = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE ?",
+            (f'%{SOURCE_TABLE}_rollup_%',)
+        )}
+        return all(
+            rollup_table(grain, level) in names and all(
+                f'trg_{rollup_table(grain, level)}_{action}' in names for action in ('insert', 'delete', 'update')
+            )
+            for grain, level in ROLLUPS
+        )
+
+    @staticmethod
+    def _source_totals(conn, source):
+        measures = ', '.join(f'SUM({m}), COUNT({m})' for m in MEASURES)
+        return conn.execute(f"SELECT COUNT(*), {measures} FROM {source}").fetchone()
+
+    @staticmethod
+    def _rollup_totals(conn, table):
+        measures = ', '.join(f'SUM({m}_sum), SUM({m}_count)' for m in MEASURES)
+        return conn.execute(f"SELECT COALESCE(SUM(row_count), 0), {measures} FROM {table}").fetchone()
+
+    @staticmethod
+    def _totals_match(actual, expected):
+        # Суммы REAL накапливаются в другом порядке - сравниваем с относительным допуском
+        return all(
+            a == e if a is None or e is None else abs(a - e) <= 1e-9 * max(abs(a), abs(e), 1)
+            for a, e in zip(actual, expected)
+        )
+
+    @staticmethod
+    def _table_exists(conn, table):
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone() is not None
+
+    def rebuild(self, conn, source=SOURCE_TABLE):
+        """Полный пересчет rollup (например, после массовой загрузки).
+
+        source - таблица или представление с полной историей: при архивных
+        разделах production это объединение всех разделов.
+        """
+        for grain, level in ROLLUPS:
+            conn.execute(f"DELETE FROM {rollup_table(grain, level)}")
+            self._backfill(conn, grain, level, source)
+        conn.commit()
+
+    def drop_triggers(self, conn):
+        """Удаление триггеров без commit: строки production меняются, rollup - нет"""
+        for grain, level in ROLLUPS:
+            table = rollup_table(grain, level)
+            for action in ('insert', 'delete', 'update'):
+                conn.execute(f"DROP TRIGGER IF EXISTS trg_{table}_{action}")
+
+    def create_triggers(self, conn):
+        """Восстановление таблиц и триггеров без commit (существующие не меняются)"""
+        for grain, level in ROLLUPS:
+            for statement in _statements(self._ddl(grain, level)):
+                conn.execute(statement)
+
+    def drop(self, conn):
+        """Удаление rollup и триггеров"""
+        self.drop_triggers(conn)
+        for grain, level in ROLLUPS:
+            conn.execute(f"DROP TABLE IF EXISTS {rollup_table(grain, level)}")
+        conn.commit()
+        self.ready = False
+        self._memo.clear()
+
+    def _ddl(self, grain, level):
+        table = rollup_table(grain, level)
+        dimensions = LEVELS[level]
+        keys = ['bucket', *dimensions, *FLAG_DIMENSIONS]
+        columns = ['bucket TEXT'] + [f'{column} TEXT' for column in dimensions] + [
+            f'{column} INTEGER' for column in FLAG_DIMENSIONS
+        ]
+        indexes = ''.join(
+            f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column}, bucket);\n"
+            for column in dimensions if column != 'product_category'
+        )
+        measure_columns = ',\n'.join(
+            f"    {measure}_sum NUMERIC,\n    {measure}_count INTEGER NOT NULL DEFAULT 0"
+            for measure in MEASURES
+        )
+        # Ключ может содержать NULL, поэтому строки ищутся через IS, а не ON CONFLICT
+        return f"""
+CREATE TABLE IF NOT EXISTS {table} (
+    {', '.join(columns)},
+    row_count INTEGER NOT NULL DEFAULT 0,
+{measure_columns}
+);
+CREATE INDEX IF NOT EXISTS idx_{table}_key ON {table} ({', '.join(keys)});
+{indexes}
+CREATE TRIGGER IF NOT EXISTS trg_{table}_insert AFTER INSERT ON {SOURCE_TABLE}
+BEGIN
+{self._add_row(grain, level, 'NEW')}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{table}_delete AFTER DELETE ON {SOURCE_TABLE}
+BEGIN
+{self._remove_row(grain, level, 'OLD')}
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_{table}_update
+AFTER UPDATE OF date, {', '.join(DIMENSIONS)}, {', '.join(MEASURES)} ON {SOURCE_TABLE}
+BEGIN
+{self._remove_row(grain, level, 'OLD')}
+{self._add_row(grain, level, 'NEW')}
+END;
+"""
+
+    def _key_values(self, grain, level, row):
+        values = {'bucket': GRAINS[grain].format(date=f'{row}.date')}
+        for column in LEVELS[level]:
+            values[column] = f'{row}.{column}'
+        for column, expression in FLAG_DIMENSIONS.items():
+            values[column] = expression.format(date=f'{row}.date', revenue=f'{row}.revenue')
+        return values
+
+    def _key_match(self, grain, level, row):
+        return ' AND '.join(f'{column} IS {value}' for column, value in self._key_values(grain, level, row).items())
+
+    def _add_row(self, grain, level, row):
+        table = rollup_table(grain, level)
+        values = self._key_values(grain, level, row)
+        match = self._key_match(grain, level, row)
+        updates = ',\n        '.join(
+            f"{m}_sum = CASE WHEN {row}.{m} IS NULL THEN {m}_sum ELSE COALESCE({m}_sum, 0) + {row}.{m} END,\n"
+            f"        {m}_count = {m}_count + ({row}.{m} IS NOT NULL)"
+            for m in MEASURES
+        )
+        return f"""    INSERT INTO {table} ({', '.join(values)})
+    SELECT {', '.join(values.values())}
+    WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE {match});
+    UPDATE {table} SET
+        row_count = row_count + 1,
+        {updates}
+    WHERE {match};"""
+
+    def _remove_row(self, grain, level, row):
+        table = rollup_table(grain, level)
+        match = self._key_match(grain, level, row)
+        # Сумма последнего значения обнуляется в NULL - как SUM по пустому набору
+        updates = ',\n        '.join(
+            f"{m}_sum = CASE WHEN {row}.{m} IS NULL THEN {m}_sum WHEN {m}_count = 1 THEN NULL ELSE {m}_sum - {row}.{m} END,\n"
+            f"        {m}_count = {m}_count - ({row}.{m} IS NOT NULL)"
+            for m in MEASURES
+        )
+        return f"""    UPDATE {table} SET
+        row_count = row_count - 1,
+        {updates}
+    WHERE {match};
+    DELETE FROM {table} WHERE row_count <= 0 AND {match};"""
+
+    def _backfill(self, conn, grain, level, source=SOURCE_TABLE):
+        values = self._key_values(grain, level, SOURCE_TABLE)
+        measures = ', '.join(f'SUM({m}), COUNT({m})' for m in MEASURES)
+        measure_columns = ', '.join(f'{m}_sum, {m}_count' for m in MEASURES)
+        conn.execute(f"""
+            INSERT INTO {rollup_table(grain, level)} ({', '.join(values)}, row_count, {measure_columns})
+            SELECT {', '.join(values.values())}, COUNT(*), {measures}
+            FROM {source} AS {SOURCE_TABLE}
+            GROUP BY {', '.join(values.values())}
+        """)
+
+    # --- Переписывание запросов ---
+
+    def rewrite(self, sql):
+        """Запрос к rollup вместо production или None, если запрос не подходит"""
+        if not self.enabled or not self.ready:
+            return None
+        if sql not in self._memo:
+            try:
+                result = self._rewrite(sql)
+            except _NotRewritable:
+                result = None
+            if len(self._memo) >= 1024:
+                self._memo.clear()
+            self._memo[sql] = result
+        result = self._memo[sql]
+        if result is None:
+            self._stats['skipped'] += 1
+            return None
+        rewritten, table = result
+        self._stats['rewrites'] += 1
+        self._by_table[table] += 1
+        return rewritten
+
+    def record_fallback(self):
+        self._stats['fallbacks'] += 1
+
+    def _rewrite(self, sql):
+        if SOURCE_TABLE not in sql.lower():
+            raise _NotRewritable()
+        shape = parse_select(sql)
+        if shape is None or shape.table.lower() != SOURCE_TABLE:
+            raise _NotRewritable()
+
+        qualifiers = [shape.table, shape.table_alias]
+        # Псевдоним с именем столбца production в GROUP BY означал бы столбец, а не псевдоним
+        aliases = shape.aliases - {'date', *MEASURES}
+        grains = set()
+        has_aggregate = False
+
+        items = []
+        for tokens, alias in shape.items:
+            stripped = strip_qualifiers(tokens, qualifiers)
+            expression, item_grains, item_aggregate = self._map_expression(stripped, aliases)
+            grains |= item_grains
+            has_aggregate |= item_aggregate
+            if alias is None:
+                # Имя столбца результата - как у исходного запроса, а не у выражения по rollup
+                alias = result_name(sql, tokens, _SOURCE_COLUMNS)
+            items.append((expression, alias))
+
+        group_by = []
+        for tokens in shape.group_by:
+            expression, term_grains, term_aggregate = self._map_expression(strip_qualifiers(tokens, qualifiers), aliases)
+            if term_aggregate:
+                raise _NotRewritable()
+            grains |= term_grains
+            group_by.append(expression)
+
+        # Без агрегатов и группировки rollup изменил бы число строк
+        if not has_aggregate and not group_by:
+            raise _NotRewritable()
+
+        having = None
+        if shape.having:
+            having, having_grains, _ = self._map_expression(strip_qualifiers(shape.having, qualifiers), aliases)
+            grains |= having_grains
+
+        order_by = []
+        for tokens, direction in shape.order_by:
+            expression, term_grains, _ = self._map_expression(strip_qualifiers(tokens, qualifiers), aliases)
+            grains |= term_grains
+            order_by.append((expression, direction))
+
+        conditions, where_grains, needs_bucket_filter = self._map_where(shape.where, qualifiers)
+        grains |= where_grains
+
+        grain = self._choose_grain(grains, needs_bucket_filter)
+        # Без отдела, товара и категории хватает компактного rollup только по времени
+        expressions = [expression for expression, _ in items] + group_by + conditions + [
+            expression for expression, _ in order_by
+        ] + ([having] if having else [])
+        uses_dimensions = any(
+            token.kind == 'ident' and token.lower in DIMENSIONS
+            for expression in expressions for token in expression
+        )
+        level = 'full' if uses_dimensions else 'total'
+        table = rollup_table(grain, level)
+        mapping = _BUCKET_FROM_ROLLUP[grain]
+
+        def finish(expression):
+            result = []
+            for token in expression:
+                if token.kind == 'bucket':
+                    result.append(Token('raw', mapping[token.value]))
+                else:
+                    result.append(token)
+            return render(result)
+
+        parts = ['SELECT ' + ', '.join(
+            finish(expression) + (' AS "' + alias.replace('"', '""') + '"' if alias else '') for expression, alias in items
+        )]
+        parts.append(f'FROM {table}')
+        if conditions:
+            parts.append('WHERE ' + ' AND '.join(finish(condition) for condition in conditions))
+        if group_by:
+            parts.append('GROUP BY ' + ', '.join(finish(expression) for expression in group_by))
+        if having:
+            parts.append('HAVING ' + finish(having))
+        if order_by:
+            parts.append('ORDER BY ' + ', '.join(
+                finish(expression) + (f' {direction}' if direction else '') for expression, direction in order_by
+            ))
+        if shape.limit:
+            parts.append('LIMIT ' + render(shape.limit))
+        return ' '.join(parts), table
+
+    def _map_expression(self, tokens, aliases):
+        """Замена корзин и агрегатов; (токены, зерна, есть ли агрегат)"""
+        result = []
+        grains = set()
+        has_aggregate = False
+        i = 0
+        while i < len(tokens):
+            token = tokens[i]
+            is_call = (token.kind == 'ident' or token.is_keyword('cast')) and i + 1 < len(tokens) and tokens[i + 1].value == '('
+            if is_call:
+                end = matching_paren(tokens, i + 1)
+                call = canonical(tokens[i:end + 1])
+                if call in _BUCKET_EXPRESSIONS:
+                    grain = _BUCKET_EXPRESSIONS[call]
+                    grains.add(grain)
+                    result.append(Token('bucket', grain))
+                    i = end + 1
+                    continue
+                if token.lower in _AGGREGATES:
+                    result.append(Token('raw', self._map_aggregate(token.lower, canonical(tokens[i + 2:end]))))
+                    has_aggregate = True
+                    i = end + 1
+                    continue
+                if token.lower not in _SQL_FUNCTIONS:
+                    raise _NotRewritable()
+                result.append(token)
+                i += 1
+                continue
+            if token.kind == 'ident' and token.lower not in DIMENSIONS and token.lower not in aliases:
+                # Столбцы вне агрегатов, которых нет в rollup
+                raise _NotRewritable()
+            result.append(token)
+            i += 1
+        return result, grains, has_aggregate
+
+    def _map_aggregate(self, function, argument):
+        if function == 'count' and argument == '*':
+            return 'COALESCE(SUM(row_count), 0)'
+        if argument not in MEASURES:
+            raise _NotRewritable()
+        if function == 'sum':
+            return f'SUM({argument}_sum)'
+        if function == 'total':
+            return f'TOTAL({argument}_sum)'
+        if function == 'count':
+            return f'COALESCE(SUM({argument}_count), 0)'
+        return f'(SUM({argument}_sum) * 1.0 / SUM({argument}_count))'
+
+    def _map_where(self, where, qualifiers):
+        """Условия WHERE для rollup; (условия, нужные корзины, фильтр по корзине)"""
+        if not where:
+            return [], set(), False
+        tokens = strip_qualifiers(where, qualifiers)
+        has_or = any(token.is_keyword('or') for token in tokens)
+        parts = [tokens] if has_or else split_top_level(tokens, 'and')
+
+        conditions = []
+        grains = set()
+        needs_bucket_filter = False
+        for part in parts:
+            text = canonical(part)
+            if text in _CONDITION_REWRITES:
+                conditions.append([Token('raw', _CONDITION_REWRITES[text])])
+                continue
+            if text == 'date is not null':
+                # Корзины дня и месяца равны NULL только при пустой дате
+                needs_bucket_filter = True
+                conditions.append([Token('raw', 'bucket IS NOT NULL')])
+                continue
+            date_range = self._date_range(part)
+            if date_range is not None:
+                grains.add(date_range[0].value)
+                conditions.append(date_range)
+                continue
+            for token in part:
+                if token.kind == 'ident' and token.lower not in DIMENSIONS and token.lower not in _SQL_FUNCTIONS:
+                    raise _NotRewritable()
+            conditions.append(part)
+        return conditions, grains, needs_bucket_filter
+
+    def _date_range(self, part):
+        """date >= X или date < X, где X - дата 'ГГГГ-ММ-ДД' или date('now', ...).
+
+        Для таких границ сравнение полной строки даты и ее первых десяти
+        символов дает одинаковый результат, поэтому условие переносится на
+        корзину дня без изменения смысла. Сравнения ключей дня и месяца
+        (выражений date_keys) с числом или параметром переносятся на те же
+        ключи, вычисленные из корзины.
+        """
+        if len(part) >= 2 and part[0].is_keyword('cast') and part[1].value == '(':
+            end = matching_paren(part, 1)
+            key = _BUCKET_EXPRESSIONS.get(canonical(part[:end + 1]))
+            bound = part[end + 2:]
+            if (key in KEY_EXPRESSIONS and end + 1 < len(part) and part[end + 1].value in ('>=', '<', '>', '<=', '=')
+                    and len(bound) == 1 and bound[0].kind in ('number', 'param')):
+                return [Token('bucket', key), part[end + 1], *bound]
+            return None
+        if len(part) < 3 or part[0].kind != 'ident':
+            return None
+        bound = part[2:]
+        if part[0].lower != 'date' or part[1].value not in ('>=', '<'):
+            return None
+        if len(bound) == 1 and bound[0].kind == 'string' and _ISO_DAY_RE.match(bound[0].value):
+            return [Token('bucket', 'day'), part[1], *bound]
+        if (len(bound) >= 4 and bound[0].kind == 'ident' and bound[0].lower == 'date'
+                and bound[1].value == '(' and matching_paren(bound, 1) == len(bound) - 1
+                and bound[2].kind == 'string' and bound[2].value.lower() == "'now'"
+                and all(token.kind in ('string', 'param') or token.value in (',', ')') for token in bound[3:])):
+            return [Token('bucket', 'day'), part[1], *bound]
+        return None
+
+    def _choose_grain(self, grains, needs_bucket_filter):
+        """Самый маленький rollup, из которого получаются все нужные корзины"""
+        if grains & {'day', 'day_key'}:
+            return 'day'
+        if 'week' in grains:
+            if grains & {'month', 'year', 'month_key'} or needs_bucket_filter:
+                return 'day'
+            return 'week'
+        return 'month'
+
+    def stats(self):
+        return {**self._stats, 'enabled': self.enabled, 'ready': self.ready, 'by_table': dict(self._by_table)}
+
+
+class RewritingCursor:
+    """Курсор, который выполняет подходящие запросы на rollup.
+
+    Остальные запросы к production идут через partitions.route, чтобы
+    читать и архивные разделы.
+    """
+
+    def __init__(self, cursor, rollups, partitions=None):
+        self._cursor = cursor
+        self._rollups = rollups
+        self._partitions = partitions
+
+    def execute(self, sql, params=()):
+        rewritten = self._rollups.rewrite(sql)
+        if rewritten is not None:
+            try:
+                return self._cursor.execute(rewritten, params)
+            except sqlite3.Error as e:
+                print(f"⚠️ Запрос к rollup не выполнен, используем production: {e}")
+                self._rollups.record_fallback()
+        if self._partitions is not None:
+            sql = self._partitions.route(self._cursor.connection, sql, params)
+        return self._cursor.execute(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+if __name__ == '__main__':
+    # python -m database.rollups [ensure|rebuild|drop] [путь к БД]
+    from database.connection import SQLiteProfile, connect, database_path
+    from database.partitions import ProductionPartitions
+
+    command = sys.argv[1] if len(sys.argv) > 1 else 'ensure'
+    path = sys.argv[2] if len(sys.argv) > 2 else database_path()
+    conn = connect(path, SQLiteProfile.from_env().for_writes())
+    rollups = ProductionRollups(enabled=os.getenv('ROLLUPS_ENABLED', '1') != '0')
+    # Полная история production - вместе с архивными разделами
+    source = ProductionPartitions.from_env().source(conn)
+    if command == 'rebuild':
+        rollups.ensure(conn, source)
+        rollups.rebuild(conn, source)
+    elif command == 'drop':
+        rollups.drop(conn)
+    else:
+        rollups.ensure(conn, source)
+    for grain, level in ROLLUPS:
+        table = rollup_table(grain, level)
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (table,)).fetchone():
+            print(f"{table}: {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]} строк")
+    conn.close()
@@ -4,6 +4,9 @@ from datetime import datetime, timedelta
 import random
 import numpy as np
 
+from database.date_keys import ensure_date_keys
+from database.rollups import ProductionRollups
+
 def create_sample_database():
     """Создание расширенной демонстрационной базы данных для Росатома с исправленными датами"""
     
@@ -19,6 +22,8 @@ def create_sample_database():
     ]
     for table in tables:
         cursor.execute(f'DROP TABLE IF EXISTS {table}')
+    # Rollup считались по старой production - приложение заполнит их заново при запуске
+    ProductionRollups().drop(conn)
     
     # Создание таблиц
     
@@ -489,6 +494,7 @@ def create_sample_database():
     # Генерация инцидентов безопасности
     incidents_data = []
     severity_levels = ['Низкий', 'Средний', 'Высокий', 'Критический']
+    incident_types = ['Утечка данных', 'Техническая неполадка', 'Нарушение процедур', 'Кибератака', 'Природное явление']
     categories = ['Технический', 'Человеческий фактор', 'Кибербезопасность', 'Природный', 'Процедурный']
     
     for i in range(1, 201):
@@ -499,8 +505,7 @@ def create_sample_database():
             i,
             incident_date.strftime('%Y-%m-%d'),
             f'{random.randint(0, 23):02d}:{random.randint(0, 59):02d}',
-            f'Инцидент {i}: {random.choice(["Утечка данных", "Техническая неполадка", 
-                                           "Нарушение процедур", "Кибератака", "Природное явление"])}',
+            f'Инцидент {i}: {random.choice(incident_types)}',
             random.choice(categories),
             random.choice(severity_levels),
             random.choice(departments),
@@ -639,6 +644,10 @@ def create_sample_database():
     
     conn.commit()
     
+    # Индексы целочисленных ключей дня и месяца (day_key, month_key)
+    print("Создание ключей дат для фильтров по периоду...")
+    ensure_date_keys(conn)
+    
     # Проверяем данные в таблице production
     print("\nПроверка данных в таблице production...")
     cursor.execute("SELECT COUNT(*) as total FROM production")
@@ -0,0 +1,114 @@
+import io
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow IPC доступен только при установленном pyarrow
+    pa = None
+
+
+RECORDS_FORMAT = 'records'
+COLUMNS_FORMAT = 'columns'
+ARROW_FORMAT = 'arrow'
+
+COLUMNS_MIMETYPE = 'application/vnd.rosatom.columns+json'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+
+class UnsupportedFormatError(Exception):
+    """Запрошенный формат ответа недоступен"""
+
+
+def negotiate_format(requested=None, accept_header=None, allow_arrow=True):
+    """Выбор формата результата по параметру format или заголовку Accept"""
+    if requested:
+        fmt = str(requested).lower()
+        if fmt not in (RECORDS_FORMAT, COLUMNS_FORMAT, ARROW_FORMAT):
+            raise UnsupportedFormatError(f"Неизвестный формат ответа: {requested}")
+    elif accept_header and ARROW_MIMETYPE in accept_header:
+        fmt = ARROW_FORMAT
+    elif accept_header and COLUMNS_MIMETYPE in accept_header:
+        fmt = COLUMNS_FORMAT
+    else:
+        fmt = RECORDS_FORMAT
+
+    if fmt == ARROW_FORMAT:
+        if not allow_arrow:
+            # Для составных JSON ответов Arrow неприменим - отдаем колонки
+            return COLUMNS_FORMAT
+        if pa is None:
+            raise UnsupportedFormatError("Формат Arrow недоступен: не установлен pyarrow")
+    return fmt
+
+
+def rows_to_records(columns, rows):
+    """Строки результата в список словарей (NULL отдается пустой строкой)"""
+    return [
+        {col: ('' if value is None else value) for col, value in zip(columns, row)}
+        for row in rows
+    ]
+
+
+def rows_to_columns(columns, rows):
+    """Строки результата в массивы по колонкам"""
+    if not rows:
+        return [[] for _ in columns]
+    return [list(values) for values in zip(*rows)]
+
+
+def dataframe_to_records(df):
+    """DataFrame в список словарей без промежуточного to_json/json.loads"""
+    if df.empty:
+        return []
+    values = df.astype(object).where(df.notna(), '')
+    return values.to_dict('records')
+
+
+def dataframe_to_columns(df):
+    """DataFrame в массивы по колонкам (NaN -> null)"""
+    return [
+        df[col].astype(object).where(df[col].notna(), None).tolist()
+        for col in df.columns
+    ]
+
+
+def dataframe_to_rows(df):
+    """DataFrame в строки как у курсора (NaN -> None) - для постраничной выдачи"""
+    return list(zip(*dataframe_to_columns(df)))
+
+
+def format_dataframe(df, fmt):
+    """Поля data/columns/format для JSON ответа"""
+    columns = [str(col) for col in df.columns]
+    if fmt == COLUMNS_FORMAT:
+        data = dataframe_to_columns(df)
+    else:
+        data = dataframe_to_records(df)
+        fmt = RECORDS_FORMAT
+    return {'data': data, 'columns': columns, 'format': fmt}
+
+
+def format_rows(columns, rows, fmt):
+    """Поля data/columns/format для строк, прочитанных курсором"""
+    if fmt == COLUMNS_FORMAT:
+        return {'data': rows_to_columns(columns, rows), 'columns': columns, 'format': fmt}
+    return {'data': rows_to_records(columns, rows), 'columns': columns, 'format': RECORDS_FORMAT}
+
+
+def dataframe_to_arrow(df):
+    """DataFrame в поток Arrow IPC"""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    return _write_arrow_stream(table)
+
+
+def rows_to_arrow(columns, rows):
+    """Строки курсора в поток Arrow IPC"""
+    arrays = [pa.array(values) for values in rows_to_columns(columns, rows)]
+    table = pa.Table.from_arrays(arrays, names=columns)
+    return _write_arrow_stream(table)
+
+
+def _write_arrow_stream(table):
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
@@ -0,0 +1,522 @@
+import os
+import re
+import sqlite3
+import sys
+import threading
+from datetime import date, timedelta
+
+from database.sql_shape import (
+    CLAUSES, Token, canonical, looks_numeric, matching_paren, parse_select, render, split_clauses,
+    split_top_level, tokenize
+)
+
+
+# Переписывание сгенерированного SQL перед выполнением. Каждое правило
+# распознает только формы, смысл которых сохраняет, остальной запрос не
+# меняется:
+#   merge_aggregates - UNION ALL агрегатов одной таблицы с одним WHERE -> одно сканирование
+#   date_range       - strftime/substr/date над столбцом даты в условии -> диапазон по столбцу
+#   like_prefix      - LIKE 'префикс%' -> диапазон (индекс по столбцу становится применим)
+#   join_filter      - фильтр правой таблицы LEFT JOIN в WHERE -> условие JOIN
+# LIMIT здесь не добавляется: его ставит проверка плана (QueryPlanGuard) для полных сканирований
+
+_AGGREGATES = ('sum', 'avg', 'count', 'min', 'max', 'total', 'group_concat')
+
+_DATE_COLUMN_RE = re.compile(r'^(?:[a-z_][a-z0-9_]*\.)?(?:date|[a-z0-9_]*_date)$')
+
+# Обертки столбца даты (канонический вид) -> часть даты, тип литерала для сравнения.
+# Сравнение с литералом другого типа в SQLite всегда ложно, такие условия не трогаем.
+_DATE_WRAPPERS = (
+    (re.compile(r"^strftime\('%Y',(?P<column>[a-z0-9_.]+)\)$"), 'year', 'string'),
+    (re.compile(r"^strftime\('%Y-%m',(?P<column>[a-z0-9_.]+)\)$"), 'month', 'string'),
+    (re.compile(r"^strftime\('%Y-%m-%d',(?P<column>[a-z0-9_.]+)\)$"), 'day', 'string'),
+    (re.compile(r"^substr\((?P<column>[a-z0-9_.]+),1,4\)$"), 'year', 'string'),
+    (re.compile(r"^substr\((?P<column>[a-z0-9_.]+),1,7\)$"), 'month', 'string'),
+    (re.compile(r"^substr\((?P<column>[a-z0-9_.]+),1,10\)$"), 'day', 'string'),
+    (re.compile(r"^date\((?P<column>[a-z0-9_.]+)\)$"), 'day', 'string'),
+    (re.compile(r"^cast\(strftime\('%Y',(?P<column>[a-z0-9_.]+)\)as integer\)$"), 'year', 'number'),
+)
+
+_PERIOD_RES = {
+    'year': re.compile(r'^(\d{4})$'),
+    'month': re.compile(r'^(\d{4})-(\d{2})$'),
+    'day': re.compile(r'^(\d{4})-(\d{2})-(\d{2})$'),
+}
+
+# Префикс LIKE по столбцу даты: год, месяц или день (завершающий дефис допускается)
+_DATE_PREFIX_RE = re.compile(r'^(\d{4}(?:-\d{2}(?:-\d{2})?)?)-?$')
+
+_COMPARISONS = ('=', '==', '>=', '>', '<', '<=')
+
+# Слова, после которых начинается самостоятельное условие
+_CONDITION_START = ('where', 'and', 'or', 'on', 'when', 'having', 'not')
+# Слова, которыми условие может заканчиваться
+_CONDITION_END = (
+    'and', 'or', 'then', 'else', 'end', 'group', 'order', 'limit', 'having', 'union', 'intersect', 'except',
+    'join', 'left', 'inner', 'cross', 'where',
+)
+
+# Конструкции, которые могут дать истину для строки, дополненной NULL во внешнем соединении
+_NULL_TOLERANT = ('or', 'case', 'exists', 'select', 'coalesce', 'ifnull', 'iif', 'nullif')
+
+_JOIN_WORDS = ('left', 'inner', 'cross', 'join', 'natural', 'right', 'full', 'outer')
+
+
+class Optimization:
+    """Результат оптимизации: SQL для выполнения и описания примененных правил"""
+
+    def __init__(self, sql, rewrites):
+        self.sql = sql
+        self.rewrites = rewrites
+
+
+def _quote(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _depth_zero(tokens):
+    """Индексы токенов верхнего уровня (вне скобок)"""
+    depth = 0
+    for index, token in enumerate(tokens):
+        if token.value == '(':
+            depth += 1
+        elif token.value == ')':
+            depth -= 1
+        elif depth == 0:
+            yield index
+
+
+def _has_keyword(tokens, *words):
+    return any(tokens[index].is_keyword(*words) for index in _depth_zero(tokens))
+
+
+def _period_bounds(part, value):
+    """Начало периода и начало следующего периода (ISO-даты) или None"""
+    match = _PERIOD_RES[part].match(value)
+    if not match:
+        return None
+    try:
+        if part == 'year':
+            year = int(match.group(1))
+            start, end = date(year, 1, 1), date(year + 1, 1, 1)
+        elif part == 'month':
+            year, month = int(match.group(1)), int(match.group(2))
+            start = date(year, month, 1)
+            end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+        else:
+            start = date.fromisoformat(value)
+            end = start + timedelta(days=1)
+    except ValueError:
+        return None
+    return start.isoformat(), end.isoformat()
+
+
+def _range(column, op, start, end):
+    """Условие по столбцу вместо сравнения части даты с периодом [start, end)"""
+    if op in ('=', '=='):
+        return f"{column} >= {_quote(start)} AND {column} < {_quote(end)}"
+    if op == '>=':
+        return f"{column} >= {_quote(start)}"
+    if op == '>':
+        return f"{column} >= {_quote(end)}"
+    if op == '<':
+        return f"{column} < {_quote(start)}"
+    return f"{column} < {_quote(end)}"
+
+
+def _is_aggregate_call(tokens, index):
+    token = tokens[index]
+    return (token.kind == 'ident' and token.lower in _AGGREGATES
+            and index + 1 < len(tokens) and tokens[index + 1].value == '(')
+
+
+def _aggregate_spans(tokens):
+    """Границы вызовов агрегатов верхнего уровня; None, если столбец используется вне агрегата"""
+    spans = []
+    index = 0
+    while index < len(tokens):
+        if _is_aggregate_call(tokens, index):
+            end = matching_paren(tokens, index + 1)
+            spans.append((index, end))
+            index = end + 1
+            continue
+        token = tokens[index]
+        is_function = token.kind == 'ident' and index + 1 < len(tokens) and tokens[index + 1].value == '('
+        # Имя типа в CAST(... AS INTEGER) - не столбец
+        is_type = index > 0 and tokens[index - 1].is_keyword('as')
+        if token.kind == 'ident' and not is_function and not is_type:
+            return None
+        index += 1
+    return spans
+
+
+class SQLOptimizer:
+    """Оптимизация сгенерированных запросов переписыванием текста.
+
+    Запрос разбирается на токены (sql_shape), правила применяются по
+    очереди, каждое примененное правило печатается в журнал. Результаты
+    запоминаются по тексту запроса: параметры в правилах не участвуют.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        # MATERIALIZED для CTE - с SQLite 3.35; без него CTE читается при каждом обращении
+        self.can_materialize = sqlite3.sqlite_version_info >= (3, 35, 0)
+        self._lock = threading.Lock()
+        self._memo = {}
+        self._stats = {'queries': 0, 'optimized': 0}
+        self._by_rule = {rule: 0 for rule in ('merge_aggregates', 'date_range', 'like_prefix', 'join_filter')}
+
+    @classmethod
+    def from_env(cls):
+        return cls(enabled=os.getenv('SQL_OPTIMIZER_ENABLED', '1') != '0')
+
+    def optimize(self, sql):
+        """Optimization с переписанным (или исходным) SQL"""
+        if not self.enabled:
+            return Optimization(sql, [])
+        with self._lock:
+            result = self._memo.get(sql)
+        if result is None:
+            try:
+                result = self._optimize(sql)
+            except ValueError:
+                result = (sql, [])
+            with self._lock:
+                if len(self._memo) >= 1024:
+                    self._memo.clear()
+                self._memo[sql] = result
+
+        optimized, rewrites = result
+        with self._lock:
+            self._stats['queries'] += 1
+            if rewrites:
+                self._stats['optimized'] += 1
+            for rule, _ in rewrites:
+                self._by_rule[rule] += 1
+        for rule, description in rewrites:
+            print(f"🛠️ Оптимизация SQL ({rule}): {description}")
+        return Optimization(optimized, [description for _, description in rewrites])
+
+    def _optimize(self, sql):
+        tokens = tokenize(sql)
+        if not tokens or not tokens[0].is_keyword('select', 'with'):
+            return sql, []
+        rewrites = []
+
+        merged = self._merge_aggregates(tokens)
+        if merged is not None:
+            tokens, description = merged
+            rewrites.append(('merge_aggregates', description))
+        tokens = self._date_ranges(tokens, rewrites)
+        tokens = self._like_prefixes(tokens, rewrites)
+        pushed = self._join_filters(tokens)
+        if pushed is not None:
+            tokens, description = pushed
+            rewrites.append(('join_filter', description))
+
+        if not rewrites:
+            return sql, []
+        return render(tokens), rewrites
+
+    # --- UNION ALL агрегатов -> одно сканирование ---
+
+    def _merge_aggregates(self, tokens):
+        """SELECT агрегатов ... UNION ALL SELECT агрегатов ... по одной таблице с одним WHERE.
+
+        Каждая ветка без GROUP BY возвращает ровно одну строку, поэтому все
+        агрегаты считаются одним сканированием в материализованном CTE, а
+        ветки выбирают готовые значения из него в прежнем порядке.
+        """
+        if not self.can_materialize or any(token.value == '?' for token in tokens):
+            return None
+        branches = []
+        start = 0
+        top = list(_depth_zero(tokens))
+        for index in top:
+            token = tokens[index]
+            if token.is_keyword('intersect', 'except'):
+                return None
+            if token.is_keyword('union'):
+                if index + 1 >= len(tokens) or not tokens[index + 1].is_keyword('all'):
+                    return None
+                branches.append(tokens[start:index])
+                start = index + 2
+        branches.append(tokens[start:])
+        if len(branches) < 2:
+            return None
+
+        shapes = [parse_select(branch) for branch in branches]
+        if any(shape is None or shape.group_by or shape.having or shape.order_by or shape.limit for shape in shapes):
+            return None
+        first = shapes[0]
+        where = canonical(first.where) if first.where else None
+        for shape in shapes:
+            if shape.table.lower() != first.table.lower() or (shape.table_alias or '').lower() != (first.table_alias or '').lower():
+                return None
+            if (canonical(shape.where) if shape.where else None) != where or len(shape.items) != len(first.items):
+                return None
+
+        measures = {}
+        selects = []
+        for number, shape in enumerate(shapes):
+            items = []
+            has_aggregate = False
+            for item, alias in shape.items:
+                spans = _aggregate_spans(item)
+                if spans is None:
+                    return None
+                has_aggregate |= bool(spans)
+                rebuilt = []
+                position = 0
+                for span_start, span_end in spans:
+                    call = item[span_start:span_end + 1]
+                    name = measures.setdefault(canonical(call), (f"m{len(measures) + 1}", call))[0]
+                    rebuilt.extend(item[position:span_start])
+                    rebuilt.append(Token('ident', name))
+                    position = span_end + 1
+                rebuilt.extend(item[position:])
+                if alias is None and number == 0:
+                    # Имена столбцов результата задает первая ветка - сохраняем их
+                    alias = render(item)
+                items.append(render(rebuilt) + (f' AS "{alias}"' if alias else ''))
+            # Ветка без агрегатов вернула бы строку на каждую строку таблицы
+            if not has_aggregate:
+                return None
+            selects.append(f"SELECT {', '.join(items)} FROM single_scan")
+
+        source = first.table + (f" {first.table_alias}" if first.table_alias else '')
+        inner = ', '.join(f"{render(call)} AS {name}" for name, call in measures.values())
+        sql = f"WITH single_scan AS MATERIALIZED (SELECT {inner} FROM {source}"
+        if first.where:
+            sql += f" WHERE {render(first.where)}"
+        sql += ") " + ' UNION ALL '.join(selects)
+        description = f"UNION ALL из {len(branches)} сканирований {first.table} -> одно сканирование ({len(measures)} агрегатов)"
+        return tokenize(sql), description
+
+    # --- Часть даты -> диапазон ---
+
+    def _condition_bounds(self, tokens, start, end):
+        """Токены [start:end) образуют отдельное условие (не часть выражения)"""
+        before = tokens[start - 1] if start > 0 else None
+        after = tokens[end] if end < len(tokens) else None
+        opens = before is None or before.value == '(' or before.is_keyword(*_CONDITION_START)
+        closes = after is None or after.value == ')' or after.is_keyword(*_CONDITION_END)
+        return opens and closes
+
+    def _replace(self, tokens, start, end, condition):
+        replacement = tokenize(condition)
+        # После NOT диапазон из двух сравнений берется в скобки
+        if start > 0 and tokens[start - 1].is_keyword('not') and len(replacement) > 3:
+            replacement = [Token('punct', '('), *replacement, Token('punct', ')')]
+        return tokens[:start] + replacement + tokens[end:]
+
+    def _date_ranges(self, tokens, rewrites):
+        index = 0
+        while index < len(tokens):
+            token = tokens[index]
+            if not (token.kind in ('ident', 'keyword') and token.lower in ('strftime', 'substr', 'date', 'cast')
+                    and index + 1 < len(tokens) and tokens[index + 1].value == '('):
+                index += 1
+                continue
+            call_end = matching_paren(tokens, index + 1)
+            if call_end + 2 >= len(tokens):
+                index += 1
+                continue
+            op, literal = tokens[call_end + 1], tokens[call_end + 2]
+            call = canonical(tokens[index:call_end + 1])
+            for pattern, part, literal_kind in _DATE_WRAPPERS:
+                match = pattern.match(call)
+                if not match or not _DATE_COLUMN_RE.match(match.group('column')):
+                    continue
+                if op.value not in _COMPARISONS or literal.kind != literal_kind:
+                    break
+                if not self._condition_bounds(tokens, index, call_end + 3):
+                    break
+                value = literal.value[1:-1] if literal.kind == 'string' else literal.value
+                bounds = _period_bounds(part, value)
+                if bounds is None:
+                    break
+                column = match.group('column')
+                condition = _range(column, op.value, *bounds)
+                rewrites.append(('date_range', f"{render(tokens[index:call_end + 3])} -> {condition}"))
+                tokens = self._replace(tokens, index, call_end + 3, condition)
+                break
+            index += 1
+        return tokens
+
+    # --- LIKE 'префикс%' -> диапазон ---
+
+    def _like_prefixes(self, tokens, rewrites):
+        index = 0
+        while index < len(tokens):
+            if not tokens[index].is_keyword('like') or index < 1 or index + 1 >= len(tokens):
+                index += 1
+                continue
+            literal = tokens[index + 1]
+            column_start = index - 3 if index >= 3 and tokens[index - 2].value == '.' else index - 1
+            column_tokens = tokens[column_start:index]
+            if (literal.kind != 'string' or column_start < 0
+                    or any(token.kind != 'ident' for token in column_tokens[::2])
+                    or not self._condition_bounds(tokens, column_start, index + 2)):
+                index += 1
+                continue
+            pattern = literal.value[1:-1].replace("''", "'")
+            prefix = pattern[:-1]
+            if not pattern.endswith('%') or not prefix or '%' in prefix or '_' in prefix:
+                index += 1
+                continue
+
+            column = ''.join(token.value for token in column_tokens)
+            date_prefix = _DATE_PREFIX_RE.match(prefix)
+            if _DATE_COLUMN_RE.match(column.lower()) and date_prefix:
+                value = date_prefix.group(1)
+                part = {4: 'year', 7: 'month', 10: 'day'}[len(value)]
+                bounds = _period_bounds(part, value)
+                if bounds is None:
+                    index += 1
+                    continue
+                lower, upper = bounds
+            else:
+                # LIKE без учета регистра только для латиницы; числовые строки сравнение превратило бы в числа
+                upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+                if re.search(r'[A-Za-z]', prefix) or looks_numeric(prefix) or looks_numeric(upper):
+                    index += 1
+                    continue
+                lower = prefix
+            condition = f"{column} >= {_quote(lower)} AND {column} < {_quote(upper)}"
+            rewrites.append(('like_prefix', f"{column} LIKE {literal.value} -> {condition}"))
+            tokens = self._replace(tokens, column_start, index + 2, condition)
+            index = column_start + 1
+        return tokens
+
+    # --- Фильтр правой таблицы LEFT JOIN -> условие JOIN ---
+
+    def _sources(self, tokens):
+        """Источники FROM: список словарей kind/alias/head/on; None для сложных FROM"""
+        sources = []
+        current = None
+        index = 0
+        while index < len(tokens):
+            token = tokens[index]
+            if token.value == '(' or token.is_keyword('natural', 'right', 'full', 'using'):
+                return None
+            if token.value == ',' or token.is_keyword('left', 'inner', 'cross', 'join'):
+                kind = 'left' if token.is_keyword('left') else 'inner'
+                head = []
+                while index < len(tokens) and (tokens[index].value == ',' or tokens[index].is_keyword(*_JOIN_WORDS)):
+                    head.append(tokens[index])
+                    index += 1
+                current = {'kind': kind, 'head': head, 'source': [], 'on': None}
+                sources.append(current)
+                continue
+            if current is None:
+                current = {'kind': None, 'head': [], 'source': [], 'on': None}
+                sources.append(current)
+            if token.is_keyword('on'):
+                current['on'] = []
+            elif current['on'] is not None:
+                current['on'].append(token)
+            else:
+                current['source'].append(token)
+            index += 1
+
+        for source in sources:
+            names = [token for token in source['source'] if not token.is_keyword('as')]
+            if not names or len(names) > 2 or any(token.kind != 'ident' for token in names):
+                return None
+            source['alias'] = names[-1].lower
+        return sources
+
+    def _rejects_null(self, condition, alias):
+        """Условие ссылается только на alias и ложно/NULL для строки из одних NULL"""
+        qualifiers = set()
+        for index, token in enumerate(condition):
+            if token.value == '?':
+                return False
+            if token.is_keyword(*_NULL_TOLERANT) or (token.kind == 'ident' and token.lower in _NULL_TOLERANT):
+                return False
+            if token.is_keyword('is'):
+                # IS NULL / IS NOT <значение> истинны для NULL; допускается только IS NOT NULL
+                following = [item.lower for item in condition[index + 1:index + 3]]
+                if following != ['not', 'null']:
+                    return False
+            if token.kind != 'ident':
+                continue
+            if index + 1 < len(condition) and condition[index + 1].value == '.':
+                qualifiers.add(token.lower)
+            elif (index == 0 or condition[index - 1].value != '.') and not (
+                    index + 1 < len(condition) and condition[index + 1].value == '('):
+                # Столбец без префикса - неизвестно, к какой таблице он относится
+                return False
+        return qualifiers == {alias} and any(
+            token.value in _COMPARISONS + ('<>', '!=') or token.is_keyword('like', 'in', 'between', 'null')
+            for token in condition
+        )
+
+    def _join_filters(self, tokens):
+        if not tokens[0].is_keyword('select') or any(token.is_keyword('select') for token in tokens[1:]):
+            return None
+        clauses = split_clauses(tokens)
+        if not clauses or not clauses.get('where') or not clauses.get('from'):
+            return None
+        if _has_keyword(clauses['where'], 'or'):
+            return None
+        sources = self._sources(clauses['from'])
+        if sources is None:
+            return None
+        outer = {source['alias']: source for source in sources if source['kind'] == 'left' and source['on']}
+        if not outer:
+            return None
+
+        kept = []
+        moved = []
+        for condition in split_top_level(clauses['where'], 'and'):
+            target = next((source for alias, source in outer.items() if self._rejects_null(condition, alias)), None)
+            if target is None:
+                kept.append(condition)
+                continue
+            if target['kind'] == 'left':
+                target['kind'] = 'inner'
+                target['head'] = [Token('keyword', 'JOIN')]
+                if _has_keyword(target['on'], 'or'):
+                    target['on'] = [Token('punct', '('), *target['on'], Token('punct', ')')]
+            target['on'] = target['on'] + [Token('keyword', 'AND'), *condition]
+            moved.append(render(condition))
+        if not moved:
+            return None
+
+        source_tokens = []
+        for source in sources:
+            source_tokens.extend(source['head'])
+            source_tokens.extend(source['source'])
+            if source['on'] is not None:
+                source_tokens.append(Token('keyword', 'ON'))
+                source_tokens.extend(source['on'])
+        clauses['from'] = source_tokens
+        where = []
+        for condition in kept:
+            if where:
+                where.append(Token('keyword', 'AND'))
+            where.extend(condition)
+        clauses['where'] = where
+
+        result = []
+        for clause in CLAUSES:
+            if clauses.get(clause):
+                result.extend(Token('keyword', word.upper()) for word in clause.split())
+                result.extend(clauses[clause])
+        tables = ', '.join(alias for alias, source in outer.items() if source['kind'] == 'inner')
+        description = f"LEFT JOIN {tables} -> JOIN, в условие соединения перенесено: {'; '.join(moved)}"
+        return result, description
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'by_rule': dict(self._by_rule), 'enabled': self.enabled}
+
+
+if __name__ == '__main__':
+    # python -m database.sql_optimizer "SELECT ..." - показать переписанный запрос
+    optimizer = SQLOptimizer()
+    result = optimizer.optimize(' '.join(sys.argv[1:]) or sys.stdin.read())
+    print(result.sql)
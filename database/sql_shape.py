@@ -0,0 +1,354 @@
+import re
+
+
+# Разбор SQL ровно в том объеме, который нужен для анализа и переписывания
+# простых SELECT: токены, разбиение на предложения и канонический вид выражений.
+
+_TOKEN_RE = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<quoted>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\])
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)
+  | (?P<param>\?\d*|[:@$][A-Za-z_][A-Za-z0-9_]*)
+  | (?P<ident>[A-Za-z_\u0080-\uffff][A-Za-z0-9_$\u0080-\uffff]*)
+  | (?P<op><=|>=|<>|!=|==|\|\||<<|>>|[-+*/%=<>&|~])
+  | (?P<punct>[(),.;])
+""", re.VERBOSE | re.DOTALL)
+
+KEYWORDS = {
+    'select', 'distinct', 'all', 'from', 'where', 'group', 'by', 'having', 'order', 'limit',
+    'offset', 'as', 'and', 'or', 'not', 'is', 'null', 'in', 'like', 'glob', 'between',
+    'case', 'when', 'then', 'else', 'end', 'asc', 'desc', 'collate', 'nocase', 'escape',
+    'join', 'inner', 'left', 'right', 'full', 'outer', 'cross', 'natural', 'on', 'using',
+    'union', 'intersect', 'except', 'with', 'recursive', 'exists', 'over', 'window',
+    'partition', 'nulls', 'first', 'last', 'cast', 'true', 'false',
+}
+
+CLAUSES = ('select', 'from', 'where', 'group by', 'having', 'order by', 'limit')
+
+
+class Token:
+    """Токен SQL: вид (ident, keyword, string, number, param, op, punct) и текст.
+
+    slot - номер (или имя) параметра для токенов param, если его назначил разбор;
+    start/end - границы токена в исходном тексте (None для созданных при переписывании).
+    """
+
+    __slots__ = ('kind', 'value', 'slot', 'start', 'end')
+
+    def __init__(self, kind, value, start=None, end=None):
+        self.kind = kind
+        self.value = value
+        self.slot = None
+        self.start = start
+        self.end = end
+
+    @property
+    def lower(self):
+        return self.value.lower()
+
+    def is_keyword(self, *words):
+        return self.kind == 'keyword' and (not words or self.lower in words)
+
+    def __repr__(self):
+        return f"Token({self.kind}, {self.value!r})"
+
+
+_NUMERIC_TEXT_RE = re.compile(r'^\s*[-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?\s*$')
+
+
+def looks_numeric(value):
+    """Число или строка, которую числовое сродство столбца SQLite превратит в число"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return True
+    return isinstance(value, str) and bool(_NUMERIC_TEXT_RE.match(value))
+
+
+def tokenize(sql):
+    """Разбиение SQL на токены без пробелов и комментариев"""
+    tokens = []
+    position = 0
+    while position < len(sql):
+        match = _TOKEN_RE.match(sql, position)
+        if not match:
+            raise ValueError(f"Не удалось разобрать SQL около: {sql[position:position + 20]!r}")
+        kind = match.lastgroup
+        value = match.group()
+        start, position = match.start(), match.end()
+        if kind in ('space', 'comment'):
+            continue
+        if kind == 'quoted':
+            kind, value = 'ident', value[1:-1]
+        elif kind == 'ident' and value.lower() in KEYWORDS:
+            kind = 'keyword'
+        tokens.append(Token(kind, value, start, position))
+    while tokens and tokens[-1].value == ';':
+        tokens.pop()
+    return tokens
+
+
+def number_params(tokens):
+    """Назначение slot токенам параметров: позиция для ? и ?N, имя для :name"""
+    position = 0
+    for token in tokens:
+        if token.kind != 'param':
+            continue
+        if token.value == '?':
+            token.slot = position
+            position += 1
+        elif token.value.startswith('?'):
+            token.slot = int(token.value[1:]) - 1
+        else:
+            token.slot = token.value[1:]
+    return tokens
+
+
+
+def inline_params(sql, params):
+    """SQL с подставленными значениями параметров - только для показа и отладки"""
+    if not params:
+        return sql
+    values = params if isinstance(params, dict) else dict(enumerate(params))
+    pieces = []
+    position = 0
+    index = 0
+    # Тот же разбор, что и tokenize: параметры в строках и комментариях не затрагиваются
+    while index < len(sql):
+        match = _TOKEN_RE.match(sql, index)
+        if not match:
+            pieces.append(sql[index:])
+            break
+        text = match.group()
+        index = match.end()
+        if match.lastgroup == 'param':
+            if text == '?':
+                key = position
+                position += 1
+            elif text.startswith('?'):
+                key = int(text[1:]) - 1
+            else:
+                key = text[1:]
+            if key in values:
+                value = values[key]
+                text = str(value) if isinstance(value, (int, float)) else "'" + str(value).replace("'", "''") + "'"
+        pieces.append(text)
+    return ''.join(pieces)
+
+def matching_paren(tokens, start):
+    """Индекс закрывающей скобки для открывающей в позиции start"""
+    depth = 0
+    for i in range(start, len(tokens)):
+        if tokens[i].value == '(':
+            depth += 1
+        elif tokens[i].value == ')':
+            depth -= 1
+            if depth == 0:
+                return i
+    raise ValueError("Несбалансированные скобки в SQL")
+
+
+def split_top_level(tokens, separator=','):
+    """Разбиение списка токенов по разделителю вне скобок.
+
+    separator - знак препинания (',') или ключевое слово ('and').
+    """
+    parts = [[]]
+    depth = 0
+    between = 0
+    for token in tokens:
+        if token.value == '(':
+            depth += 1
+        elif token.value == ')':
+            depth -= 1
+        if depth == 0 and token.lower == separator and token.kind in ('punct', 'keyword'):
+            # AND внутри BETWEEN ... AND ... не разделяет условия
+            if separator == 'and' and between:
+                between -= 1
+            else:
+                parts.append([])
+                continue
+        if depth == 0 and token.is_keyword('between'):
+            between += 1
+        parts[-1].append(token)
+    return [part for part in parts if part]
+
+
+def canonical(tokens):
+    """Канонический текст выражения: нижний регистр вне литералов, без лишних пробелов"""
+    result = []
+    previous = None
+    for token in tokens:
+        text = token.value if token.kind in ('string', 'param') else token.lower
+        if token.kind == 'ident' and not re.match(r'^[a-z_][a-z0-9_]*$', text):
+            text = f'"{token.value}"'
+        if previous is not None and _is_word(previous) and _is_word(token):
+            result.append(' ')
+        result.append(text)
+        previous = token
+    return ''.join(result)
+
+
+def render(tokens):
+    """Текст SQL из токенов"""
+    result = []
+    previous = None
+    for token in tokens:
+        text = token.value
+        if token.kind == 'ident' and not re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', text):
+            text = f'"{text}"'
+        if previous is not None and not (
+            token.value in (',', ')', '.') or previous.value in ('(', '.')
+            or (token.value == '(' and previous.kind in ('ident', 'raw'))
+        ):
+            result.append(' ')
+        result.append(text)
+        previous = token
+    return ''.join(result)
+
+
+def result_name(sql, tokens, columns=()):
+    """Имя столбца результата для выражения без псевдонима - как его дает SQLite.
+
+    Ссылка на столбец (в том числе с префиксом таблицы) называется по
+    объявлению столбца (columns), остальные выражения - исходным текстом
+    выражения из sql.
+    """
+    if tokens[-1].kind == 'ident' and (len(tokens) == 1 or (len(tokens) == 3 and tokens[1].value == '.')):
+        declared = {column.lower(): column for column in columns}
+        return declared.get(tokens[-1].lower, tokens[-1].value)
+    if tokens[0].start is None or tokens[-1].end is None:
+        return render(tokens)
+    return sql[tokens[0].start:tokens[-1].end]
+
+
+def _is_word(token):
+    return token.kind in ('ident', 'keyword', 'number', 'string', 'param', 'raw')
+
+
+class SelectShape:
+    """Простой SELECT по одной таблице, разобранный на предложения.
+
+    items - список пар (токены выражения, псевдоним), where/having/limit -
+    токены или None, group_by - список выражений, order_by - список пар
+    (токены выражения, направление).
+    """
+
+    def __init__(self):
+        self.items = []
+        self.table = None
+        self.table_alias = None
+        self.where = None
+        self.group_by = []
+        self.having = None
+        self.order_by = []
+        self.limit = None
+
+    @property
+    def aliases(self):
+        return {alias.lower() for _, alias in self.items if alias}
+
+
+def split_clauses(tokens):
+    """Разбиение на предложения SELECT/FROM/WHERE/... на верхнем уровне"""
+    clauses = {}
+    current = None
+    depth = 0
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.value == '(':
+            depth += 1
+        elif token.value == ')':
+            depth -= 1
+        if depth == 0 and token.kind == 'keyword':
+            word = token.lower
+            if word in ('group', 'order') and i + 1 < len(tokens) and tokens[i + 1].is_keyword('by'):
+                word = f'{word} by'
+                i += 1
+            if word in CLAUSES:
+                if word in clauses:
+                    return None
+                current = word
+                clauses[current] = []
+                i += 1
+                continue
+            if word in ('union', 'intersect', 'except', 'window'):
+                return None
+        if current is None:
+            return None
+        clauses[current].append(token)
+        i += 1
+    return clauses
+
+
+def parse_select(sql):
+    """Разбор простого SELECT по одной таблице; None для всех остальных запросов"""
+    try:
+        tokens = sql if isinstance(sql, list) else tokenize(sql)
+    except ValueError:
+        return None
+    if not tokens or not tokens[0].is_keyword('select'):
+        return None
+
+    clauses = split_clauses(tokens)
+    if not clauses or not clauses.get('select') or not clauses.get('from'):
+        return None
+    if clauses['select'][0].is_keyword('distinct', 'all'):
+        return None
+
+    # Подзапросы и оконные функции не разбираем
+    for clause_tokens in clauses.values():
+        for token in clause_tokens:
+            if token.is_keyword('select', 'over'):
+                return None
+
+    source = clauses['from']
+    if len(source) not in (1, 2, 3) or source[0].kind != 'ident':
+        return None
+    shape = SelectShape()
+    shape.table = source[0].value
+    if len(source) == 2 and source[1].kind == 'ident':
+        shape.table_alias = source[1].value
+    elif len(source) == 3 and source[1].is_keyword('as') and source[2].kind == 'ident':
+        shape.table_alias = source[2].value
+    elif len(source) != 1:
+        return None
+
+    for item in split_top_level(clauses['select']):
+        alias = None
+        if len(item) >= 3 and item[-2].is_keyword('as') and item[-1].kind in ('ident', 'string'):
+            alias = item[-1].value.strip("'")
+            item = item[:-2]
+        elif len(item) >= 2 and item[-1].kind == 'ident' and (item[-2].value == ')' or item[-2].kind == 'ident'):
+            alias = item[-1].value
+            item = item[:-1]
+        shape.items.append((item, alias))
+
+    shape.where = clauses.get('where') or None
+    shape.having = clauses.get('having') or None
+    shape.limit = clauses.get('limit') or None
+    shape.group_by = split_top_level(clauses.get('group by', []))
+    for term in split_top_level(clauses.get('order by', [])):
+        direction = None
+        if term[-1].is_keyword('asc', 'desc'):
+            direction = term[-1].value.upper()
+            term = term[:-1]
+        shape.order_by.append((term, direction))
+    return shape
+
+
+def strip_qualifiers(tokens, names):
+    """Удаление префиксов таблицы (production.revenue, p.revenue -> revenue)"""
+    names = {name.lower() for name in names if name}
+    result = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if (token.kind == 'ident' and token.lower in names and i + 2 < len(tokens)
+                and tokens[i + 1].value == '.' and tokens[i + 2].kind == 'ident'):
+            i += 2
+            continue
+        result.append(token)
+        i += 1
+    return result
@@ -0,0 +1,117 @@
+import random
+import re
+import sqlite3
+
+
+VERSIONS_TABLE = 'table_versions'
+
+# Строка эпохи: случайное число, новое при каждом создании таблицы версий
+EPOCH_KEY = ''
+
+# Производные таблицы меняются только вместе со своим источником
+DERIVED_PATTERNS = ('sqlite_%', f'{VERSIONS_TABLE}', '%_rollup_%')
+
+_SAFE_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def _trigger_name(table, action):
+    return f"trg_{VERSIONS_TABLE}_{table}_{action}"
+
+
+class TableVersions:
+    """Постоянные версии данных таблиц для HTTP-кэширования.
+
+    В таблице table_versions на каждую пользовательскую таблицу хранится
+    счетчик, который увеличивают триггеры AFTER INSERT/UPDATE/DELETE.
+    В отличие от ChangeTracker версии общие для всех процессов (воркеров
+    gunicorn, скриптов обслуживания) и переживают перезапуск, поэтому по
+    ним можно строить ETag. Эпоха меняется при пересоздании базы.
+    """
+
+    ACTIONS = ('insert', 'update', 'delete')
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.ready = False
+
+    def _tracked_tables(self, conn):
+        where = ' AND '.join('name NOT LIKE ?' for _ in DERIVED_PATTERNS)
+        return [
+            row[0] for row in conn.execute(
+                f"SELECT name FROM sqlite_master WHERE type = 'table' AND {where} ORDER BY name",
+                DERIVED_PATTERNS
+            )
+            if _SAFE_NAME_RE.match(row[0])
+        ]
+
+    def ensure(self, conn):
+        """Создание таблицы версий и триггеров; возвращает таблицы, поставленные на учет"""
+        if not self.enabled:
+            return []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} (
+                    table_name TEXT PRIMARY KEY,
+                    version INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute(
+                f"INSERT OR IGNORE INTO {VERSIONS_TABLE} (table_name, version) VALUES (?, ?)",
+                (EPOCH_KEY, random.getrandbits(62))
+            )
+            triggers = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+            added = []
+            for table in self._tracked_tables(conn):
+                missing = [action for action in self.ACTIONS if _trigger_name(table, action) not in triggers]
+                if not missing:
+                    continue
+                for action in missing:
+                    conn.execute(f"""
+                        CREATE TRIGGER {_trigger_name(table, action)} AFTER {action.upper()} ON {table}
+                        BEGIN
+                            UPDATE {VERSIONS_TABLE} SET version = version + 1 WHERE table_name = '{table}';
+                        END
+                    """)
+                # Пока триггеров не было, таблица могла меняться - начинаем с новой версии
+                conn.execute(
+                    f"INSERT INTO {VERSIONS_TABLE} (table_name, version) VALUES (?, 1) "
+                    "ON CONFLICT(table_name) DO UPDATE SET version = version + 1",
+                    (table,)
+                )
+                added.append(table)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        self.ready = True
+        return added
+
+    def is_installed(self, conn):
+        return conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (VERSIONS_TABLE,)
+        ).fetchone() is not None
+
+    def read(self, conn, tables=None):
+        """Эпоха и версии таблиц (None - все); None, если версии не ведутся"""
+        if not self.ready:
+            return None
+        try:
+            rows = dict(conn.execute(f"SELECT table_name, version FROM {VERSIONS_TABLE}").fetchall())
+        except sqlite3.Error:
+            return None
+        epoch = rows.pop(EPOCH_KEY, None)
+        if tables is not None:
+            wanted = {table.lower() for table in tables}
+            rows = {table: version for table, version in rows.items() if table.lower() in wanted}
+        return epoch, rows
+
+    def drop(self, conn):
+        """Удаление триггеров и таблицы версий"""
+        for (name,) in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE ?", (f'trg_{VERSIONS_TABLE}_%',)
+        ).fetchall():
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.execute(f"DROP TABLE IF EXISTS {VERSIONS_TABLE}")
+        conn.commit()
+        self.ready = False
@@ -3,6 +3,8 @@ import pandas as pd
 from datetime import datetime, timedelta
 import re
 
+from database.date_keys import key_expression
+
 def diagnose_sales_dynamics():
     """Диагностика проблемы с динамикой продаж"""
     print("🔍 Диагностика запроса 'динамика продаж за последний год'")
@@ -38,7 +40,11 @@ def diagnose_sales_dynamics():
         sample_dates = cursor.fetchall()
         for i, (date_val, date_type) in enumerate(sample_dates, 1):
             print(f"   {i}. '{date_val}' (тип: {date_type})")
-        
+
+        # Даты, которые SQLite не распознает, получают пустой ключ дня
+        cursor.execute(f"SELECT COUNT(*) FROM production WHERE date IS NOT NULL AND {key_expression('day_key')} IS NULL")
+        print(f"   - Записей с нераспознанной датой (пустой ключ дня): {cursor.fetchone()[0]:,}")
+
         # 5. Проверим наличие данных за последний год
         print("\n5. 📊 Данные за последний год:")
         one_year_ago = (datetime.now() - timedelta(days=365)).strftime('%Y-%m-%d')
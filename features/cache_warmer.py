@@ -0,0 +1,201 @@
+import os
+import threading
+import time
+from datetime import date
+
+from ai.nl_cache import normalize_question
+
+
+# Каталог частых вопросов: примеры из интерфейса, подсказки в тексте ошибки
+# и проверочный список генератора SQL (ai/fix_sql_generator.py)
+DEFAULT_QUESTIONS = [
+    "Покажи топ-5 товаров по продажам за последний месяц",
+    "Сколько сотрудников в каждом отделе?",
+    "Какая общая выручка по проектам?",
+    "Покажи динамику продаж за последний год",
+    "Покажи все проекты",
+    "Сколько сотрудников в компании?",
+    "Какая общая выручка?",
+    "Покажи топ-5 товаров",
+    "Сколько всего сотрудников?",
+    "Какие проекты в работе?",
+    "Покажи последние продажи",
+]
+
+
+def load_catalog(path):
+    """Вопросы каталога из файла: по одному в строке, # - комментарий"""
+    with open(path, encoding='utf-8') as f:
+        lines = [line.strip() for line in f]
+    return [line for line in lines if line and not line.startswith('#')]
+
+
+class CacheWarmer:
+    """Прогрев ответов на вопросы каталога.
+
+    После запуска (start) фоновый поток считает ответ (SQL, данные, анализ,
+    визуализацию) для каждого вопроса каталога, заодно заполняя кэш
+    вопросов, кэш модели и кэш результатов запросов. Раз в interval секунд
+    поток сверяет версию данных и пересчитывает ответы, таблицы которых
+    изменились. Ответ отдается, только если версия данных его таблиц не
+    изменилась с момента расчета, а ответ по SQL с date('now') - только в
+    день расчета; вопросы ищутся по нормализованному тексту.
+    """
+
+    def __init__(self, answer, data_version, questions=None, interval=60.0, enabled=True):
+        self.answer = answer
+        self.data_version = data_version
+        self.questions = list(questions if questions is not None else DEFAULT_QUESTIONS)
+        self.interval = interval
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._entries = {}
+        self._catalog = {}
+        for question in self.questions:
+            self._catalog.setdefault(normalize_question(question), question)
+        self._seen = None
+        self._stats = {
+            'hits': 0, 'misses': 0, 'stale': 0, 'warmed': 0, 'failures': 0,
+            'rounds': 0, 'last_duration_ms': 0.0, 'last_error': None,
+        }
+
+    @classmethod
+    def from_env(cls, answer, data_version):
+        path = os.getenv('WARMUP_CATALOG')
+        questions = None
+        if path:
+            try:
+                questions = load_catalog(path)
+            except OSError as e:
+                print(f"⚠️ Не удалось прочитать каталог вопросов {path}: {e}")
+        return cls(
+            answer,
+            data_version,
+            questions=questions,
+            interval=float(os.getenv('WARMUP_INTERVAL', '60')),
+            enabled=os.getenv('WARMUP_ENABLED', '1') != '0'
+        )
+
+    def start(self):
+        """Прогрев в фоновом потоке: сразу и далее после изменений данных.
+
+        Повторные вызовы ничего не делают, поэтому start можно вызывать на
+        каждый запрос.
+        """
+        if not self.enabled or self._thread is not None:
+            return False
+        with self._lock:
+            if self._thread is not None:
+                return False
+            self._thread = threading.Thread(target=self._run, name='cache-warmer', daemon=True)
+            self._thread.start()
+        return True
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                with self._lock:
+                    self._stats['last_error'] = str(e)
+                print(f"⚠️ Ошибка прогрева кэша ответов: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def refresh(self, force=False):
+        """Пересчет отсутствующих и устаревших ответов; число пересчитанных"""
+        # Со сменой даты устаревают ответы по SQL с date('now')
+        seen = (self.data_version(None), date.today().isoformat())
+        with self._lock:
+            complete = len(self._entries) == len(self._catalog)
+            if not force and complete and seen == self._seen:
+                return 0
+
+        started = time.time()
+        warmed = 0
+        for key, question in self._catalog.items():
+            if self._stop.is_set():
+                break
+            with self._lock:
+                entry = self._entries.get(key)
+            if not force and entry is not None and self._is_fresh(entry):
+                continue
+            if self._warm(key, question):
+                warmed += 1
+
+        with self._lock:
+            self._seen = seen
+            self._stats['rounds'] += 1
+            self._stats['last_duration_ms'] = round((time.time() - started) * 1000, 2)
+        if warmed:
+            print(f"🔥 Прогрето ответов: {warmed} из {len(self._catalog)}")
+        return warmed
+
+    def _warm(self, key, question):
+        before = self.data_version(None)
+        try:
+            answer = self.answer(question)
+        except Exception as e:
+            with self._lock:
+                self._stats['failures'] += 1
+                self._stats['last_error'] = str(e)
+            print(f"⚠️ Не удалось прогреть «{question}»: {e}")
+            return False
+        if not answer.get('executed'):
+            with self._lock:
+                self._stats['failures'] += 1
+            return False
+        # Данные изменились во время расчета - ответ не запоминаем, его пересчитает следующий проход
+        if self.data_version(None) != before:
+            return False
+        version = self.data_version(answer['tables'])
+        # date('now') меняется раз в сутки - как и в кэше запросов, ответ привязан к дате расчета
+        today = date.today().isoformat() if "'now'" in (answer.get('sql_query') or '').lower() else None
+        with self._lock:
+            self._entries[key] = {'answer': answer, 'tables': answer['tables'], 'version': version, 'today': today}
+            self._stats['warmed'] += 1
+        return True
+
+    def _is_fresh(self, entry):
+        if entry['today'] is not None and entry['today'] != date.today().isoformat():
+            return False
+        return self.data_version(entry['tables']) == entry['version']
+
+    def get(self, question):
+        """Прогретый ответ на вопрос каталога или None"""
+        if not self.enabled:
+            return None
+        key = normalize_question(question)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            with self._lock:
+                self._stats['misses'] += 1
+            return None
+        if not self._is_fresh(entry):
+            # Данные или дата изменились - ответ пересчитает фоновый поток
+            with self._lock:
+                self._stats['stale'] += 1
+            return None
+        with self._lock:
+            self._stats['hits'] += 1
+        print(f"🔥 Ответ из прогретого кэша: «{key}»")
+        return entry['answer']
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                'catalog': len(self._catalog),
+                'entries': len(self._entries),
+                'enabled': self.enabled,
+                'interval': self.interval,
+            }
@@ -5,6 +5,8 @@ import json
 import numpy as np
 from datetime import datetime
 
+from ai.intent_engine import get_intent_engine
+
 class DashboardVisualizer:
     def __init__(self):
         self.colors = px.colors.qualitative.Set3
@@ -12,28 +14,8 @@ class DashboardVisualizer:
     def determine_visualization_type(self, query):
         """Определение типа визуализации на основе запроса"""
         
-        query_lower = query.lower()
-        
-        # Паттерны для определения типа визуализации
-        if any(word in query_lower for word in ['топ', 'топ-', 'первые', 'последние', 'лучшие', 'худшие', 'больше всего']):
-            return 'bar'
-        elif any(word in query_lower for word in ['тренд', 'изменен', 'динамика', 'истори', 'времен', 'месяц', 'год', 'недел', 'день']):
-            return 'line'
-        elif any(word in query_lower for word in ['распределен', 'частота', 'сколько', 'количество', 'сколько всего']):
-            return 'histogram'
-        elif any(word in query_lower for word in ['сравнен', 'процент', 'доля', 'соотношен', 'часть', 'какой процент']):
-            return 'pie'
-        elif any(word in query_lower for word in ['корреляц', 'зависимос', 'связь', 'зависит']):
-            return 'scatter'
-        elif any(word in query_lower for word in ['таблица', 'список', 'перечень', 'все']):
-            return 'table'
-        elif any(word in query_lower for word in ['карта', 'гео', 'локац']):
-            return 'map'
-        elif any(word in query_lower for word in ['выручк', 'доход', 'прибыль', 'бюджет', 'зарплат', 'стоимость']):
-            # Для финансовых данных часто подходит столбчатая диаграмма
-            return 'bar'
-        else:
-            return None  # Автоматический выбор
+        # Тип графика - группа chart общего движка намерений; None - автоматический выбор
+        return get_intent_engine().intent(query, 'chart')
     
     def create_visualization(self, df, chart_type='auto', query=None):
         """Создание визуализации на основе данных"""
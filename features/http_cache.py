@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import date
+from functools import wraps
+
+from flask import g, make_response, request
+
+from database.sql_shape import tokenize
+
+
+# Cache-Control по видам ответов: no-cache - браузер хранит ответ, но каждый раз перепроверяет ETag
+CACHE_POLICIES = {
+    'data': 'private, no-cache',
+    'schema': 'private, no-cache',
+    'report': 'private, no-cache',
+    'volatile': 'no-store',
+}
+
+
+def mentioned_tables(queries):
+    """Все идентификаторы запросов как кандидаты в таблицы (None - не удалось разобрать).
+
+    Лишние имена не мешают: версии берутся только для таблиц, которые ведутся.
+    """
+    names = set()
+    for sql in queries:
+        try:
+            names.update(token.lower for token in tokenize(sql) if token.kind == 'ident')
+        except ValueError:
+            return None
+    return sorted(names)
+
+
+class ConditionalResponses:
+    """Условные HTTP-запросы (ETag / 304) по версиям данных таблиц.
+
+    ETag ответа - хэш эпохи базы, версий таблиц, от которых зависит ответ,
+    параметров запроса и текущей даты (периоды отчетов считаются от сегодня).
+    Если клиент прислал тот же ETag в If-None-Match, ответ 304 отдается до
+    выполнения каких-либо запросов к данным.
+    """
+
+    def __init__(self, db_manager, enabled=True):
+        self.db_manager = db_manager
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {'not_modified': 0, 'tagged': 0, 'untagged': 0, 'errors': 0}
+
+    @classmethod
+    def from_env(cls, db_manager):
+        return cls(db_manager, enabled=os.getenv('HTTP_CACHE_ENABLED', '1') != '0')
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def skip(self):
+        """Не выдавать ETag текущему ответу (например, частичный результат из-за бюджета)"""
+        g.http_cache_skip = True
+
+    def etag(self, tables=None, extra=None):
+        """ETag для текущего запроса; None - версии данных недоступны"""
+        data = request.get_json(silent=True) if request.method != 'GET' else None
+        if callable(tables):
+            tables = tables(data or {})
+        versions = self.db_manager.get_table_versions(tables)
+        if versions is None:
+            return None
+        epoch, table_versions = versions
+        key = json.dumps([
+            epoch,
+            sorted(table_versions.items()),
+            request.path,
+            sorted(request.args.items(multi=True)),
+            data,
+            request.headers.get('Accept'),
+            date.today().isoformat(),
+            extra() if callable(extra) else extra,
+        ], sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+    def conditional(self, policy='data', tables=None, extra=None):
+        """Декоратор представления: 304 по If-None-Match, ETag и Cache-Control у ответа 200.
+
+        tables - список таблиц или функция от тела запроса (None - все таблицы),
+        extra - дополнительная часть ключа (значение или функция без аргументов).
+        """
+        cache_control = CACHE_POLICIES[policy]
+
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                tag = None
+                if self.enabled:
+                    try:
+                        tag = self.etag(tables, extra)
+                    except Exception as e:
+                        self._count('errors')
+                        print(f"⚠️ Не удалось вычислить ETag: {e}")
+
+                if tag is not None and request.if_none_match.contains_weak(tag):
+                    self._count('not_modified')
+                    response = make_response('', 304)
+                    response.set_etag(tag, weak=True)
+                    response.headers['Cache-Control'] = cache_control
+                    return response
+
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response.headers.setdefault('Cache-Control', cache_control)
+                if tag is not None and not g.get('http_cache_skip'):
+                    response.set_etag(tag, weak=True)
+                    self._count('tagged')
+                else:
+                    self._count('untagged')
+                return response
+            return wrapper
+        return decorator
+
+    def cache_control(self, policy):
+        """Декоратор представления: только заголовок Cache-Control, без ETag"""
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                response = make_response(view(*args, **kwargs))
+                response.headers.setdefault('Cache-Control', CACHE_POLICIES[policy])
+                return response
+            return wrapper
+        return decorator
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, 'enabled': self.enabled}
@@ -4,6 +4,8 @@ from datetime import datetime, timedelta
 import json
 import re
 
+from ai.intent_engine import get_intent_engine
+
 class ReportGenerator:
     def __init__(self):
         pass
@@ -38,20 +40,7 @@ class ReportGenerator:
     
     def _analyze_query_type(self, query):
         """Анализ типа запроса"""
-        query_lower = query.lower()
-        
-        if any(word in query_lower for word in ['сравн', 'compare', 'сопостав', 'против']):
-            return "comparison"
-        elif any(word in query_lower for word in ['топ', 'лучш', 'первые', 'последние', 'ranking', 'рейтинг']):
-            return "ranking"
-        elif any(word in query_lower for word in ['сколько', 'сумм', 'общ', 'всего', 'итог', 'total', 'sum']):
-            return "aggregation"
-        elif any(word in query_lower for word in ['тренд', 'динамик', 'изменен', 'рост', 'снижен', 'trend']):
-            return "trend"
-        elif any(word in query_lower for word in ['распределен', 'частота', 'сколько всего', 'distribution']):
-            return "distribution"
-        else:
-            return "general"
+        return get_intent_engine().intent(query, 'analysis') or "general"
     
     def _generate_comparison_analysis(self, df, query):
         """Анализ для сравнений"""
@@ -3,6 +3,8 @@ import os
 from datetime import datetime, timedelta
 import random
 
+from database.date_keys import ensure_date_keys
+
 def create_database():
     """Создание всей структуры базы данных"""
     
@@ -210,6 +212,9 @@ def create_database():
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_proj_status ON projects(status)')
     
     conn.commit()
+    
+    # Ключи дня и месяца для индексных фильтров по периоду
+    ensure_date_keys(conn)
     conn.close()
     
     print("\n✅ База данных успешно создана и заполнена!")
@@ -0,0 +1,47 @@
+// Условные POST-запросы к API: ответ хранится вместе с ETag, повторный
+// запрос отправляет If-None-Match и при 304 берет сохраненный ответ.
+// Браузер сам не кэширует POST, поэтому ETag и ответ держим в sessionStorage.
+
+const ETAG_STORAGE_PREFIX = 'etag:';
+
+function readCachedResponse(key) {
+    try {
+        const stored = sessionStorage.getItem(ETAG_STORAGE_PREFIX + key);
+        return stored ? JSON.parse(stored) : null;
+    } catch (error) {
+        return null;
+    }
+}
+
+function storeCachedResponse(key, etag, payload) {
+    try {
+        sessionStorage.setItem(ETAG_STORAGE_PREFIX + key, JSON.stringify({ etag, payload }));
+    } catch (error) {
+        // Переполнение хранилища - просто не кэшируем этот ответ
+        console.warn('Ответ не сохранен для повторного использования:', error);
+    }
+}
+
+function postJsonConditional(url, body) {
+    const requestBody = JSON.stringify(body);
+    const key = url + ' ' + requestBody;
+    const cached = readCachedResponse(key);
+    const headers = { 'Content-Type': 'application/json' };
+    if (cached && cached.etag) {
+        headers['If-None-Match'] = cached.etag;
+    }
+
+    return fetch(url, { method: 'POST', headers, body: requestBody })
+    .then(response => {
+        if (response.status === 304 && cached) {
+            return cached.payload;
+        }
+        return response.json().then(payload => {
+            const etag = response.headers.get('ETag');
+            if (response.ok && etag) {
+                storeCachedResponse(key, etag, payload);
+            }
+            return payload;
+        });
+    });
+}
@@ -17,18 +17,91 @@ function setupEventListeners() {
     document.querySelector('button[onclick="generateAIInsights()"]').addEventListener('click', generateAIInsights);
 }
 
+// Запросы виджетов дашборда: загружаются одним пакетом через /api/execute_batch
+const DASHBOARD_QUERIES = {
+    total_employees: "SELECT COUNT(*) as total_employees FROM employees",
+    active_projects: "SELECT COUNT(*) as active_projects FROM projects WHERE status = 'В работе'",
+    total_revenue: "SELECT SUM(revenue) as total_revenue FROM production WHERE revenue IS NOT NULL",
+    safety_score: "SELECT (COUNT(CASE WHEN severity = 'Низкий' THEN 1 END) * 100.0 / COUNT(*)) as safety_score FROM safety_incidents",
+    department_chart: "SELECT department, COUNT(*) as employee_count FROM employees GROUP BY department ORDER BY employee_count DESC LIMIT 10",
+    sales_chart: `
+        SELECT 
+            substr(date, 1, 7) as month,
+            SUM(revenue) as total_revenue
+        FROM production 
+        WHERE date IS NOT NULL AND revenue IS NOT NULL
+        GROUP BY substr(date, 1, 7)
+        ORDER BY month DESC
+        LIMIT 12
+    `,
+    project_status: "SELECT status, COUNT(*) as count FROM projects GROUP BY status",
+    top_products: `
+        SELECT 
+            product_name,
+            SUM(revenue) as total_revenue
+        FROM production 
+        WHERE revenue IS NOT NULL
+        GROUP BY product_name 
+        ORDER BY total_revenue DESC 
+        LIMIT 5
+    `,
+    safety_incidents: `
+        SELECT 
+            date,
+            description,
+            severity,
+            department,
+            resolved
+        FROM safety_incidents 
+        ORDER BY date DESC 
+        LIMIT 10
+    `,
+    top_employees: `
+        SELECT 
+            first_name || ' ' || last_name as full_name,
+            department,
+            position,
+            performance_score,
+            salary
+        FROM employees 
+        WHERE performance_score IS NOT NULL
+        ORDER BY performance_score DESC 
+        LIMIT 10
+    `
+};
+
+const KPI_QUERIES = ['total_employees', 'active_projects', 'total_revenue', 'safety_score'];
+
+function fetchDashboardBatch(names) {
+    const queries = {};
+    names.forEach(name => {
+        queries[name] = DASHBOARD_QUERIES[name];
+    });
+    
+    // Данные не менялись - сервер отвечает 304, и берется сохраненный ответ
+    return postJsonConditional('/api/execute_batch', { queries })
+    .then(data => {
+        if (!data.success) {
+            throw new Error(data.error || 'Ошибка пакетного запроса');
+        }
+        return data.results;
+    });
+}
+
 function loadDashboardData() {
     console.log('Loading dashboard data...');
     
-    // Загружаем все данные параллельно
+    // Все виджеты получают данные из одного пакетного запроса
+    const batch = fetchDashboardBatch(Object.keys(DASHBOARD_QUERIES));
+    
     Promise.all([
-        loadKPIMetrics(),
-        loadDepartmentChart(),
-        loadSalesChart(),
-        loadProjectStatusChart(),
-        loadTopProductsChart(),
-        loadSafetyIncidents(),
-        loadTopEmployees(),
+        loadKPIMetrics(batch),
+        loadDepartmentChart(batch),
+        loadSalesChart(batch),
+        loadProjectStatusChart(batch),
+        loadTopProductsChart(batch),
+        loadSafetyIncidents(batch),
+        loadTopEmployees(batch),
         loadAIInsights()
     ]).then(() => {
         console.log('All dashboard data loaded successfully');
@@ -38,93 +111,44 @@ function loadDashboardData() {
     });
 }
 
-function loadKPIMetrics() {
-    return new Promise((resolve, reject) => {
-        fetch('/api/execute_sql', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                sql: "SELECT COUNT(*) as total_employees FROM employees"
-            })
-        })
-        .then(response => response.json())
-        .then(data => {
-            if (data.success) {
-                document.getElementById('totalEmployees').textContent = 
-                    data.data[0]?.total_employees || 0;
-            }
-            return fetch('/api/execute_sql', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    sql: "SELECT COUNT(*) as active_projects FROM projects WHERE status = 'В работе'"
-                })
-            });
-        })
-        .then(response => response.json())
-        .then(data => {
-            if (data.success) {
-                document.getElementById('activeProjects').textContent = 
-                    data.data[0]?.active_projects || 0;
-            }
-            return fetch('/api/execute_sql', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    sql: "SELECT SUM(revenue) as total_revenue FROM production WHERE revenue IS NOT NULL"
-                })
-            });
-        })
-        .then(response => response.json())
-        .then(data => {
-            if (data.success) {
-                const revenue = data.data[0]?.total_revenue || 0;
-                document.getElementById('totalRevenue').textContent = 
-                    formatCurrency(revenue);
-            }
-            return fetch('/api/execute_sql', {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json'
-                },
-                body: JSON.stringify({
-                    sql: "SELECT (COUNT(CASE WHEN severity = 'Низкий' THEN 1 END) * 100.0 / COUNT(*)) as safety_score FROM safety_incidents"
-                })
-            });
-        })
-        .then(response => response.json())
-        .then(data => {
-            if (data.success) {
-                const score = data.data[0]?.safety_score || 100;
-                document.getElementById('safetyScore').textContent = 
-                    Math.round(score) + '%';
-            }
-            resolve();
-        })
-        .catch(error => {
-            console.error('Error loading KPI metrics:', error);
-            reject(error);
-        });
+function loadKPIMetrics(batch) {
+    return (batch || fetchDashboardBatch(KPI_QUERIES))
+    .then(results => {
+        const employees = results.total_employees;
+        if (employees.success) {
+            document.getElementById('totalEmployees').textContent = 
+                employees.data[0]?.total_employees || 0;
+        }
+        
+        const projects = results.active_projects;
+        if (projects.success) {
+            document.getElementById('activeProjects').textContent = 
+                projects.data[0]?.active_projects || 0;
+        }
+        
+        const revenueResult = results.total_revenue;
+        if (revenueResult.success) {
+            const revenue = revenueResult.data[0]?.total_revenue || 0;
+            document.getElementById('totalRevenue').textContent = 
+                formatCurrency(revenue);
+        }
+        
+        const safety = results.safety_score;
+        if (safety.success) {
+            const score = safety.data[0]?.safety_score || 100;
+            document.getElementById('safetyScore').textContent = 
+                Math.round(score) + '%';
+        }
+    })
+    .catch(error => {
+        console.error('Error loading KPI metrics:', error);
+        throw error;
     });
 }
 
-function loadDepartmentChart() {
-    fetch('/api/execute_sql', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-            sql: "SELECT department, COUNT(*) as employee_count FROM employees GROUP BY department ORDER BY employee_count DESC LIMIT 10"
-        })
-    })
-    .then(response => response.json())
+function loadDepartmentChart(batch) {
+    return (batch || fetchDashboardBatch(['department_chart']))
+    .then(results => results.department_chart)
     .then(data => {
         if (data.success && data.data.length > 0) {
             createDepartmentChart(data.data);
@@ -186,26 +210,9 @@ function createDepartmentChart(data) {
     });
 }
 
-function loadSalesChart() {
-    fetch('/api/execute_sql', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-            sql: `
-                SELECT 
-                    substr(date, 1, 7) as month,
-                    SUM(revenue) as total_revenue
-                FROM production 
-                WHERE date IS NOT NULL AND revenue IS NOT NULL
-                GROUP BY substr(date, 1, 7)
-                ORDER BY month DESC
-                LIMIT 12
-            `
-        })
-    })
-    .then(response => response.json())
+function loadSalesChart(batch) {
+    return (batch || fetchDashboardBatch(['sales_chart']))
+    .then(results => results.sales_chart)
     .then(data => {
         if (data.success && data.data.length > 0) {
             createSalesChart(data.data.reverse());
@@ -275,17 +282,9 @@ function createSalesChart(data) {
     });
 }
 
-function loadProjectStatusChart() {
-    fetch('/api/execute_sql', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-            sql: "SELECT status, COUNT(*) as count FROM projects GROUP BY status"
-        })
-    })
-    .then(response => response.json())
+function loadProjectStatusChart(batch) {
+    return (batch || fetchDashboardBatch(['project_status']))
+    .then(results => results.project_status)
     .then(data => {
         if (data.success && data.data.length > 0) {
             createProjectStatusChart(data.data);
@@ -346,26 +345,9 @@ function createProjectStatusChart(data) {
     });
 }
 
-function loadTopProductsChart() {
-    fetch('/api/execute_sql', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-            sql: `
-                SELECT 
-                    product_name,
-                    SUM(revenue) as total_revenue
-                FROM production 
-                WHERE revenue IS NOT NULL
-                GROUP BY product_name 
-                ORDER BY total_revenue DESC 
-                LIMIT 5
-            `
-        })
-    })
-    .then(response => response.json())
+function loadTopProductsChart(batch) {
+    return (batch || fetchDashboardBatch(['top_products']))
+    .then(results => results.top_products)
     .then(data => {
         if (data.success && data.data.length > 0) {
             createTopProductsChart(data.data);
@@ -431,27 +413,9 @@ function createTopProductsChart(data) {
     });
 }
 
-function loadSafetyIncidents() {
-    fetch('/api/execute_sql', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-            sql: `
-                SELECT 
-                    date,
-                    description,
-                    severity,
-                    department,
-                    resolved
-                FROM safety_incidents 
-                ORDER BY date DESC 
-                LIMIT 10
-            `
-        })
-    })
-    .then(response => response.json())
+function loadSafetyIncidents(batch) {
+    return (batch || fetchDashboardBatch(['safety_incidents']))
+    .then(results => results.safety_incidents)
     .then(data => {
         if (data.success) {
             createSafetyTable(data.data);
@@ -530,28 +494,9 @@ function getSeverityClass(severity) {
     }
 }
 
-function loadTopEmployees() {
-    fetch('/api/execute_sql', {
-        method: 'POST',
-        headers: {
-            'Content-Type': 'application/json'
-        },
-        body: JSON.stringify({
-            sql: `
-                SELECT 
-                    first_name || ' ' || last_name as full_name,
-                    department,
-                    position,
-                    performance_score,
-                    salary
-                FROM employees 
-                WHERE performance_score IS NOT NULL
-                ORDER BY performance_score DESC 
-                LIMIT 10
-            `
-        })
-    })
-    .then(response => response.json())
+function loadTopEmployees(batch) {
+    return (batch || fetchDashboardBatch(['top_employees']))
+    .then(results => results.top_employees)
     .then(data => {
         if (data.success) {
             createEmployeesTable(data.data);
@@ -2,6 +2,9 @@
 
 let currentConversation = [];
 let currentVisualizationData = null;
+let currentResultPage = null;
+
+const RESULT_PAGE_SIZE = 100;
 
 // Установка примера запроса
 function setExample(exampleCard) {
@@ -38,7 +41,8 @@ async function sendMessage() {
             },
             body: JSON.stringify({
                 query: query,
-                history: currentConversation
+                history: currentConversation,
+                page_size: RESULT_PAGE_SIZE
             })
         });
         
@@ -264,13 +268,7 @@ function updateDataTab(data) {
                     <tbody>
         `;
         
-        rows.forEach(row => {
-            tableHTML += '<tr>';
-            columns.forEach(col => {
-                tableHTML += `<td>${row[col] || ''}</td>`;
-            });
-            tableHTML += '</tr>';
-        });
+        tableHTML += renderTableRows(rows, columns);
         
         tableHTML += `
                     </tbody>
@@ -278,11 +276,24 @@ function updateDataTab(data) {
             </div>
             <div class="table-info">
                 <p>Найдено записей: ${data.row_count || rows.length}</p>
+                <p id="loadedRowsInfo"></p>
+                <button id="loadMoreRowsBtn" class="btn btn-secondary" onclick="loadMoreRows()" style="display: none;">
+                    Загрузить еще
+                </button>
             </div>
         `;
         
         document.getElementById('dataContainer').innerHTML = tableHTML;
+        
+        // Остальные строки большого ответа догружаются по дескриптору результата
+        currentResultPage = {
+            handle: data.has_more ? data.result_handle : null,
+            columns: columns,
+            loaded: rows.length
+        };
+        updateLoadMoreControls();
     } else {
+        currentResultPage = null;
         document.getElementById('dataContainer').innerHTML = `
             <div class="empty-state">
                 <div class="empty-icon">📋</div>
@@ -293,6 +304,58 @@ function updateDataTab(data) {
     }
 }
 
+// HTML строк таблицы данных
+function renderTableRows(rows, columns) {
+    let rowsHTML = '';
+    rows.forEach(row => {
+        rowsHTML += '<tr>';
+        columns.forEach(col => {
+            rowsHTML += `<td>${row[col] ?? ''}</td>`;
+        });
+        rowsHTML += '</tr>';
+    });
+    return rowsHTML;
+}
+
+// Загрузка следующей страницы результата
+async function loadMoreRows() {
+    if (!currentResultPage || !currentResultPage.handle) return;
+    
+    const button = document.getElementById('loadMoreRowsBtn');
+    button.disabled = true;
+    
+    try {
+        const response = await fetch(`/api/results/${currentResultPage.handle}?page_size=${RESULT_PAGE_SIZE}`);
+        const data = await response.json();
+        
+        if (!data.success) {
+            // Дескриптор истек - повторный запрос вернет данные заново
+            currentResultPage.handle = null;
+            addMessageToChat('⚠️ Результат устарел, повторите запрос, чтобы увидеть остальные строки', 'ai');
+            return;
+        }
+        
+        const tbody = document.querySelector('#dataContainer .data-table tbody');
+        tbody.insertAdjacentHTML('beforeend', renderTableRows(data.data, currentResultPage.columns));
+        currentResultPage.loaded += data.data.length;
+        currentResultPage.handle = data.has_more ? data.result_handle : null;
+    } catch (error) {
+        console.error('Ошибка загрузки страницы:', error);
+    } finally {
+        button.disabled = false;
+        updateLoadMoreControls();
+    }
+}
+
+function updateLoadMoreControls() {
+    const button = document.getElementById('loadMoreRowsBtn');
+    const info = document.getElementById('loadedRowsInfo');
+    if (!button || !currentResultPage) return;
+    
+    button.style.display = currentResultPage.handle ? 'inline-block' : 'none';
+    info.textContent = currentResultPage.handle ? `Показано записей: ${currentResultPage.loaded}` : '';
+}
+
 // Обновление вкладки анализа
 // В функции обработки ответа добавьте:
 // Обновление вкладки анализа
@@ -542,7 +605,8 @@ async function executeCustomSQL() {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({
-                sql: sqlQuery
+                sql: sqlQuery,
+                page_size: RESULT_PAGE_SIZE
             })
         });
         
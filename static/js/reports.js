@@ -78,18 +78,10 @@ async function generateReport() {
         
         console.log('Отправляю запрос на генерацию отчета:', filters);
         
-        const response = await fetch('/api/generate_report', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-                report_type: reportType,
-                filters: filters
-            })
+        const data = await postJsonConditional('/api/generate_report', {
+            report_type: reportType,
+            filters: filters
         });
-        
-        const data = await response.json();
         console.log('Ответ сервера:', data);
         
         if (data.success) {
@@ -0,0 +1,175 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from ai.llm_client import LLMClient, LLMUnavailable
+
+
+class StubServer:
+    """Локальный OpenAI-совместимый сервер: /chat/completions отвечает эхом промпта.
+
+    delay - задержка ответа в секундах, statuses - коды ошибок, которые
+    вернут первые запросы до успешного ответа.
+    """
+
+    def __init__(self):
+        self.delay = 0.0
+        self.statuses = []
+        self.calls = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _next_status(self):
+        with self._lock:
+            self.calls += 1
+            return self.statuses.pop(0) if self.statuses else 200
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                status = stub._next_status()
+                time.sleep(stub.delay)
+                if status == 200:
+                    payload = {
+                        'id': 'stub', 'object': 'chat.completion', 'created': int(time.time()), 'model': body['model'],
+                        'choices': [{
+                            'index': 0, 'finish_reason': 'stop',
+                            'message': {'role': 'assistant', 'content': f"ответ: {body['messages'][-1]['content']}"},
+                        }],
+                    }
+                else:
+                    payload = {'error': {'message': 'stub error', 'type': 'server_error', 'code': status}}
+                data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Клиент уже ушел по таймауту
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # Локальный сервер - в обход прокси из окружения
+    monkeypatch.setenv('NO_PROXY', '127.0.0.1,localhost')
+    stub = StubServer()
+    stub.start()
+    yield stub
+    stub.stop()
+
+
+@pytest.fixture
+def make_client(server):
+    clients = []
+
+    def make(**options):
+        settings = {'timeout': 5.0, 'connect_timeout': 1.0, 'deadline': 5.0, 'backoff': 0.01, **options}
+        client = LLMClient(server.url, 'test-key', 'stub-model', **settings)
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+def ask(text):
+    return [{'role': 'user', 'content': text}]
+
+
+def test_concurrent_identical_prompts_make_one_call(server, make_client):
+    client = make_client(max_concurrency=4)
+    server.delay = 0.5
+    barrier = threading.Barrier(5)
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(client.complete(ask('топ-5 товаров')))
+
+    threads = [threading.Thread(target=worker) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert server.calls == 1
+    assert results == ['ответ: топ-5 товаров'] * 5
+    assert client.stats()['deduplicated'] == 4
+
+
+def test_503_is_retried_then_succeeds(server, make_client):
+    client = make_client(max_retries=2)
+    server.statuses = [503]
+
+    assert client.complete(ask('выручка')) == 'ответ: выручка'
+    assert server.calls == 2
+    assert client.stats()['retries'] == 1
+
+
+def test_exceeding_deadline_raises_unavailable(server, make_client):
+    client = make_client(deadline=0.3, max_retries=5)
+    server.delay = 2.0
+
+    started = time.time()
+    with pytest.raises(LLMUnavailable):
+        client.complete(ask('медленный ответ'))
+    assert time.time() - started < 1.5
+    assert client.stats()['timeouts'] >= 1
+
+
+def test_full_semaphore_rejects_after_queue_timeout(server, make_client):
+    client = make_client(max_concurrency=1, queue_timeout=0.1)
+    server.delay = 1.0
+    busy = threading.Thread(target=client.complete, args=(ask('занимает слот'),))
+    busy.start()
+    while client.stats()['in_flight'] == 0:
+        time.sleep(0.01)
+
+    started = time.time()
+    with pytest.raises(LLMUnavailable):
+        client.complete(ask('другой вопрос'))
+    assert time.time() - started < 0.5
+    assert client.stats()['rejected'] == 1
+    busy.join()
+    assert server.calls == 1
+
+
+def test_cache_entries_expire_after_ttl(server, make_client):
+    client = make_client(cache_ttl=0.2)
+
+    assert client.complete(ask('сотрудники')) == 'ответ: сотрудники'
+    assert client.complete(ask('сотрудники')) == 'ответ: сотрудники'
+    assert server.calls == 1
+    assert client.stats()['cache_hits'] == 1
+
+    time.sleep(0.3)
+    assert client.complete(ask('сотрудники')) == 'ответ: сотрудники'
+    assert server.calls == 2